@@ -1,113 +1,470 @@
-import matplotlib.pyplot as plt
+import inspect
 import pandas as pd
 import numpy as np
-from Performance_Analysis import PerformanceAnalysis
+from Data_Handling import BarData, DataHandler
+from Performance_Analysis import OnlineMetrics, PerformanceAnalysis, realized_pnl
 from Visualization import BacktestVisualization
+from Indicators import IndicatorSet, get_indicator_cache
+from Cost_Model import CostModel
+from trading_function import TradingFunctions
+from Utilities import log, Profiler
+
+
+def _to_datetime64(value):
+    """将日期转换为 numpy datetime64[ns]"""
+    return np.datetime64(pd.Timestamp(value), 'ns')
+
+
+# 交易记录类
+class TradeLedger:
+    """
+    列式交易记录：各字段保存在按需倍增扩容的定长数组中，追加为均摊 O(1)
+    同时维护 {日期: (起始行, 结束行)} 的索引，按日期查询当日成交为 O(1)
+    兼容原 list-of-dicts 的用法：len()、布尔判断、下标访问与迭代均返回字典
+    """
+    ACTIONS = ['buy', 'sell']  # action 列的编码：0=买入，1=卖出
+
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._date = np.empty(capacity, dtype='datetime64[ns]')
+        self._code = np.empty(capacity, dtype=np.int32)  # 股票代码在 self.codes 中的位置
+        self._action = np.empty(capacity, dtype=np.int8)
+        self._price = np.empty(capacity, dtype=np.float64)
+        self._amount = np.empty(capacity, dtype=np.int64)
+        self._cost = np.empty(capacity, dtype=np.float64)  # 买入总成本（含手续费），卖出为 NaN
+        self._revenue = np.empty(capacity, dtype=np.float64)  # 卖出净收入（扣除费用），买入为 NaN
+        self.codes = []  # 股票代码字典
+        self._code_index = {}
+        self._date_ranges = {}  # {日期: [起始行, 结束行)}
+        self._last_date = None
+        self._date_ordered = True  # 是否按日期顺序追加（否则按日期查询退化为扫描）
+
+    def _reserve(self, extra):
+        """容量不足时按倍数扩容"""
+        needed = self._size + extra
+        capacity = len(self._date)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_date', '_code', '_action', '_price', '_amount', '_cost', '_revenue'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _encode_code(self, stock_code):
+        i = self._code_index.get(stock_code)
+        if i is None:
+            i = len(self.codes)
+            self.codes.append(stock_code)
+            self._code_index[stock_code] = i
+        return i
+
+    def _index_dates(self, start, dates):
+        """为新追加的行（已按日期分组）更新日期索引"""
+        if len(dates) == 1:
+            groups = [(dates[0], 1)]
+        else:
+            groups = zip(*np.unique(dates, return_counts=True))
+        row = start
+        for date, count in groups:
+            count = int(count)
+            if date == self._last_date:
+                self._date_ranges[date][1] += count
+            else:
+                if date in self._date_ranges or (self._last_date is not None and date < self._last_date):
+                    self._date_ordered = False
+                self._date_ranges[date] = [row, row + count]
+                self._last_date = date
+            row += count
+
+    def append(self, date, stock_code, action, price, amount, cost=np.nan, revenue=np.nan):
+        """追加一条成交记录"""
+        self._reserve(1)
+        i = self._size
+        date = _to_datetime64(date)
+        self._date[i] = date
+        self._code[i] = self._encode_code(stock_code)
+        self._action[i] = self.ACTIONS.index(action)
+        self._price[i] = price
+        self._amount[i] = amount
+        self._cost[i] = cost
+        self._revenue[i] = revenue
+        self._size += 1
+        self._index_dates(i, [date])
+
+    def extend(self, dates, stock_codes, actions, prices, amounts, costs, revenues):
+        """批量追加成交记录（各参数为等长数组，须按日期排序）"""
+        n = len(dates)
+        if n == 0:
+            return
+        self._reserve(n)
+        start, end = self._size, self._size + n
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        self._date[start:end] = dates
+        self._code[start:end] = [self._encode_code(code) for code in stock_codes]
+        self._action[start:end] = [self.ACTIONS.index(action) for action in actions]
+        self._price[start:end] = prices
+        self._amount[start:end] = amounts
+        self._cost[start:end] = costs
+        self._revenue[start:end] = revenues
+        self._size = end
+        self._index_dates(start, dates)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j) for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("交易记录下标越界")
+        return self._record(i)
+
+    def __iter__(self):
+        return (self._record(i) for i in range(self._size))
+
+    def _record(self, i):
+        """第 i 条记录的字典形式（与原 trade_history 的字典字段一致）"""
+        action = self.ACTIONS[self._action[i]]
+        record = {
+            'date': pd.Timestamp(self._date[i]),
+            'stock_code': self.codes[self._code[i]],
+            'action': action,
+            'price': float(self._price[i]),
+            'amount': int(self._amount[i]),
+        }
+        if action == 'buy':
+            record['cost'] = float(self._cost[i])
+        else:
+            record['revenue'] = float(self._revenue[i])
+        return record
+
+    def date_slice(self, date):
+        """某一日期成交记录所在的行区间"""
+        rows = self._date_ranges.get(_to_datetime64(date))
+        return slice(0, 0) if rows is None else slice(rows[0], rows[1])
+
+    def on_date(self, date):
+        """某一日期的全部成交记录（字典列表）"""
+        if self._date_ordered:
+            return [self._record(i) for i in range(*self.date_slice(date).indices(self._size))]
+        rows = np.flatnonzero(self._date[:self._size] == _to_datetime64(date))
+        return [self._record(i) for i in rows]
+
+    def column(self, name):
+        """单个字段的只读视图：date、stock_code（代码编号）、action（编码）、price、amount、cost、revenue"""
+        attr = '_code' if name == 'stock_code' else f"_{name}"
+        view = getattr(self, attr)[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def count(self, action=None):
+        """成交笔数，可按买入/卖出过滤"""
+        if action is None:
+            return self._size
+        return int(np.count_nonzero(self._action[:self._size] == self.ACTIONS.index(action)))
+
+    def realized_pnl(self):
+        """每笔卖出按移动平均成本计算的已实现盈亏（与记录等长，买入为 NaN），见 Performance_Analysis.realized_pnl"""
+        n = self._size
+        return realized_pnl([self.codes[i] for i in self._code[:n]],
+                            [self.ACTIONS[a] for a in self._action[:n]],
+                            self._amount[:n], self._cost[:n], self._revenue[:n])
+
+    def to_frame(self):
+        """导出为 DataFrame，数值列直接引用内部数组，不复制数据"""
+        n = self._size
+        return pd.DataFrame({
+            'date': self._date[:n],
+            'stock_code': pd.Categorical.from_codes(self._code[:n], categories=self.codes),
+            'action': pd.Categorical.from_codes(self._action[:n], categories=self.ACTIONS),
+            'price': self._price[:n],
+            'amount': self._amount[:n],
+            'cost': self._cost[:n],
+            'revenue': self._revenue[:n],
+        }, copy=False)
 
 
 # 账户类
 class Account:
-    def __init__(self, initial_cash=100000):
-        """初始化账户"""
+    def __init__(self, initial_cash=100000, cost_model=None):
+        """
+        初始化账户
+        :param initial_cash: 初始资金
+        :param cost_model: 交易成本模型（CostModel），默认佣金万分之三（最低5元）、印花税千分之一
+        """
         self.initial_cash = initial_cash  # 初始资金
         self.cash = initial_cash  # 当前现金
+        self.cost_model = cost_model or CostModel()
         self.positions = {}  # 持仓情况 {股票代码: 持股数量}
-        self.trade_history = []  # 交易历史
+        self.trade_history = TradeLedger()  # 交易历史（列式存储）
         self.total_assets = []  # 每日总资产记录
         self.dates = []  # 日期记录
+        self.metrics = OnlineMetrics(initial_cash)  # 随每日估值更新的绩效指标
+
+        # 与行情面板股票顺序对齐的持仓数组，用于整组持仓的向量化估值（见 bind_securities）
+        self.security_index = None  # {股票代码: 数组位置}
+        self.position_array = None  # 各股票持股数量
+        self.last_prices = None  # 各股票最近一次有效收盘价（停牌日沿用）
+        self.day_volumes = None  # 当日各股票成交量（成本模型需要时由回测引擎逐日更新）
+
+    def bind_securities(self, securities):
+        """
+        将账户持仓与股票列表对齐，之后 calculate_total_assets 可直接接收当日价格数组
+        :param securities: 股票代码序列，顺序与 DataHandler.get_day_array 返回的数组一致
+        """
+        self.security_index = {str(code): i for i, code in enumerate(securities)}
+        self.position_array = np.zeros(len(self.security_index))
+        self.last_prices = np.full(len(self.security_index), np.nan)
+        for stock_code, amount in self.positions.items():
+            self._set_position_array(stock_code, amount)
+
+    def _set_position_array(self, stock_code, amount):
+        if self.security_index is not None:
+            i = self.security_index.get(stock_code)
+            if i is not None:
+                self.position_array[i] = amount
+
+    def _volumes(self, stock_codes):
+        """查询一组股票的当日成交量（未提供当日成交量时返回 None）"""
+        if self.day_volumes is None or self.security_index is None:
+            return None
+        index = [self.security_index.get(stock_code, -1) for stock_code in stock_codes]
+        return np.where(np.asarray(index) >= 0, self.day_volumes[index], np.nan)
+
+    def _volume(self, stock_code):
+        """单只股票的当日成交量（成本模型不需要或未提供时为 None）"""
+        if not self.cost_model.needs_volume or self.day_volumes is None:
+            return None
+        return self._volumes([stock_code])[0]
+
+    def max_buy_amount(self, stock_code, price, cash=None):
+        """
+        按成本模型计算可买入的最大数量（计入手续费、整手、滑点与成交量上限），按该数量调用 buy 必定成交
+        :param cash: 可用资金（默认为账户现金）
+        """
+        cash = self.cash if cash is None else cash
+        return int(self.cost_model.max_fill_amounts(cash, price, self._volume(stock_code)))
+
+    def set_position(self, stock_code, amount):
+        """直接设置某只股票的持仓数量（0 表示清仓），同步持仓字典与持仓数组"""
+        if amount:
+            self.positions[stock_code] = amount
+        else:
+            self.positions.pop(stock_code, None)
+        self._set_position_array(stock_code, amount)
 
     def buy(self, date, stock_code, price, amount):
-        """买入股票"""
+        """买入股票（数量按成本模型取整到整手并受成交量上限约束，成交价计入滑点）"""
+        model = self.cost_model
+        volume = self._volume(stock_code)
+        amount = int(model.round_lot(amount))
+        if volume is not None:
+            amount = int(min(amount, model.volume_limits(volume)))
+        if amount <= 0:
+            return False
+        price = float(model.execution_prices(price, amount, volume))
         cost = price * amount
-        # 计算手续费（买入佣金万分之三，最低5元）
-        commission = max(0.0003 * cost, 5)
-        total_cost = cost + commission
+        total_cost = cost + float(model.buy_fees(cost))
 
         if self.cash >= total_cost:
             self.cash -= total_cost
-            if stock_code in self.positions:
-                self.positions[stock_code] += amount
-            else:
-                self.positions[stock_code] = amount
+            self.set_position(stock_code, self.positions.get(stock_code, 0) + amount)
+            self.metrics.add_trade(cost)
 
             # 记录交易
-            self.trade_history.append({
-                'date': date,
-                'stock_code': stock_code,
-                'action': 'buy',
-                'price': price,
-                'amount': amount,
-                'cost': total_cost
-            })
+            self.trade_history.append(date, stock_code, 'buy', price, amount, cost=total_cost)
             return True
         return False
 
     def sell(self, date, stock_code, price, amount):
-        """卖出股票"""
+        """卖出股票（未清仓时按整手卖出并受成交量上限约束，成交价计入滑点）"""
         if stock_code not in self.positions or self.positions[stock_code] < amount:
             return False
 
+        model = self.cost_model
+        volume = self._volume(stock_code)
+        if volume is not None:
+            amount = min(amount, model.volume_limits(volume))
+        amount = int(model.sell_amounts(amount, self.positions[stock_code]))
+        if amount <= 0:
+            return False
+        price = float(model.execution_prices(price, -amount, volume))
         revenue = price * amount
-        # 计算手续费（卖出佣金万分之三+印花税千分之一，最低5元）
-        commission = max(0.0003 * revenue, 5)
-        tax = 0.001 * revenue
-        total_cost = commission + tax
+        total_cost = float(model.sell_fees(revenue))
 
         self.cash += revenue - total_cost
-        self.positions[stock_code] -= amount
-        if self.positions[stock_code] == 0:
-            del self.positions[stock_code]
+        self.set_position(stock_code, self.positions[stock_code] - amount)
+        self.metrics.add_trade(revenue)
 
         # 记录交易
-        self.trade_history.append({
-            'date': date,
-            'stock_code': stock_code,
-            'action': 'sell',
-            'price': price,
-            'amount': amount,
-            'revenue': revenue - total_cost
-        })
+        self.trade_history.append(date, stock_code, 'sell', price, amount, revenue=revenue - total_cost)
         return True
 
+    def execute_orders(self, date, stock_codes, amounts, prices):
+        """
+        按顺序批量成交一组订单，结果与依次调用 buy / sell 相同：排在前面的订单优先使用现金，
+        买入在现金不足时按可负担的最大数量成交，卖出不超过（含本批次前序成交的）持仓
+        滑点、成交量上限与费用由成本模型对整组订单一次性计算，成交记录一次性写入交易历史
+        :param stock_codes: 股票代码列表
+        :param amounts: 委托数量（正数买入，负数卖出）
+        :param prices: 委托成交价数组（NaN 或非正数表示无法成交）
+        :return: (各订单的成交数量（非负）, 计入滑点后的成交价)
+        """
+        n = len(stock_codes)
+        model = self.cost_model
+        fills = np.zeros(n, dtype=np.int64)
+        costs = np.full(n, np.nan)
+        revenues = np.full(n, np.nan)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        volumes = self._volumes(stock_codes) if model.needs_volume else None
+        limits = model.volume_limits(volumes) if volumes is not None else np.full(n, np.inf)
+        # 买入数量先取整到整手、再受成交量约束；滑点按委托数量计算（现金不足而少买时偏保守）
+        requested = np.where(amounts > 0, np.minimum(model.round_lot(amounts), limits), np.maximum(amounts, -limits))
+        exec_prices = model.execution_prices(np.asarray(prices, dtype=float), requested, volumes)
+        values = exec_prices * np.abs(requested)
+        full_costs = values + model.buy_fees(values)
+
+        cash = self.cash
+        holdings = {}  # 本批次成交后的持仓
+        for k in range(n):
+            price = float(exec_prices[k])
+            amount = int(requested[k])
+            if not price > 0 or amount == 0:
+                continue
+            stock_code = stock_codes[k]
+            held = holdings.get(stock_code, self.positions.get(stock_code, 0))
+            if amount > 0:
+                total_cost = float(full_costs[k])
+                if total_cost > cash:
+                    amount = min(amount, model.max_buy_amount(cash, price))
+                    if amount <= 0:
+                        continue
+                    value = price * amount
+                    total_cost = value + float(model.buy_fees(value))
+                cash -= total_cost
+                holdings[stock_code] = held + amount
+                costs[k] = total_cost
+            else:
+                amount = int(model.sell_amounts(-amount, held))
+                if amount <= 0:
+                    continue
+                value = price * amount
+                revenue = value - float(model.sell_fees(value))
+                cash += revenue
+                holdings[stock_code] = held - amount
+                revenues[k] = revenue
+            fills[k] = amount
+
+        self.cash = cash
+        for stock_code, amount in holdings.items():
+            self.set_position(stock_code, amount)
+        filled = np.flatnonzero(fills)
+        if len(filled):
+            self.metrics.add_trade(float(np.dot(exec_prices[filled], fills[filled])))
+            is_buy = amounts[filled] > 0
+            self.trade_history.extend(
+                dates=np.full(len(filled), _to_datetime64(date)),
+                stock_codes=[stock_codes[k] for k in filled],
+                actions=np.where(is_buy, 'buy', 'sell'),
+                prices=exec_prices[filled],
+                amounts=fills[filled],
+                costs=costs[filled],
+                revenues=revenues[filled]
+            )
+        return fills, exec_prices
+
     def calculate_total_assets(self, date, stock_prices):
-        """计算总资产（现金+持仓市值）"""
-        position_value = 0
-        for stock_code, amount in self.positions.items():
-            if stock_code in stock_prices:
-                position_value += stock_prices[stock_code] * amount
+        """
+        计算总资产（现金+持仓市值）
+        :param stock_prices: 当日价格；已调用 bind_securities 时可传入与股票列表对齐的价格数组，
+                             一次数组运算为全部持仓估值（NaN 表示当日无行情，沿用最近有效价格）；
+                             也可传入 {股票代码: 价格} 字典
+        """
+        if isinstance(stock_prices, np.ndarray) and self.position_array is not None:
+            np.copyto(self.last_prices, stock_prices, where=~np.isnan(stock_prices))
+            position_value = float(np.dot(self.position_array, np.nan_to_num(self.last_prices)))
+        else:
+            position_value = 0
+            for stock_code, amount in self.positions.items():
+                if stock_code in stock_prices:
+                    position_value += stock_prices[stock_code] * amount
 
         total = self.cash + position_value
         self.total_assets.append(total)
         self.dates.append(date)
+        self.metrics.update(date, total, position_value)
         return total
 
 
+def _accepts_data(hook):
+    """策略钩子是否声明了 data 参数"""
+    if hook is None:
+        return False
+    try:
+        return 'data' in inspect.signature(hook).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _ffill(values):
+    """沿时间轴（第0维）向前填充 NaN"""
+    return pd.DataFrame(values).ffill().to_numpy()
+
+
 # 回测引擎类
 class BacktestEngine:
-    def __init__(self, data_handler, strategy_class, initial_cash=100000, max_stock_holdings=None):
+    def __init__(self, data_handler, strategy_class, initial_cash=100000, max_stock_holdings=None, mode='event',
+                 strategy_params=None, profile=False, indicator_cache=None, cost_model=None, frequency=None,
+                 early_stop=None):
         """
         初始化回测引擎
         :param data_handler: 数据处理器
         :param strategy_class: 策略类
         :param initial_cash: 初始资金
         :param max_stock_holdings: 最大持股数量限制（None表示无限制）
+        :param mode: 'event' 逐日调用策略钩子；'vector' 由策略一次性给出信号/目标持仓矩阵，
+                     引擎用数组运算计算交易成本与净值
+        :param strategy_params: 策略参数字典，以关键字参数传给策略类构造函数
+        :param profile: 是否统计各钩子与数据/交易接口的耗时，结果见 self.profiler
+        :param indicator_cache: IndicatorCache，指定时策略声明的指标直接取自预先计算的指标矩阵
+        :param cost_model: 交易成本模型（CostModel），默认沿用佣金万分之三（最低5元）、印花税千分之一
+        :param frequency: K线周期（'weekly'、'monthly'、'Nd' 等），为空时使用 data_handler 的周期；
+                          周期K线在进程内只聚合一次，多次回测直接复用
+        :param early_stop: 提前终止条件（如 EarlyStop），每根K线后以 account.metrics 调用，
+                           返回真值（终止原因）时结束回测；仅事件驱动模式生效
         """
+        if mode not in ('event', 'vector'):
+            raise ValueError(f"无效的回测模式: {mode}，可选: 'event', 'vector'")
+        if frequency is not None:
+            data_handler = data_handler.resample(frequency)
+        self.mode = mode
         self.data_handler = data_handler
         self.strategy_class = strategy_class
-        self.account = Account(initial_cash)
+        self.strategy_params = dict(strategy_params or {})
+        self.account = Account(initial_cash, cost_model)
+        self.account.bind_securities(data_handler.securities)
         self.max_stock_holdings = max_stock_holdings  # 新增：最大持股数量限制
+        self.profile = profile
+        self.profiler = None
+        self.early_stop = early_stop
+        self.stopped_at = None  # 提前终止时为终止日期
 
-        stock_data = self.data_handler.get_stock_data()
-        unique_dates = stock_data.index.unique()
-        self.dates = pd.DatetimeIndex(unique_dates).sort_values()
+        self.dates = pd.DatetimeIndex(self.data_handler.dates).sort_values()
 
         self.benchmark_returns = None
         self.strategy_returns = None
+        self.indicators = IndicatorSet(data_handler, indicator_cache)  # 策略在 initialize 中声明的指标
 
         # 初始化上下文，加入最大持股限制
         self.context = {
             'account': self.account,
             'data_handler': data_handler,
+            'indicators': self.indicators,
             'current_dt': None,
             'portfolio': {
                 'available_cash': self.account.cash,
@@ -116,7 +473,17 @@ class BacktestEngine:
             }
         }
 
-        self.strategy = self.strategy_class(self.context)
+        # 下单接口：策略通过 context['trading'] 下单，挂单由引擎逐日撮合
+        self.trading = TradingFunctions(self.context)
+        self.context['trading'] = self.trading
+
+        # 行情访问器：策略钩子声明 data 参数时作为第二个参数传入，也可通过 context['data'] 使用
+        self.bar_data = BarData(data_handler)
+        self.context['data'] = self.bar_data
+
+        self.strategy = self.strategy_class(self.context, **self.strategy_params)
+        self._data_hooks = {name for name in ('before_market_open', 'market_open', 'after_market_close')
+                            if _accepts_data(getattr(self.strategy, name, None))}
 
     def check_holding_limit(self):
         """检查是否达到最大持股数量限制"""
@@ -125,60 +492,464 @@ class BacktestEngine:
         # 当前持股数量小于等于最大限制时返回True
         return len(self.account.positions) < self.max_stock_holdings
 
-    def run(self, start_date=None, end_date=None):
-        """运行回测"""
-        print(f"原始数据日期范围: {self.dates.min()} 至 {self.dates.max()}")
+    def run(self, start_date=None, end_date=None, show_results=True, save_plot=None):
+        """
+        运行回测
+        :param show_results: 是否绘制图表并打印绩效（批量回测时关闭，此时不导入 matplotlib）
+        :param save_plot: 图片输出路径（.png / .svg）；给出时不弹出窗口，直接无界面地保存图表
+        :return: PerformanceAnalysis 绩效分析对象
+        """
+        trade_dates = self._select_dates(start_date, end_date)
+
+        # 打印最大持股限制信息
+        if self.max_stock_holdings:
+            log.info("启用最大持股数量限制: %s只", self.max_stock_holdings)
+        else:
+            log.info("未设置最大持股数量限制")
+
+        if self.profile:
+            self._start_profiler()
+        try:
+            self.strategy.initialize()
+
+            log.info("回测开始: %s", trade_dates[0].strftime('%Y-%m-%d'))
+            log.info("回测结束: %s", trade_dates[-1].strftime('%Y-%m-%d'))
+
+            if self.mode == 'vector':
+                self._run_vectorized(trade_dates)
+            else:
+                self.indicators.warm_up(self.dates, trade_dates[0])
+                for date in trade_dates:
+                    self._run_bar(date)
+                    if self.early_stop is not None:
+                        reason = self.early_stop(self.account.metrics)
+                        if reason:
+                            log.info("提前终止回测（%s）：%s", date, reason)
+                            self.stopped_at = date
+                            break
+        finally:
+            if self.profiler is not None:
+                self.profiler.restore()
+
+        log.info("回测完成!")
+        if self.profiler is not None:
+            log.info("耗时统计:\n%s", self.profiler.to_frame().to_string(index=False))
+        self.performance = PerformanceAnalysis(self.account)
+
+        if show_results or save_plot:
+            self.visualization = BacktestVisualization(
+                self.account,
+                self.performance.strategy_returns
+            )
+            if save_plot:
+                self.visualization.plot_results(save_plot)
+            elif show_results:
+                self.visualization.plot_results()
+            if show_results:
+                self.visualization.print_performance()
+        return self.performance
+
+    def _select_dates(self, start_date=None, end_date=None):
+        """回测区间内的交易日"""
+        log.info("原始数据日期范围: %s 至 %s", self.dates.min(), self.dates.max())
 
         if start_date and end_date:
             start_date = pd.to_datetime(start_date)
             end_date = pd.to_datetime(end_date)
             mask = (self.dates >= start_date) & (self.dates <= end_date)
             trade_dates = self.dates[mask]
-            print(f"筛选后日期范围: {start_date} 至 {end_date}")
-            print(f"有效交易日数量: {len(trade_dates)}")
+            log.info("筛选后日期范围: %s 至 %s", start_date, end_date)
+            log.info("有效交易日数量: %s", len(trade_dates))
         else:
             trade_dates = self.dates
 
         if len(trade_dates) == 0:
             raise ValueError("没有找到符合条件的交易日期，请检查日期范围是否在数据范围内")
+        return trade_dates
 
-        # 打印最大持股限制信息
-        if self.max_stock_holdings:
-            print(f"启用最大持股数量限制: {self.max_stock_holdings}只")
+    def _start_profiler(self):
+        """
+        用计时版本临时替换策略钩子、数据接口、下单与估值函数，run 结束时恢复
+        未开启 profile 时不做任何替换
+        """
+        import Data_Handling
+
+        profiler = Profiler()
+        profiler.instrument(self, ['_run_bar', '_run_vectorized'], 'engine')
+        profiler.instrument(self.strategy, ['initialize', 'before_market_open', 'market_open', 'after_market_close',
+                                            'generate_signals', 'generate_target_positions'], 'strategy')
+        profiler.instrument(self.data_handler, ['get_single_day_data', 'get_day_array', 'get_day_values',
+                                                'get_price_matrix', 'get_field_matrix', 'get_stock_data'], 'data')
+        profiler.instrument(Data_Handling, ['get_price', 'get_all_securities'], 'data')
+        profiler.instrument(self.indicators, ['update'], 'indicators')
+        profiler.instrument(self.trading, ['order', 'order_target', 'order_value', 'order_target_value',
+                                           'execute_pending', 'match_orders'], 'trading')
+        profiler.instrument(self.account, ['buy', 'sell', 'execute_orders'], 'trading')
+        profiler.instrument(self.account, ['calculate_total_assets'], 'valuation')
+        profiler.start()
+        self.profiler = profiler
+
+    def _run_bar(self, date):
+        """事件驱动模式下运行单个交易日"""
+        self.context['current_dt'] = date
+        if self.account.cost_model.needs_volume:
+            self.account.day_volumes = self.data_handler.get_day_values(date, 'Dnshrtrd')  # 滑点与成交量上限
+        self.trading.match_orders(date)  # 先用当日K线撮合此前的挂单
+        self.context['portfolio']['available_cash'] = self.account.cash
+        # 更新当前持股数量到上下文
+        self.context['portfolio']['current_holdings_count'] = len(self.account.positions)
+        self.indicators.update(date)
+        self.bar_data.seek(date)
+
+        self._call_hook('before_market_open', date)
+        self._call_hook('market_open', date)
+        self.trading.execute_pending()  # 收盘时批量撮合当日提交的订单
+        self._call_hook('after_market_close', date)
+        self.trading.execute_pending()
+
+        # 用当日全市场收盘价数组为全部持仓估值（float64，与成交价同源；panel 后端的 float32 面板只用于选股）
+        self.account.calculate_total_assets(date, self.data_handler.get_day_values(date, 'close'))
+
+    def _call_hook(self, name, date):
+        if name in self._data_hooks:
+            getattr(self.strategy, name)(date, self.bar_data)
+        else:
+            getattr(self.strategy, name)(date)
+
+    def _run_vectorized(self, trade_dates):
+        """
+        向量化模式：
+        - 策略实现 generate_target_positions(close) 时，返回值为目标持股数量矩阵，
+          NaN 表示维持原持仓，整段区间的调仓与成本一次性用数组计算（不做资金检查）；
+        - 策略实现 generate_signals(close) 时，返回值为信号矩阵：1 用可用资金买入（多只股票等分资金），
+          -1 卖出全部持仓，0 不操作；逐日推进，但每日对所有股票的撮合都是数组运算
+        close 为 (交易日 × 股票) 的收盘价 DataFrame，成交价与估值均使用当日收盘价
+        """
+        close = self.data_handler.get_price_matrix('close', trade_dates)
+        if hasattr(self.strategy, 'generate_target_positions'):
+            matrix = self.strategy.generate_target_positions(close)
+            use_targets = True
+        elif hasattr(self.strategy, 'generate_signals'):
+            matrix = self.strategy.generate_signals(close)
+            use_targets = False
         else:
-            print("未设置最大持股数量限制")
+            raise TypeError("向量化模式要求策略实现 generate_signals 或 generate_target_positions")
 
-        self.strategy.initialize()
+        # 只在策略涉及的股票上计算
+        matrix = pd.DataFrame(matrix).reindex(index=close.index)
+        codes = matrix.columns.astype(str)
+        prices = close.reindex(columns=codes).to_numpy(dtype=float)
+        tradable = ~np.isnan(prices) & (prices > 0)
+        marks = np.nan_to_num(_ffill(prices))  # 停牌日按最近收盘价估值
 
-        print(f"回测开始: {trade_dates[0].strftime('%Y-%m-%d')}")
-        print(f"回测结束: {trade_dates[-1].strftime('%Y-%m-%d')}")
+        volumes = None
+        if self.account.cost_model.needs_volume:
+            volumes = self.data_handler.get_price_matrix('Dnshrtrd', trade_dates).reindex(columns=codes).to_numpy(
+                dtype=float)
 
-        for date in trade_dates:
-            self.context['current_dt'] = date
-            self.context['portfolio']['available_cash'] = self.account.cash
-            # 更新当前持股数量到上下文
-            self.context['portfolio']['current_holdings_count'] = len(self.account.positions)
+        if use_targets:
+            positions, cash, trades = self._apply_targets(matrix.to_numpy(dtype=float), prices, tradable, volumes)
+        else:
+            positions, cash, trades = self._apply_signals(np.nan_to_num(matrix.to_numpy(dtype=float)),
+                                                          prices, tradable, volumes)
 
-            self.strategy.before_market_open(date)
-            self.strategy.market_open(date)
-            self.strategy.after_market_close(date)
+        position_values = (positions * marks).sum(axis=1)
+        equity = cash + position_values
+        account = self.account
+        if trades:
+            rows, cols, amounts, trade_prices, fees = (np.asarray(column) for column in zip(*trades))
+            order = np.argsort(rows, kind='stable')
+            rows, cols, amounts, trade_prices, fees = rows[order], cols[order], amounts[order], \
+                trade_prices[order], fees[order]
+            is_buy = amounts > 0
+            values = trade_prices * np.abs(amounts)
+            account.metrics.add_trade(float(values.sum()))
+            account.trade_history.extend(
+                dates=trade_dates.values[rows],
+                stock_codes=codes[cols],
+                actions=np.where(is_buy, 'buy', 'sell'),
+                prices=trade_prices,
+                amounts=np.abs(amounts),
+                costs=np.where(is_buy, values + fees, np.nan),
+                revenues=np.where(is_buy, np.nan, values - fees)
+            )
+        account.cash = float(cash[-1])
+        for stock_code in list(account.positions):
+            account.set_position(stock_code, 0)
+        for i in np.flatnonzero(positions[-1]):
+            account.set_position(codes[i], int(positions[-1, i]))
+        account.total_assets.extend(equity.tolist())
+        account.dates.extend(trade_dates)
+        account.metrics.extend(trade_dates, equity.tolist(), position_values.tolist())
 
-            daily_stock_data = self.data_handler.get_single_day_data(date)
-            security = self.context.get('security')  # 使用get避免键不存在错误
+    def _apply_targets(self, targets, prices, tradable, volumes=None):
+        """目标持仓模式：整段区间一次性计算持仓、现金和成交（成交量上限不适用）"""
+        model = self.account.cost_model
+        # 无法成交（停牌）或未指定目标的日子维持原持仓；目标持仓取整到整手
+        positions = np.nan_to_num(_ffill(np.where(tradable, targets, np.nan)))
+        positions = model.round_lot(positions)
+        deltas = np.diff(positions, axis=0, prepend=0)
+        exec_prices = model.execution_prices(prices, deltas, volumes)
+        values = np.abs(deltas) * np.nan_to_num(exec_prices)
+        fees = np.where(deltas > 0, model.buy_fees(values), 0) + np.where(deltas < 0, model.sell_fees(values), 0)
+        flows = -(deltas * np.nan_to_num(exec_prices)) - fees
+        cash = self.account.initial_cash + np.cumsum(flows.sum(axis=1))
 
-            if security and security in daily_stock_data:
-                stock_price = daily_stock_data[security]
-                self.account.calculate_total_assets(date, {security: stock_price})
-            else:
-                self.account.calculate_total_assets(date, {})
+        rows, cols = np.nonzero(deltas)
+        trades = zip(rows, cols, deltas[rows, cols].astype(np.int64), exec_prices[rows, cols], fees[rows, cols])
+        return positions, cash, list(trades)
 
-        print("回测完成!")
-        self.performance = PerformanceAnalysis(self.account)
+    def _apply_signals(self, signals, prices, tradable, volumes=None):
+        """信号模式：逐日推进现金，每日的卖出与买入在所有股票上向量化撮合"""
+        model = self.account.cost_model
+        n_days, n_codes = prices.shape
+        no_volume = np.full(n_codes, np.nan)  # 成交量缺失：不计冲击成本、不限制成交数量
+        limits = model.volume_limits(volumes) if volumes is not None else np.full((n_days, n_codes), np.inf)
+        positions = np.zeros((n_days, n_codes))
+        cash = np.empty(n_days)
+        holding = np.zeros(n_codes)
+        available = float(self.account.initial_cash)
+        trades = []
+        for t in range(n_days):
+            price, signal, ok, limit = prices[t], signals[t], tradable[t], limits[t]
+            volume = volumes[t] if volumes is not None else no_volume
+
+            # 先卖出，释放资金
+            sells = np.flatnonzero(ok & (signal < 0) & (holding > 0))
+            if len(sells):
+                amounts = model.sell_amounts(np.minimum(holding[sells], limit[sells]), holding[sells])
+                sells, amounts = sells[amounts > 0], amounts[amounts > 0]
+                sell_prices = model.execution_prices(price[sells], -amounts, volume[sells])
+                revenue = sell_prices * amounts
+                fees = model.sell_fees(revenue)
+                available += float((revenue - fees).sum())
+                holding[sells] -= amounts
+                trades.extend(zip([t] * len(sells), sells, -amounts.astype(np.int64), sell_prices, fees))
+
+            # 再用可用资金等分买入（计入滑点与成交量上限）
+            buys = np.flatnonzero(ok & (signal > 0))
+            if len(buys):
+                amounts = model.max_fill_amounts(available / len(buys), price[buys], volume[buys])
+                buy_prices = model.execution_prices(price[buys], amounts, volume[buys])
+                filled = amounts > 0
+                buys, amounts, buy_prices = buys[filled], amounts[filled], buy_prices[filled]
+                cost = buy_prices * amounts
+                fees = model.buy_fees(cost)
+                available -= float((cost + fees).sum())
+                holding[buys] += amounts
+                trades.extend(zip([t] * len(buys), buys, amounts, buy_prices, fees))
+
+            positions[t] = holding
+            cash[t] = available
+        return positions, cash, trades
+
+
+class _SharedDayData:
+    """
+    包装 DataHandler，按交易日缓存单日数据：多个策略在同一交易日读取同一字段时只查询一次，
+    结果在各策略之间共享（只读）；其余属性与方法直接转发给 DataHandler
+    """
+    def __init__(self, data_handler):
+        self.data_handler = data_handler
+        self._date = None
+        self._day = {}  # {(方法名, 字段): 当日结果}
+        self._matrices = {}  # {(字段, 区间): 价格矩阵}
+
+    def __getattr__(self, name):
+        return getattr(self.data_handler, name)
+
+    def _get_day(self, method, date, *args):
+        if date != self._date:
+            self._date = date
+            self._day.clear()
+        key = (method, args)
+        if key not in self._day:
+            self._day[key] = getattr(self.data_handler, method)(date, *args)
+        return self._day[key]
+
+    def get_single_day_data(self, date):
+        return self._get_day('get_single_day_data', date)
+
+    def get_day_array(self, date, field='close'):
+        return self._get_day('get_day_array', date, field)
+
+    def get_day_values(self, date, field='close'):
+        return self._get_day('get_day_values', date, field)
+
+    def get_price_matrix(self, field='close', dates=None):
+        key = (field, None if dates is None else (len(dates), dates[0], dates[-1]))
+        if key not in self._matrices:
+            self._matrices[key] = self.data_handler.get_price_matrix(field, dates)
+        return self._matrices[key]
+
+
+class MultiStrategyEngine:
+    """
+    多策略单次遍历回测：多个策略实例各自拥有独立的账户与上下文，在同一个日期循环中一起推进，
+    每个交易日的单日数据（估值价格、成交价、指标字段等）只读取一次，分发给全部策略
+    可选按权重分配资金，并把各策略账户汇总为组合账户（策略的策略）
+    """
+    def __init__(self, data_handler, strategies, initial_cash=100000, weights=None, combine=False, mode='event',
+                 max_stock_holdings=None, indicator_cache=None, cost_model=None, frequency=None):
+        """
+        :param data_handler: 数据处理器
+        :param strategies: 策略列表，元素为策略类或 (策略类, 参数字典)
+        :param initial_cash: 每个策略的初始资金；指定 weights 时为总资金，按权重分配给各策略
+        :param weights: 各策略的资金权重（按总和归一化）
+        :param combine: 是否把各策略账户汇总为组合账户（见 self.combined）
+        :param mode: 回测模式，'event' 或 'vector'
+        :param indicator_cache: IndicatorCache，指定时各策略相同的指标只计算一次
+        其余参数含义同 BacktestEngine，对每个策略分别生效
+        """
+        if not strategies:
+            raise ValueError("至少需要一个策略")
+        specs = [spec if isinstance(spec, tuple) else (spec, None) for spec in strategies]
+        if weights is None:
+            cash = [initial_cash] * len(specs)
+        else:
+            if len(weights) != len(specs):
+                raise ValueError(f"权重数量（{len(weights)}）与策略数量（{len(specs)}）不一致")
+            weights = np.asarray(weights, dtype=float)
+            if (weights < 0).any() or weights.sum() <= 0:
+                raise ValueError("权重必须非负且总和为正")
+            cash = (initial_cash * weights / weights.sum()).tolist()
+
+        if frequency is not None:
+            data_handler = data_handler.resample(frequency)
+        self.data_handler = data_handler
+        self.shared_data = _SharedDayData(data_handler)
+        self.mode = mode
+        self.combine = combine
+        self.engines = [
+            BacktestEngine(self.shared_data, strategy_class, cash_i, max_stock_holdings, mode=mode,
+                           strategy_params=params, indicator_cache=indicator_cache, cost_model=cost_model)
+            for (strategy_class, params), cash_i in zip(specs, cash)
+        ]
+        self.combined = None
+        self.combined_performance = None
+
+    @property
+    def accounts(self):
+        return [engine.account for engine in self.engines]
+
+    def run(self, start_date=None, end_date=None):
+        """
+        运行回测
+        :return: 各策略的 PerformanceAnalysis 列表（顺序与 strategies 一致）
+        """
+        trade_dates = self.engines[0]._select_dates(start_date, end_date)
+        for engine in self.engines:
+            engine.strategy.initialize()
+
+        if self.mode == 'vector':
+            for engine in self.engines:
+                engine._run_vectorized(trade_dates)
+        else:
+            self._warm_up(trade_dates[0])
+            for date in trade_dates:
+                for engine in self.engines:
+                    engine._run_bar(date)
+
+        log.info("回测完成!")
+        for engine in self.engines:
+            engine.performance = PerformanceAnalysis(engine.account)
+        if self.combine:
+            self.combined = self._combine_accounts()
+            self.combined_performance = PerformanceAnalysis(self.combined)
+        return [engine.performance for engine in self.engines]
+
+    def _warm_up(self, start_date):
+        """各策略的指标在同一次日期遍历中预热，共享单日数据"""
+        dates = self.engines[0].dates
+        histories = [engine.indicators.warmup_dates(dates, start_date) for engine in self.engines]
+        starts = [history[0] for history in histories if len(history)]
+        if starts:
+            for date in dates[(dates >= min(starts)) & (dates < start_date)]:
+                for engine, history in zip(self.engines, histories):
+                    if len(history) and date >= history[0]:
+                        engine.indicators.update(date)
+        for engine in self.engines:
+            engine.indicators.warm_up_windows(start_date)
+
+    def _combine_accounts(self):
+        """汇总各策略账户：现金、持仓与每日总资产相加，成交记录按日期合并"""
+        accounts = self.accounts
+        combined = Account(sum(account.initial_cash for account in accounts))
+        combined.bind_securities(self.data_handler.securities)
+        combined.cash = sum(account.cash for account in accounts)
+        positions = {}
+        for account in accounts:
+            for stock_code, amount in account.positions.items():
+                positions[stock_code] = positions.get(stock_code, 0) + amount
+        for stock_code, amount in positions.items():
+            combined.set_position(stock_code, amount)
+        combined.total_assets = np.sum([account.total_assets for account in accounts], axis=0).tolist()
+        combined.dates = list(accounts[0].dates)
+
+        trades = pd.concat([account.trade_history.to_frame() for account in accounts], ignore_index=True)
+        trades = trades.sort_values('date', kind='mergesort')
+        combined.trade_history.extend(trades['date'], trades['stock_code'].astype(str),
+                                      trades['action'].astype(str), trades['price'], trades['amount'],
+                                      trades['cost'], trades['revenue'])
+        return combined
+
+    def get_summary(self):
+        """各策略（及组合账户）的绩效指标表，每行一个策略"""
+        rows = []
+        for i, engine in enumerate(self.engines):
+            rows.append({'strategy': i, 'name': engine.strategy_class.__name__, **engine.strategy_params,
+                         **engine.performance.get_summary()})
+        if self.combined_performance is not None:
+            rows.append({'strategy': 'combined', 'name': 'combined', **self.combined_performance.get_summary()})
+        return pd.DataFrame(rows)
+
+
+# 并行回测工作进程：供参数优化等批量任务使用
+_worker_data_handler = None  # 每个工作进程内只加载一次的数据处理器
+
+
+def init_worker(file_path, backend='panel'):
+    """
+    进程池初始化函数：每个工作进程只加载一次数据
+    二进制缓存与面板均为内存映射文件，各进程共享同一份只读物理内存
+    """
+    global _worker_data_handler
+    _worker_data_handler = DataHandler(file_path, backend=backend)
 
-        self.visualization = BacktestVisualization(
-            self.account,
-            self.performance.strategy_returns
-        )
 
-        self.visualization.plot_results()
-        self.visualization.print_performance()
\ No newline at end of file
+def run_backtest_job(job, data_handler=None):
+    """
+    运行单次回测并返回绩效指标
+    :param job: 任务字典，包含 strategy_class、params，可选 start_date、end_date、initial_cash、mode、cost_model、
+                frequency、early_stop；
+                details 为真时结果附带 equity（每日总资产 Series）与 trades（成交记录 DataFrame）；
+                plot 为图片路径时在工作进程中无界面地保存资产曲线
+    :param data_handler: 数据处理器，默认使用 init_worker 加载的实例
+    :return: 绩效指标字典
+    """
+    data_handler = data_handler or _worker_data_handler
+    engine = BacktestEngine(
+        data_handler=data_handler,
+        strategy_class=job['strategy_class'],
+        initial_cash=job.get('initial_cash', 100000),
+        mode=job.get('mode', 'event'),
+        strategy_params=job.get('params'),
+        indicator_cache=get_indicator_cache(),  # 同一进程内的多次回测共享指标矩阵
+        cost_model=job.get('cost_model'),
+        frequency=job.get('frequency'),
+        early_stop=job.get('early_stop')
+    )
+    # 批量回测丢弃全部日志
+    with log.silenced():
+        performance = engine.run(job.get('start_date'), job.get('end_date'), show_results=False,
+                                 save_plot=job.get('plot'))
+    result = performance.get_summary()
+    result['turnover'] = engine.account.metrics.turnover
+    result['exposure'] = engine.account.metrics.exposure
+    if job.get('early_stop') is not None:
+        result['stopped_at'] = engine.stopped_at
+    if job.get('details'):
+        account = engine.account
+        result['equity'] = pd.Series(account.total_assets, index=pd.DatetimeIndex(account.dates))
+        result['trades'] = account.trade_history.to_frame()
+    return result
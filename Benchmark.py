@@ -0,0 +1,348 @@
+"""
+性能基准测试：生成 CSMAR 格式的模拟日行情文件，测量数据加载、数据查询、回测与绩效分析的耗时，
+结果以 JSON 保存，便于在不同提交之间比较
+
+用法：
+    python Benchmark.py --stocks 500 --days 250 --output bench.json
+    python Benchmark.py --stocks 500 --days 250 --output new.json --compare bench.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import Data_Handling
+from Data_Handling import DataHandler, load_price_store, get_price
+from Backtest_Engine import BacktestEngine
+from Performance_Analysis import PerformanceAnalysis
+from Strategy_Core import MA5Strategy
+from Utilities import log
+
+
+# CSMAR 日个股回报率文件（TRD_Dalyr）的字段顺序
+CSMAR_COLUMNS = ['Stkcd', 'Trddt', 'Opnprc', 'Hiprc', 'Loprc', 'Clsprc', 'Dnshrtrd', 'Dnvaltrd', 'Dsmvosd',
+                 'Dsmvtll', 'Dretwd', 'Dretnd', 'Adjprcwd', 'Adjprcnd', 'Markettype', 'Capchgdt', 'Trdsta',
+                 'Ahshrtrd_D', 'Ahvaltrd_D', 'PreClosePrice', 'ChangeRatio', 'LimitDown', 'LimitUp',
+                 'LimitStatus']
+
+
+def generate_csmar_file(path, n_stocks=50, n_days=250, start_date='2015-01-05', seed=0, suspend_rate=0.02,
+                        block_size=200):
+    """
+    生成 CSMAR 格式的模拟日行情文件（按股票代码、交易日期排序，字符串字段带引号）
+    价格为带涨跌停限制的几何随机游走；000001 全程无停牌，供 MA5Strategy 默认标的使用
+    :param n_stocks: 股票数量
+    :param n_days: 交易日数量（工作日日历）
+    :param seed: 随机种子，相同参数生成的文件完全一致
+    :param suspend_rate: 每只股票每日停牌（当日无记录）的概率
+    :param block_size: 每次生成并写入的股票数，控制内存占用
+    :return: 写入的行数
+    """
+    rng = np.random.default_rng(seed)
+    dates = np.asarray(pd.bdate_range(start_date, periods=n_days).strftime('%Y-%m-%d'))
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for first in range(0, n_stocks, block_size):
+            n = min(block_size, n_stocks - first)
+            shape = (n, n_days)
+            codes = np.array([f"{i + 1:06d}" for i in range(first, first + n)])
+
+            returns = np.clip(rng.normal(0.0003, 0.02, shape), -0.1, 0.1)
+            start_price = rng.uniform(5, 50, (n, 1)).round(2)
+            close = (start_price * np.cumprod(1 + returns, axis=1)).round(2)
+            pre_close = np.concatenate([start_price, close[:, :-1]], axis=1)
+            opn = (pre_close * (1 + rng.normal(0, 0.005, shape))).round(2)
+            high = (np.maximum(opn, close) * (1 + np.abs(rng.normal(0, 0.005, shape)))).round(2)
+            low = (np.minimum(opn, close) * (1 - np.abs(rng.normal(0, 0.005, shape)))).round(2)
+            volume = rng.integers(100_000, 10_000_000, shape)
+            float_shares = rng.uniform(1e8, 1e10, (n, 1))
+            change = close / pre_close - 1
+            limit_down = (pre_close * 0.9).round(2)
+            limit_up = (pre_close * 1.1).round(2)
+
+            traded = rng.random(shape) >= suspend_rate
+            if first == 0:
+                traded[0] = True
+            keep = traded.ravel()
+
+            block = pd.DataFrame({
+                'Stkcd': np.repeat(codes, n_days),
+                'Trddt': np.tile(dates, n),
+                'Opnprc': opn.ravel(),
+                'Hiprc': high.ravel(),
+                'Loprc': low.ravel(),
+                'Clsprc': close.ravel(),
+                'Dnshrtrd': volume.ravel(),
+                'Dnvaltrd': (volume * close).round(2).ravel(),
+                'Dsmvosd': (close * float_shares / 1000).round(2).ravel(),
+                'Dsmvtll': (close * float_shares * 1.2 / 1000).round(2).ravel(),
+                'Dretwd': change.round(6).ravel(),
+                'Dretnd': change.round(6).ravel(),
+                'Adjprcwd': close.ravel(),
+                'Adjprcnd': close.ravel(),
+                'Markettype': 4,
+                'Capchgdt': '2014-12-31',
+                'Trdsta': np.where(rng.random(shape) < 0.03, 2, 1).ravel(),
+                'Ahshrtrd_D': 0,
+                'Ahvaltrd_D': 0,
+                'PreClosePrice': pre_close.ravel(),
+                'ChangeRatio': change.round(6).ravel(),
+                'LimitDown': limit_down.ravel(),
+                'LimitUp': limit_up.ravel(),
+                'LimitStatus': np.select([close >= limit_up, close <= limit_down], [1, -1], 0).ravel(),
+            }, columns=CSMAR_COLUMNS)[keep]
+            block.to_csv(f, index=False, header=(first == 0), quoting=csv.QUOTE_NONNUMERIC)
+            rows += len(block)
+    return rows
+
+
+def legacy_get_price(path, security, start_date=None, end_date=None, fields=None, count=None):
+    """
+    改用共享行情存储之前的 get_price 实现（每次调用重新读取并过滤整个 CSV），
+    作为 get_price 的计时基准与结果对照
+    """
+    df = pd.read_csv(path, dtype=str)
+    for field in ['Opnprc', 'Hiprc', 'Loprc', 'Clsprc', 'Trdsta', 'LimitDown', 'LimitUp', 'Dnshrtrd', 'Dsmvosd']:
+        if field in df.columns:
+            df[field] = df[field].str.replace('"', '').astype(float)
+    df['Trddt'] = pd.to_datetime(df['Trddt'].str.replace('"', ''))
+    df['Stkcd'] = df['Stkcd'].str.replace('"', '')
+
+    if isinstance(security, list):
+        df = df[df['Stkcd'].isin([str(s) for s in security])]
+    else:
+        df = df[df['Stkcd'] == str(security)]
+    if start_date:
+        df = df[df['Trddt'] >= pd.to_datetime(start_date)]
+    if end_date:
+        df = df[df['Trddt'] <= pd.to_datetime(end_date)]
+    if fields:
+        df = df[['Stkcd', 'Trddt'] + [field for field in fields if field not in ('Stkcd', 'Trddt')]]
+    df = df.sort_values('Trddt', kind='stable')  # 同一日期的多只股票保持文件中的顺序
+    if count and count > 0:
+        df = df.tail(count)
+    return df.set_index(['Stkcd', 'Trddt'])
+
+
+def _measure(fn, repeat=3, number=1, warmup=0):
+    """
+    多次计时，返回单次调用的耗时统计（秒）
+    :param number: 每轮调用次数，耗时取平均
+    :param warmup: 正式计时前的预热调用次数
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {'median': float(np.median(times)), 'min': float(np.min(times)), 'mean': float(np.mean(times)),
+            'repeat': repeat, 'number': number}
+
+
+def _git_commit():
+    """当前代码的 git 提交号（不在仓库中时为 None）"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(path, repeat=3, n_queries=200, seed=0):
+    """
+    对数据文件运行全部基准测试
+    :param path: CSMAR 格式数据文件
+    :param repeat: 每项测试的重复轮数
+    :param n_queries: 查询类测试每轮的调用次数
+    :param seed: 随机查询的种子
+    :return: {测试名称: 耗时统计}，耗时均为单次操作的秒数
+    """
+    results = {}
+
+    # 数据加载：直接解析 CSV，以及二进制缓存就绪后的启动
+    results['load_csv'] = _measure(lambda: load_price_store(path, use_cache=False), repeat=repeat)
+    load_price_store(path)
+
+    def load_handler(backend):
+        Data_Handling._price_stores.clear()  # 每次都从磁盘缓存重新加载
+        return DataHandler(path, backend=backend)
+
+    results['load_cached'] = _measure(lambda: load_handler('frame'), repeat=repeat)
+    load_handler('panel')  # 预先生成面板缓存
+    results['load_cached_panel'] = _measure(lambda: load_handler('panel'), repeat=repeat)
+
+    frame_handler = load_handler('frame')
+    panel_handler = DataHandler(path, backend='panel')
+    dates = frame_handler.dates
+    securities = np.asarray(frame_handler.securities)
+
+    # 随机查询：与策略中的用法一致，取某只股票截至某日的最近价格
+    rng = np.random.default_rng(seed)
+    queries = list(zip(securities[rng.integers(len(securities), size=n_queries)],
+                       dates[rng.integers(20, len(dates), size=n_queries)]))
+    days = list(dates[rng.integers(len(dates), size=n_queries)])
+
+    def query_loop(fn, items):
+        iterator = iter(())
+
+        def step():
+            nonlocal iterator
+            item = next(iterator, None)
+            if item is None:
+                iterator = iter(items)
+                item = next(iterator)
+            fn(item)
+        return step
+
+    results['get_price_latest'] = _measure(
+        query_loop(lambda q: get_price(q[0], count=1, fields=['Clsprc'], end_date=q[1]), queries),
+        repeat=repeat, number=n_queries, warmup=1)
+    # 旧实现每次调用都重新解析整个文件，只调用少量次数
+    results['get_price_latest_legacy'] = _measure(
+        query_loop(lambda q: legacy_get_price(path, q[0], count=1, fields=['Clsprc'], end_date=q[1]), queries),
+        repeat=repeat, number=min(n_queries, 5))
+    results['get_price_window'] = _measure(
+        query_loop(lambda q: get_price(q[0], count=20, fields=['Opnprc', 'Hiprc', 'Loprc', 'Clsprc'],
+                                       end_date=q[1]), queries),
+        repeat=repeat, number=n_queries, warmup=1)
+    results['get_single_day_data'] = _measure(query_loop(frame_handler.get_single_day_data, days),
+                                              repeat=repeat, number=n_queries, warmup=1)
+    results['get_single_day_data_panel'] = _measure(query_loop(panel_handler.get_single_day_data, days),
+                                                    repeat=repeat, number=n_queries, warmup=1)
+
+    # 端到端回测（MA5Strategy，关闭日志与图表）
+    engines = []
+
+    def run_backtest(mode, data_handler):
+        engine = BacktestEngine(data_handler, MA5Strategy, initial_cash=100000, mode=mode)
+        with log.silenced():
+            engine.run(show_results=False)
+        engines.append(engine)
+
+    for name, mode, data_handler in (('backtest_event', 'event', frame_handler),
+                                     ('backtest_event_panel', 'event', panel_handler),
+                                     ('backtest_vector', 'vector', panel_handler)):
+        results[name] = _measure(lambda: run_backtest(mode, data_handler), repeat=repeat)
+        results[name]['bars_per_sec'] = len(dates) / results[name]['median']
+
+    account = engines[0].account
+    results['performance_analysis'] = _measure(lambda: PerformanceAnalysis(account).get_summary(),
+                                               repeat=repeat, number=10)
+    return results
+
+
+def benchmark(n_stocks=500, n_days=250, repeat=3, n_queries=200, seed=0, data_path=None, work_dir=None):
+    """
+    生成（或复用）模拟数据并运行基准测试
+    :param data_path: 使用已有的数据文件，此时不生成模拟数据
+    :param work_dir: 模拟数据的存放目录，默认为系统临时目录；相同规模与种子的文件会被复用
+    :return: 包含 meta 与 results 的字典，可直接保存为 JSON
+    """
+    if data_path is None:
+        work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'bt_benchmark')
+        os.makedirs(work_dir, exist_ok=True)
+        data_path = os.path.join(work_dir, f"TRD_Dalyr_{n_stocks}x{n_days}_s{seed}.csv")
+        if not os.path.exists(data_path):
+            start = time.perf_counter()
+            generate_csmar_file(data_path, n_stocks, n_days, seed=seed)
+            log.info("已生成模拟数据 %s（%.1f 秒）", data_path, time.perf_counter() - start)
+
+    store = load_price_store(data_path)
+    meta = {
+        'data_path': data_path,
+        'rows': len(store.codes),
+        'securities': len(store.securities),
+        'dates': len(store.dates),
+        'seed': seed,
+        'repeat': repeat,
+        'n_queries': n_queries,
+        'git_commit': _git_commit(),
+        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+    return {'meta': meta, 'results': run_benchmarks(data_path, repeat=repeat, n_queries=n_queries, seed=seed)}
+
+
+def load_results(path):
+    """读取 benchmark 保存的 JSON 结果"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    比较两次基准测试的中位耗时
+    :param baseline: 基准结果（字典或 JSON 文件路径）
+    :param current: 当前结果（字典或 JSON 文件路径）
+    :param threshold: 耗时变化超过该比例时标记为 regression / improvement
+    :return: DataFrame，列为 baseline、current（秒）、ratio（current / baseline）与 status
+    """
+    if isinstance(baseline, str):
+        baseline = load_results(baseline)
+    if isinstance(current, str):
+        current = load_results(current)
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            rows.append({'benchmark': name, 'baseline': np.nan, 'current': result['median'], 'ratio': np.nan,
+                         'status': 'new'})
+            continue
+        ratio = result['median'] / base['median'] if base['median'] else np.nan
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append({'benchmark': name, 'baseline': base['median'], 'current': result['median'], 'ratio': ratio,
+                     'status': status})
+    return pd.DataFrame(rows, columns=['benchmark', 'baseline', 'current', 'ratio', 'status'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='回测框架性能基准测试')
+    parser.add_argument('--stocks', type=int, default=500, help='模拟股票数量')
+    parser.add_argument('--days', type=int, default=250, help='模拟交易日数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测试的重复轮数')
+    parser.add_argument('--queries', type=int, default=200, help='查询类测试每轮的调用次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--data', help='使用已有的数据文件，不生成模拟数据')
+    parser.add_argument('--work-dir', help='模拟数据存放目录')
+    parser.add_argument('--output', help='结果 JSON 的保存路径')
+    parser.add_argument('--compare', help='与该 JSON 结果比较')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定性能回退的耗时变化比例')
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.stocks, args.days, repeat=args.repeat, n_queries=args.queries, seed=args.seed,
+                       data_path=args.data, work_dir=args.work_dir)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    table = pd.DataFrame.from_dict(report['results'], orient='index')
+    print(table.to_string(float_format=lambda x: f"{x:.6g}"))
+    if args.compare:
+        comparison = compare_results(args.compare, report, threshold=args.threshold)
+        print(comparison.to_string(index=False, float_format=lambda x: f"{x:.6g}"))
+        return 1 if (comparison['status'] == 'regression').any() else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
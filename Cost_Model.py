@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class CostModel:
+    """
+    交易成本模型：佣金（按比例收取，设最低佣金）、印花税（仅卖出）、过户费、整手约束，以及按当日成交量（Dnshrtrd）计算的滑点
+    各方法均接受标量或数组，可一次作用于一组订单；可买数量用闭式解求出，不逐股试算
+    默认参数与原先硬编码的费率一致（佣金万分之三、最低5元、印花税千分之一），不收过户费、不按整手取整、无滑点
+    """
+
+    def __init__(self, commission_rate=0.0003, min_commission=5, stamp_tax_rate=0.001, transfer_fee_rate=0.0,
+                 lot_size=1, slippage=0.0, impact=0.0, max_volume_ratio=None):
+        """
+        :param commission_rate: 佣金费率（买卖双向）
+        :param min_commission: 单笔最低佣金（元）
+        :param stamp_tax_rate: 印花税率（仅卖出收取）
+        :param transfer_fee_rate: 过户费率（买卖双向，按成交金额）
+        :param lot_size: 每手股数，买入数量须为其整数倍（A股为100）；卖出时不足一手的零股只能随清仓一次卖出
+        :param slippage: 固定滑点（占价格的比例），买入向上、卖出向下偏离
+        :param impact: 冲击成本系数，额外滑点 = impact * 成交数量 / 当日成交量
+        :param max_volume_ratio: 单笔成交数量不超过当日成交量的比例（None 表示不限制）
+        """
+        if lot_size < 1:
+            raise ValueError(f"每手股数必须为正整数: {lot_size}")
+        self.commission_rate = commission_rate
+        self.min_commission = min_commission
+        self.stamp_tax_rate = stamp_tax_rate
+        self.transfer_fee_rate = transfer_fee_rate
+        self.lot_size = int(lot_size)
+        self.slippage = slippage
+        self.impact = impact
+        self.max_volume_ratio = max_volume_ratio
+
+    @classmethod
+    def a_share(cls, **kwargs):
+        """A股现行规则：佣金万分之三（最低5元）、印花税万分之五、过户费十万分之一、100股一手"""
+        params = dict(stamp_tax_rate=0.0005, transfer_fee_rate=0.00001, lot_size=100)
+        params.update(kwargs)
+        return cls(**params)
+
+    @property
+    def needs_volume(self):
+        """是否需要当日成交量（冲击成本或成交量上限）"""
+        return bool(self.impact) or self.max_volume_ratio is not None
+
+    def commission(self, values):
+        """佣金：成交金额乘以费率，不低于最低佣金"""
+        return np.maximum(self.commission_rate * values, self.min_commission)
+
+    def buy_fees(self, values):
+        """买入费用：佣金 + 过户费"""
+        return self.commission(values) + self.transfer_fee_rate * values
+
+    def sell_fees(self, values):
+        """卖出费用：佣金 + 印花税 + 过户费"""
+        return self.commission(values) + (self.stamp_tax_rate + self.transfer_fee_rate) * values
+
+    def round_lot(self, amounts):
+        """买入数量向下取整到整手"""
+        lot = self.lot_size
+        if lot == 1:
+            return np.floor(amounts)
+        return np.floor(np.asarray(amounts, dtype=float) / lot) * lot
+
+    def sell_amounts(self, amounts, holdings):
+        """
+        可卖数量：不超过持仓；未清仓时向下取整到整手，清仓时零股一并卖出
+        :param amounts: 委托卖出数量（正数）
+        :param holdings: 当前持仓
+        """
+        amounts = np.minimum(amounts, holdings)
+        return np.where(amounts >= holdings, amounts, self.round_lot(amounts))
+
+    def volume_limits(self, volumes):
+        """按当日成交量计算的单笔成交数量上限（不限制或成交量缺失时为 inf）"""
+        volumes = np.asarray(volumes, dtype=float)
+        if self.max_volume_ratio is None:
+            return np.full(volumes.shape, np.inf)
+        limits = self.round_lot(self.max_volume_ratio * np.nan_to_num(volumes))
+        return np.where(np.isnan(volumes), np.inf, limits)
+
+    def execution_prices(self, prices, amounts, volumes=None):
+        """
+        计入滑点后的成交价：买入上浮、卖出下浮，幅度 = slippage + impact * |数量| / 当日成交量
+        :param prices: 委托成交价
+        :param amounts: 成交数量（正数买入，负数卖出）
+        :param volumes: 当日成交量（None 或缺失时只计固定滑点）
+        """
+        prices = np.asarray(prices, dtype=float)
+        if not self.slippage and (not self.impact or volumes is None):
+            return prices
+        slip = np.full(np.broadcast(prices, amounts).shape, float(self.slippage))
+        if self.impact and volumes is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.abs(amounts) / np.asarray(volumes, dtype=float)
+            slip = slip + self.impact * np.where(np.isfinite(ratio), ratio, 0)
+        return prices * (1 + np.sign(amounts) * slip)
+
+    def max_buy_amounts(self, cash, prices):
+        """
+        可负担的最大买入数量（整手，计入买入费用），等价于逐手递减试算的结果
+        佣金为分段函数：成交额较小时按最低佣金收取，较大时按比例收取，分别求解后取可行的较大值
+        :param cash: 可用资金（标量或与 prices 等长的数组）
+        :param prices: 成交价（标量或数组）
+        """
+        prices = np.asarray(prices, dtype=float)
+        cash = np.broadcast_to(np.asarray(cash, dtype=float), prices.shape)
+        rate, min_fee, lot = self.commission_rate, self.min_commission, self.lot_size
+        scale = 1 + self.transfer_fee_rate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 按比例收费区间：price * n * (scale + rate) <= cash，且比例佣金不低于最低佣金
+            n_rate = self.round_lot(cash / (prices * (scale + rate)))
+            n_rate = np.where(rate * prices * n_rate >= min_fee, n_rate, 0)
+            # 最低佣金区间：price * n * scale + min_fee <= cash，且比例佣金不超过最低佣金
+            # （佣金费率与最低佣金均为 0 时上限为 0/0，用 fmin / fmax 忽略 NaN，只保留资金约束）
+            n_min = np.fmin(self.round_lot((cash - min_fee) / (prices * scale)),
+                            self.round_lot(min_fee / (rate * prices)))
+            amounts = np.nan_to_num(np.maximum(np.fmax(n_rate, n_min), 0), posinf=0)
+            amounts = np.where((prices > 0) & (cash > 0), amounts, 0)
+
+            # 修正浮点误差：保证总成本不超过现金，且多买一手即超出
+            values = prices * amounts
+            amounts = np.where((amounts > 0) & (values + self.buy_fees(values) > cash), amounts - lot, amounts)
+            values = prices * (amounts + lot)
+            amounts = np.where((prices > 0) & (values + self.buy_fees(values) <= cash), amounts + lot, amounts)
+        return amounts.astype(np.int64)
+
+    def max_buy_amount(self, cash, price):
+        """单只股票的 max_buy_amounts"""
+        return int(self.max_buy_amounts(cash, price))
+
+    def max_fill_amounts(self, cash, prices, volumes=None):
+        """
+        计入成交量上限与滑点后可负担的最大买入数量：先按委托价求解，再按该数量对应的成交价重算
+        （数量减少时冲击成本只会下降，结果按成交价必定可负担）
+        :param volumes: 当日成交量（None 表示不考虑成交量）
+        """
+        amounts = self.max_buy_amounts(cash, prices)
+        if volumes is not None:
+            amounts = np.minimum(amounts, self.volume_limits(volumes)).astype(np.int64)
+        if self.slippage or self.impact:
+            exec_prices = self.execution_prices(prices, amounts, volumes)
+            amounts = np.minimum(amounts, self.max_buy_amounts(cash, exec_prices))
+        return amounts
@@ -3,8 +3,12 @@ file_path = r"C:\Users\chanpi\Desktop\Backtesting\测试用文件\TRD_Dalyr.csv"
 
 import pandas as pd
 import os
+import json
+import shutil
+import hashlib
 from datetime import datetime
 import numpy as np
+from Utilities import cache_stats
 
 
 class StockData:
@@ -22,65 +26,695 @@ class StockData:
         self.Dsmvosd = None  # 流通市值
 
 
-def get_price(security, start_date=None, end_date=None, frequency='daily', fields=None,
-              skip_paused=False, count=None, panel=True, fill_paused=True):
+# CSMAR 日个股回报率文件中的数值字段（其余字段按字符串保留）
+NUMERIC_FIELDS = ['Opnprc', 'Hiprc', 'Loprc', 'Clsprc', 'Dnshrtrd', 'Dnvaltrd', 'Dsmvosd', 'Dsmvtll',
+                  'Dretwd', 'Dretnd', 'Adjprcwd', 'Adjprcnd', 'Markettype', 'Trdsta', 'Ahshrtrd_D',
+                  'Ahvaltrd_D', 'PreClosePrice', 'ChangeRatio', 'LimitDown', 'LimitUp', 'LimitStatus']
+
+
+CACHE_VERSION = 1  # 缓存格式版本，格式变化时递增以使旧缓存失效
+
+
+CSV_DTYPES = {'Stkcd': str, 'Trddt': str}  # 读取 CSV 时按字符串处理的字段
+
+
+# 周期K线的聚合方式：first 取期初值，last 取期末值，max / min 取极值（忽略 NaN），sum 求和，
+# compound 按 (1 + r) 连乘复合收益率；未列出的字段取期末值
+RESAMPLE_RULES = {'Opnprc': 'first', 'Hiprc': 'max', 'Loprc': 'min', 'Dnshrtrd': 'sum', 'Dnvaltrd': 'sum',
+                  'Ahshrtrd_D': 'sum', 'Ahvaltrd_D': 'sum', 'Dretwd': 'compound', 'Dretnd': 'compound',
+                  'ChangeRatio': 'compound', 'PreClosePrice': 'first'}
+FREQUENCY_ALIASES = {'daily': '1d', 'd': '1d', '1d': '1d', 'weekly': '1w', 'w': '1w', '1w': '1w',
+                     'monthly': '1m', 'm': '1m', '1m': '1m'}
+
+
+def _parse_frequency(frequency):
     """
-    获取历史数据，可查询多个标的多个数据字段，返回数据格式为 DataFrame
+    规范化K线周期：'daily'/'1d'、'weekly'/'1w'、'monthly'/'1m'，或 'Nd'（每 N 个交易日一根K线）
+    :return: '1d'、'1w'、'1m' 或 'Nd'
+    """
+    key = FREQUENCY_ALIASES.get(str(frequency).strip().lower())
+    if key is not None:
+        return key
+    text = str(frequency).strip().lower()
+    if text.endswith('d') and text[:-1].isdigit() and int(text[:-1]) > 0:
+        return f"{int(text[:-1])}d"
+    raise ValueError(f"无效的K线周期: {frequency}，可选: 'daily', 'weekly', 'monthly' 或 'Nd'（如 '5d'）")
+
+
+def _clean_column(name, values):
+    """标准化单个字段：去除引号，日期转为 datetime，代码补足6位，数值字段转为 float"""
+    if not pd.api.types.is_numeric_dtype(values):
+        # 去除可能存在的引号
+        values = values.str.replace('"', '')
+    if name == 'Trddt':
+        values = pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+    elif name == 'Stkcd':
+        values = values.str.zfill(6)  # 统一6位代码格式
+    elif name in NUMERIC_FIELDS:
+        values = pd.to_numeric(values, errors='coerce').astype(float)
+    return values
+
+
+def _clean_columns(df, skip=()):
+    """标准化 DataFrame 的全部字段（skip 中的字段已处理过）"""
+    for name in df.columns:
+        if name not in skip:
+            df[name] = _clean_column(name, df[name])
+    return df
+
+
+def _to_datetime64(value):
+    """将任意日期输入转换为 numpy datetime64[ns]，便于在排序数组上二分查找"""
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+
+class PriceStore:
     """
-    # 数据文件路径
-    file_path = r"C:\Users\chanpi\Desktop\Backtesting\测试用文件\TRD_Dalyr.csv"
+    进程内共享的行情存储
+    数据只解析一次，按 (Stkcd, Trddt) 排序后以列式 numpy 数组保存，
+    单只股票的日期区间通过二分查找定位，查询复杂度为 O(log n)
+    """
+
+    # 由排序后的数据派生、可随列一起缓存的索引数组
+    INDEX_ARRAYS = ['securities', 'starts', 'date_order', 'sorted_trddt', 'dates']
+
+    def __init__(self, columns, column_names, index=None):
+        """
+        :param columns: {字段名: numpy数组}，必须已按 (Stkcd, Trddt) 排序
+        :param column_names: 原始文件中的字段顺序
+        :param index: 预先计算好的索引数组（来自缓存），None 时现场计算
+        """
+        self.columns = columns
+        self.column_names = list(column_names)
+        self.codes = columns['Stkcd']
+        self.trddt = columns['Trddt']
+
+        if index is None:
+            index = self._build_index(self.codes, self.trddt)
+        self.index = index
+
+        # 每只股票在排序数组中的起止位置
+        self.securities = index['securities']
+        starts = index['starts']
+        ends = np.append(starts[1:], len(self.codes))
+        self._bounds = {str(code): (int(s), int(e)) for code, s, e in zip(self.securities, starts, ends)}
+
+        # 按日期排序的行号（同一日期内仍按股票代码有序），用于按日期横截面查询
+        self.date_order = index['date_order']
+        self.sorted_trddt = index['sorted_trddt']
+        self.dates = index['dates']
+
+        self.cache_dir = None  # 来自二进制缓存时为缓存目录
+        self.version = None  # 数据版本（源文件内容哈希），来自二进制缓存时可用
+        self.frequency = '1d'  # K线周期，周期K线由 resample 生成
+        self._panels = {}  # {字段元组: PricePanel}
+        self._resampled = {}  # {周期: PriceStore}
+        self._grid_positions = None
+        self._membership = None
+
+    @staticmethod
+    def _build_index(codes, trddt):
+        """计算股票区间、按日期排序的行号以及交易日历"""
+        # codes 已排序，取变化点即为每只股票的起始行
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.arange(0)
+        date_order = np.argsort(trddt, kind='stable')
+        sorted_trddt = trddt[date_order]
+        dates = np.unique(sorted_trddt)
+        return {'securities': codes[starts], 'starts': starts, 'date_order': date_order,
+                'sorted_trddt': sorted_trddt, 'dates': dates}
+
+    @classmethod
+    def from_csv(cls, path):
+        """解析 CSMAR 日行情 CSV 文件"""
+        # 股票代码和日期按字符串读取，其余字段交给解析器推断类型
+        df = _clean_columns(pd.read_csv(path, dtype=CSV_DTYPES))
+        columns = {name: df[name].to_numpy() for name in df.columns}
+
+        # 删除无效日期记录
+        valid = ~pd.isna(columns['Trddt'])
+        columns = {name: values[valid] for name, values in columns.items()}
+        columns['Trddt'] = columns['Trddt'].astype('datetime64[ns]')
+
+        order = np.lexsort((columns['Trddt'], columns['Stkcd']))
+        columns = {name: values[order] for name, values in columns.items()}
+        return cls(columns, df.columns)
+
+    def save_cache(self, cache_dir, source):
+        """
+        将列数据与索引写成逐列 .npy 文件，最后写入 manifest
+        先写入临时目录再整体替换，避免多个进程同时构建时读到半成品
+        :param source: 源文件指纹（大小、修改时间、哈希）
+        """
+        tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        files = {}
+        for name, values in list(self.columns.items()) + [(f"_{k}", v) for k, v in self.index.items()]:
+            if values.dtype == object:
+                # 字符串列转为定长 unicode，才能被内存映射
+                values = np.array(['' if pd.isna(v) else str(v) for v in values], dtype=str)
+            file_name = f"{name}.npy"
+            np.save(os.path.join(tmp_dir, file_name), values, allow_pickle=False)
+            files[name] = file_name
+
+        manifest = {
+            'version': CACHE_VERSION,
+            'source': source,
+            'column_names': self.column_names,
+            'files': files,
+        }
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            # 其他进程已抢先完成构建，丢弃本进程的结果
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load_cache(cls, cache_dir, manifest, mmap_mode='r'):
+        """以内存映射方式打开缓存，启动开销与文件大小无关"""
+        arrays = {name: np.load(os.path.join(cache_dir, file_name), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name, file_name in manifest['files'].items()}
+        columns = {name: arr for name, arr in arrays.items() if not name.startswith('_')}
+        index = {name: arrays[f"_{name}"] for name in cls.INDEX_ARRAYS}
+        store = cls(columns, manifest['column_names'], index=index)
+        store.cache_dir = cache_dir
+        store.version = manifest['source'].get('sha1')
+        return store
+
+    def locate(self, security, start_date=None, end_date=None):
+        """
+        定位单只股票在 [start_date, end_date] 内的行区间
+        :return: (lo, hi) 切片边界，无数据时 lo == hi
+        """
+        bounds = self._bounds.get(security)
+        if bounds is None:
+            return 0, 0
+        lo, hi = bounds
+        dates = self.trddt[lo:hi]
+        if start_date is not None:
+            lo += int(np.searchsorted(dates, _to_datetime64(start_date), side='left'))
+        if end_date is not None:
+            hi = bounds[0] + int(np.searchsorted(dates, _to_datetime64(end_date), side='right'))
+        return lo, max(lo, hi)
+
+    def locate_date(self, date):
+        """定位某一交易日在按日期排序的行号数组中的区间"""
+        target = _to_datetime64(date)
+        lo = int(np.searchsorted(self.sorted_trddt, target, side='left'))
+        hi = int(np.searchsorted(self.sorted_trddt, target, side='right'))
+        return lo, hi
+
+    def take(self, rows, fields=None):
+        """按行号（切片或索引数组）取出指定字段，构造 DataFrame"""
+        names = self.column_names if fields is None else fields
+        return pd.DataFrame({name: self.columns[name][rows] for name in names})
+
+    def to_frame(self, order=None):
+        """导出全部数据为 DataFrame，order 为可选的行号顺序"""
+        if order is None:
+            return self.take(slice(None))
+        return self.take(order)
+
+    def grid_positions(self):
+        """每行记录在 (交易日, 股票) 网格中的位置"""
+        if self._grid_positions is None:
+            date_pos = np.searchsorted(self.dates, self.trddt)
+            starts = self.index['starts']
+            lengths = np.diff(np.append(starts, len(self.codes)))
+            security_pos = np.repeat(np.arange(len(starts)), lengths)
+            self._grid_positions = (date_pos, security_pos)
+        return self._grid_positions
+
+    def field_matrix(self, field, dtype=np.float64):
+        """单个字段的 (交易日, 股票) 矩阵，缺失为 NaN；用于需要 float64 精度的资金计算"""
+        date_pos, security_pos = self.grid_positions()
+        values = np.full((len(self.dates), len(self.securities)), np.nan, dtype=dtype)
+        values[date_pos, security_pos] = self.columns[field]
+        return values
+
+    def resample(self, frequency):
+        """
+        获取周期K线（周、月或每 N 个交易日），返回结构相同的 PriceStore；首次请求某一周期时构建，之后复用
+        有缓存目录时周期K线写入 <缓存目录>/bars-<周期>，源文件变化时随日线缓存一起失效
+        """
+        key = _parse_frequency(frequency)
+        if key == self.frequency:
+            return self
+        if self.frequency != '1d':
+            raise ValueError(f"只能由日线生成周期K线，当前周期: {self.frequency}")
+        store = self._resampled.get(key)
+        if store is not None:
+            _resample_cache_stats.hit()
+            return store
+        _resample_cache_stats.miss()
+
+        bars_dir = None if self.cache_dir is None else os.path.join(self.cache_dir, f"bars-{key}")
+        if bars_dir is not None:
+            manifest = _read_manifest(bars_dir)
+            if manifest is not None and manifest['source'].get('sha1') == self.version:
+                store = PriceStore.load_cache(bars_dir, manifest)
+        if store is None:
+            store = self._build_bars(key)
+            if bars_dir is not None:
+                try:
+                    store.save_cache(bars_dir, {'frequency': key, 'sha1': self.version})
+                    manifest = _read_manifest(bars_dir)
+                    if manifest is not None:
+                        store = PriceStore.load_cache(bars_dir, manifest)
+                except OSError:
+                    pass
+        store.frequency = key
+        # 与日线区分版本，避免指标缓存等按版本复用的结果混用
+        store.version = None if self.version is None else f"{self.version}:{key}"
+        self._resampled[key] = store
+        return store
+
+    def _build_bars(self, key):
+        """
+        用分组归约聚合周期K线：同一股票、同一周期的日线在 (Stkcd, Trddt) 排序下是连续的行，
+        各字段对每段连续行做一次 reduceat；K线日期为该周期的最后一个交易日
+        """
+        if len(self.codes) == 0:
+            return PriceStore(dict(self.columns), self.column_names)
+        days = self.dates.astype('datetime64[D]').astype(np.int64)
+        if key == '1w':
+            periods = (days + 3) // 7  # 1970-01-01 为周四，偏移后按周一起始分周
+        elif key == '1m':
+            periods = self.dates.astype('datetime64[M]').astype(np.int64)
+        else:
+            periods = np.arange(len(self.dates)) // int(key[:-1])
+        # 每个交易日所属K线的序号，以及每根K线的日期
+        changed = periods[1:] != periods[:-1]
+        bar_of_date = np.cumsum(np.r_[False, changed])
+        bar_dates = self.dates[np.flatnonzero(np.r_[changed, True])]
+
+        date_pos, security_pos = self.grid_positions()
+        bar = bar_of_date[date_pos]
+        n = len(self.codes)
+        group = np.r_[True, (security_pos[1:] != security_pos[:-1]) | (bar[1:] != bar[:-1])]
+        starts = np.flatnonzero(group)
+        lasts = np.append(starts[1:], n) - 1
+
+        columns = {}
+        for name, values in self.columns.items():
+            if name == 'Trddt':
+                columns[name] = bar_dates[bar[starts]]
+                continue
+            rule = RESAMPLE_RULES.get(name, 'last')
+            if rule == 'first':
+                columns[name] = values[starts]
+            elif rule == 'last' or values.dtype.kind not in 'fiu':
+                columns[name] = values[lasts]
+            elif rule == 'max':
+                columns[name] = np.fmax.reduceat(values, starts)
+            elif rule == 'min':
+                columns[name] = np.fmin.reduceat(values, starts)
+            elif rule == 'sum':
+                columns[name] = np.add.reduceat(np.nan_to_num(values), starts)
+            else:
+                columns[name] = np.multiply.reduceat(1 + np.nan_to_num(values), starts) - 1
+        return PriceStore(columns, self.column_names)
+
+    def get_membership(self):
+        """获取按交易日预计算的股票成员位图（首次调用时构建）"""
+        if self._membership is None:
+            self._membership = SecurityMembership.from_store(self)
+        return self._membership
+
+    def get_panel(self, fields=None):
+        """
+        获取 (日期 × 股票 × 字段) 的稠密面板，同一组字段只构建一次
+        有缓存目录时面板写入内存映射文件，多个进程共享同一份物理内存
+        """
+        if fields is None:
+            fields = [name for name in self.column_names if name in NUMERIC_FIELDS]
+        key = tuple(fields)
+        panel = self._panels.get(key)
+        if panel is not None:
+            _panel_cache_stats.hit()
+        else:
+            _panel_cache_stats.miss()
+            path = None
+            if self.cache_dir is not None:
+                tag = hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()[:8]
+                path = os.path.join(self.cache_dir, f"panel-{tag}.npy")
+            panel = PricePanel.from_store(self, fields, path)
+            self._panels[key] = panel
+        return panel
+
+
+class SecurityMembership:
+    """
+    按交易日预计算的股票成员位图
+    股票字典固定为 PriceStore.securities，每个交易日一行按位打包的位图：
+    traded 表示当日有行情，normal 表示当日正常交易（Trdsta == 1）
+    查询某日成员只需解包一行位图，跨日期的集合运算是按字节的位运算
+    """
+
+    def __init__(self, traded, normal, dates, securities, first_pos, last_pos):
+        self.traded = traded  # (交易日, ceil(股票数/8)) uint8
+        self.normal = normal
+        self.dates = dates
+        self.securities = securities
+        self.first_pos = first_pos  # 每只股票首个交易日在日历中的位置
+        self.last_pos = last_pos  # 每只股票最后一个交易日在日历中的位置
+        self._n = len(securities)
+
+    @classmethod
+    def from_store(cls, store):
+        """由行情存储构建；有缓存目录时位图随缓存保存，供其他进程直接映射"""
+        shape = (len(store.dates), len(store.securities))
+        paths = None
+        if store.cache_dir is not None:
+            paths = [os.path.join(store.cache_dir, f"membership-{name}.npy") for name in ('traded', 'normal')]
+            if all(os.path.exists(path) for path in paths):
+                traded, normal = (np.load(path, mmap_mode='r') for path in paths)
+                return cls._with_bounds(store, traded, normal)
+
+        date_pos, security_pos = store.grid_positions()
+        bits = np.zeros(shape, dtype=bool)
+        bits[date_pos, security_pos] = True
+        traded = np.packbits(bits, axis=1)
+        bits[:] = False
+        if 'Trdsta' in store.columns:
+            is_normal = store.columns['Trdsta'] == 1
+            bits[date_pos[is_normal], security_pos[is_normal]] = True
+        normal = np.packbits(bits, axis=1)
+
+        if paths is not None:
+            for path, values in zip(paths, (traded, normal)):
+                tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+                np.save(tmp_path, values)
+                os.replace(tmp_path, path)
+        return cls._with_bounds(store, traded, normal)
+
+    @classmethod
+    def _with_bounds(cls, store, traded, normal):
+        starts = store.index['starts']
+        ends = np.append(starts[1:], len(store.codes)) - 1
+        first_pos = np.searchsorted(store.dates, store.trddt[starts])
+        last_pos = np.searchsorted(store.dates, store.trddt[ends]) if len(ends) else ends
+        return cls(traded, normal, store.dates, store.securities, first_pos, last_pos)
+
+    def date_pos(self, date):
+        """交易日在日历中的位置，不是交易日时返回 -1"""
+        target = _to_datetime64(date)
+        pos = int(np.searchsorted(self.dates, target))
+        if pos < len(self.dates) and self.dates[pos] == target:
+            return pos
+        return -1
+
+    def bitmap(self, date, normal_only=False):
+        """某一交易日的打包位图（非交易日为全 0）"""
+        bits = self.normal if normal_only else self.traded
+        pos = self.date_pos(date)
+        if pos < 0:
+            return np.zeros(bits.shape[1], dtype=np.uint8)
+        return bits[pos]
+
+    def mask(self, date, normal_only=False):
+        """某一交易日的布尔掩码，顺序与 securities 一致"""
+        return np.unpackbits(self.bitmap(date, normal_only), count=self._n).astype(bool)
+
+    def to_codes(self, bitmap):
+        """将打包位图转换为股票代码数组"""
+        return self.securities[np.flatnonzero(np.unpackbits(bitmap, count=self._n))]
+
+    def securities_on(self, date, normal_only=False):
+        """某一交易日有行情（或正常交易）的股票代码"""
+        return self.to_codes(self.bitmap(date, normal_only))
+
+    def count(self, date, normal_only=False):
+        """某一交易日的成员数量"""
+        return int(np.unpackbits(self.bitmap(date, normal_only), count=self._n).sum())
+
+    def added(self, date_from, date_to, normal_only=False):
+        """date_to 有而 date_from 没有的股票（如新上市、复牌）"""
+        return self.to_codes(self.bitmap(date_to, normal_only) & ~self.bitmap(date_from, normal_only))
+
+    def removed(self, date_from, date_to, normal_only=False):
+        """date_from 有而 date_to 没有的股票（如退市、停牌）"""
+        return self.to_codes(self.bitmap(date_from, normal_only) & ~self.bitmap(date_to, normal_only))
+
+    def new_listings(self, date):
+        """在该交易日首次出现行情的股票"""
+        return self.securities[self.first_pos == self.date_pos(date)]
+
+    def delistings(self, date):
+        """在该交易日之后不再有行情的股票（最后一个交易日为该日；日历最后一天的结果无意义）"""
+        return self.securities[self.last_pos == self.date_pos(date)]
+
+
+class PricePanel:
+    """
+    稠密行情面板：float32 数组，形状为 (交易日, 股票, 字段)
+    交易日按日历排序，股票顺序与 PriceStore.securities 一致；缺失（停牌、未上市）记为 NaN
+    单日切片 values[d] 是连续内存上的零拷贝视图
+    """
+
+    def __init__(self, values, dates, securities, fields):
+        self.values = values
+        self.dates = dates
+        self.securities = securities
+        self.fields = list(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.security_index = {str(code): i for i, code in enumerate(securities)}
+
+    @classmethod
+    def from_store(cls, store, fields, path=None):
+        """由行情存储构建面板；path 不为空时写入/复用 .npy 内存映射文件"""
+        if path is not None and os.path.exists(path):
+            values = np.load(path, mmap_mode='r')
+            if values.shape == (len(store.dates), len(store.securities), len(fields)):
+                return cls(values, store.dates, store.securities, fields)
+
+        shape = (len(store.dates), len(store.securities), len(fields))
+        if path is None:
+            values = np.full(shape, np.nan, dtype=np.float32)
+        else:
+            tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+            values = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+            values[:] = np.nan
+
+        date_pos, security_pos = store.grid_positions()
+        for f, name in enumerate(fields):
+            values[date_pos, security_pos, f] = store.columns[name]
+
+        if path is not None:
+            values.flush()
+            del values
+            os.replace(tmp_path, path)
+            values = np.load(path, mmap_mode='r')
+        return cls(values, store.dates, store.securities, fields)
+
+    def date_pos(self, date):
+        """交易日在日历中的位置，不是交易日时返回 -1"""
+        target = _to_datetime64(date)
+        pos = int(np.searchsorted(self.dates, target))
+        if pos < len(self.dates) and self.dates[pos] == target:
+            return pos
+        return -1
+
+    def day(self, date):
+        """某一交易日全部股票、全部字段的视图，形状 (股票, 字段)"""
+        pos = self.date_pos(date)
+        return None if pos < 0 else self.values[pos]
+
+    def get(self, date, field):
+        """某一交易日全部股票单个字段的视图，形状 (股票,)"""
+        pos = self.date_pos(date)
+        return None if pos < 0 else self.values[pos, :, self.field_index[field]]
+
+    def field(self, field):
+        """单个字段在全部日期上的视图，形状 (交易日, 股票)"""
+        return self.values[:, :, self.field_index[field]]
+
+
+_price_stores = {}  # {文件绝对路径: PriceStore}，进程内共享
+_store_cache_stats = cache_stats('price_store')  # 进程内行情存储的复用
+_disk_cache_stats = cache_stats('price_store.disk')  # 二进制缓存的复用（未命中即重新解析 CSV）
+_panel_cache_stats = cache_stats('price_panel')
+_resample_cache_stats = cache_stats('price_store.resample')  # 周期K线的复用
+_active_file_path = None  # DataHandler 指定的数据文件，get_price 等函数默认读取它
+
+
+def set_data_file(path):
+    """指定 get_price / get_all_securities 默认读取的数据文件"""
+    global _active_file_path
+    _active_file_path = path
 
+
+def _file_hash(path, block_size=1 << 20):
+    """计算文件内容的 SHA-1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+    return manifest
+
+
+def load_price_store(path, cache_dir=None, use_cache=True):
+    """
+    加载行情存储：优先读取二进制列式缓存，源文件变化时自动重建
+    源文件大小和修改时间均未变时直接复用缓存；任一变化时再比较内容哈希，
+    哈希相同（如仅被复制或 touch）则复用并刷新指纹，否则重新解析 CSV
+    :param path: CSV 文件路径
+    :param cache_dir: 缓存目录，默认是数据文件旁的 <文件名>.cache
+    :param use_cache: 为 False 时总是直接解析 CSV
+    """
     # 检查文件是否存在
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"数据文件不存在: {file_path}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"数据文件不存在: {path}")
+    if not use_cache:
+        return PriceStore.from_csv(path)
 
-    # 读取CSV文件，注意处理带引号的字段
-    df = pd.read_csv(file_path, dtype=str)  # 先都按字符串读取，避免格式问题
+    cache_dir = cache_dir or f"{path}.cache"
+    stat = os.stat(path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
 
-    # 转换数值字段为适当类型
-    numeric_fields = ['Opnprc', 'Hiprc', 'Loprc', 'Clsprc', 'Trdsta',
-                      'LimitDown', 'LimitUp', 'Dnshrtrd', 'Dsmvosd']
-    for field in numeric_fields:
-        if field in df.columns:
-            # 去除可能存在的引号并转换为数值
-            df[field] = df[field].str.replace('"', '').astype(float, errors='ignore')
+    manifest = _read_manifest(cache_dir)
+    if manifest is not None:
+        cached = manifest['source']
+        if cached['size'] == source['size'] and cached['mtime_ns'] == source['mtime_ns']:
+            _disk_cache_stats.hit()
+            return PriceStore.load_cache(cache_dir, manifest)
+        source['sha1'] = _file_hash(path)
+        if cached.get('sha1') == source['sha1']:
+            manifest['source'] = source
+            with open(os.path.join(cache_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            _disk_cache_stats.hit()
+            return PriceStore.load_cache(cache_dir, manifest)
 
-    # 转换日期列的格式（去除引号）
-    if 'Trddt' in df.columns:
-        df['Trddt'] = pd.to_datetime(df['Trddt'].str.replace('"', ''))
+    _disk_cache_stats.miss()
+    store = PriceStore.from_csv(path)
+    source.setdefault('sha1', _file_hash(path))
+    try:
+        store.save_cache(cache_dir, source)
+    except OSError:
+        # 缓存目录不可写时仍然返回解析结果
+        return store
+    manifest = _read_manifest(cache_dir)
+    return PriceStore.load_cache(cache_dir, manifest) if manifest else store
 
-    # 处理股票代码（去除引号）
-    if 'Stkcd' in df.columns:
-        df['Stkcd'] = df['Stkcd'].str.replace('"', '')
 
-    # 过滤股票代码
-    if isinstance(security, list):
-        # 多个股票代码
-        securities = [str(s).replace('"', '') for s in security]
-        df = df[df['Stkcd'].isin(securities)]
+def get_price_store(path=None):
+    """获取行情存储，同一文件在进程内只加载一次"""
+    if path is None:
+        path = _active_file_path or file_path
+    key = os.path.abspath(path)
+    store = _price_stores.get(key)
+    if store is None:
+        _store_cache_stats.miss()
+        store = load_price_store(path)
+        _price_stores[key] = store
     else:
-        # 单个股票代码
-        security_str = str(security).replace('"', '')
-        df = df[df['Stkcd'] == security_str]
+        _store_cache_stats.hit()
+    return store
+
+
+def _normalize_security(security):
+    """去除引号并补前导零至6位"""
+    return str(security).replace('"', '').zfill(6)
+
+
+class ScanStats:
+    """流式读取的统计：扫描行数、保留行数与读取块数"""
+
+    def __init__(self):
+        self.rows_scanned = 0
+        self.rows_kept = 0
+        self.chunks = 0
+
+    def __repr__(self):
+        return f"ScanStats(rows_scanned={self.rows_scanned}, rows_kept={self.rows_kept}, chunks={self.chunks})"
+
+
+def iter_price_chunks(path=None, securities=None, start_date=None, end_date=None, fields=None,
+                      skip_paused=False, chunksize=100000, stats=None):
+    """
+    分块流式读取 CSV，将股票列表、日期区间和字段选择下推到读取过程中，只产出匹配的行和列
+    峰值内存由 chunksize 决定，适用于无法整体载入内存的大文件
+    :param path: 数据文件路径，默认与 get_price 相同
+    :param securities: 股票代码列表，None 表示不过滤
+    :param fields: 需要的字段，None 表示全部字段（Stkcd、Trddt 总会保留）
+    :param skip_paused: 是否只保留正常交易（Trdsta == 1）的行
+    :param chunksize: 每块读取的行数
+    :param stats: ScanStats 对象，用于累计扫描/保留行数
+    """
+    if path is None:
+        path = _active_file_path or file_path
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"数据文件不存在: {path}")
+
+    usecols = None
+    if fields is not None:
+        usecols = list(dict.fromkeys(['Stkcd', 'Trddt'] + list(fields) + (['Trdsta'] if skip_paused else [])))
+    wanted = None if securities is None else {_normalize_security(s) for s in securities}
+    start = None if start_date is None else pd.to_datetime(start_date)
+    end = None if end_date is None else pd.to_datetime(end_date)
+
+    for chunk in pd.read_csv(path, dtype=CSV_DTYPES, usecols=usecols, chunksize=chunksize):
+        if stats is not None:
+            stats.rows_scanned += len(chunk)
+            stats.chunks += 1
 
-    # 过滤日期范围
-    if start_date:
-        start_date = pd.to_datetime(start_date)
-        df = df[df['Trddt'] >= start_date]
+        # 先按股票代码过滤，后续的日期和数值解析只作用于匹配的行
+        chunk['Stkcd'] = _clean_column('Stkcd', chunk['Stkcd'])
+        if wanted is not None:
+            chunk = chunk[chunk['Stkcd'].isin(wanted)]
+        chunk = _clean_columns(chunk.copy(), skip=('Stkcd',))
 
-    if end_date:
-        end_date = pd.to_datetime(end_date)
-        df = df[df['Trddt'] <= end_date]
+        mask = chunk['Trddt'].notna()
+        if start is not None:
+            mask &= chunk['Trddt'] >= start
+        if end is not None:
+            mask &= chunk['Trddt'] <= end
+        if skip_paused:
+            mask &= chunk['Trdsta'] == 1
+        chunk = chunk[mask]
+        if fields is not None and skip_paused and 'Trdsta' not in fields:
+            chunk = chunk.drop(columns='Trdsta')
 
-    # 处理停牌数据
-    if skip_paused and 'Trdsta' in df.columns:
-        # 只保留正常交易的数据（Trdsta == 1）
-        df = df[df['Trdsta'] == 1]
+        if stats is not None:
+            stats.rows_kept += len(chunk)
+        if len(chunk):
+            yield chunk
 
+
+def get_price(security, start_date=None, end_date=None, frequency='daily', fields=None,
+              skip_paused=False, count=None, panel=True, fill_paused=True, chunksize=None):
+    """
+    获取历史数据，可查询多个标的多个数据字段，返回数据格式为 DataFrame
+    :param frequency: K线周期：'daily'、'weekly'、'monthly' 或 'Nd'（每 N 个交易日），
+                      周期K线由日线聚合，首次请求时构建并缓存，K线日期为周期内最后一个交易日
+    :param chunksize: 指定时不加载共享行情存储，而是按该块大小流式读取文件并下推过滤条件，
+                      扫描统计（ScanStats）记录在返回值的 attrs['scan_stats'] 中
+    """
     # 选择需要的字段
     available_fields = ['Stkcd', 'Trddt', 'Opnprc', 'Hiprc', 'Loprc', 'Clsprc',
                         'Trdsta', 'LimitDown', 'LimitUp', 'Dnshrtrd', 'Dsmvosd']
 
+    selected_fields = None
     if fields:
         # 检查字段是否有效
         invalid_fields = [f for f in fields if f not in available_fields]
@@ -88,18 +722,69 @@ def get_price(security, start_date=None, end_date=None, frequency='daily', field
             raise ValueError(f"无效的字段: {invalid_fields}，可用字段: {available_fields}")
 
         # 确保保留股票代码和日期
-        selected_fields = fields.copy()
+        selected_fields = list(fields)
         if 'Stkcd' not in selected_fields:
             selected_fields.insert(0, 'Stkcd')
         if 'Trddt' not in selected_fields:
             selected_fields.insert(1, 'Trddt')
 
-        df = df[selected_fields]
+    # 过滤股票代码
+    if isinstance(security, list):
+        # 多个股票代码
+        securities = [_normalize_security(s) for s in security]
+    else:
+        # 单个股票代码
+        securities = [_normalize_security(security)]
+
+    if chunksize:
+        if _parse_frequency(frequency) != '1d':
+            raise ValueError("流式读取（chunksize）只支持日线数据")
+        stats = ScanStats()
+        chunks = list(iter_price_chunks(securities=securities, start_date=start_date, end_date=end_date,
+                                        fields=selected_fields, skip_paused=skip_paused,
+                                        chunksize=chunksize, stats=stats))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=selected_fields or [])
+        if selected_fields:
+            df = df[selected_fields]
+        if 'Trddt' in df.columns:
+            # 与行情存储路径一致：按日期排序，同一日期的多只股票按 security 中的顺序排列（而不是文件中的顺序）
+            position = {code: i for i, code in enumerate(securities)}
+            df = df.iloc[np.lexsort((df['Stkcd'].map(position).to_numpy(), df['Trddt'].to_numpy()))]
+        return _finish_price_frame(df, count, panel, stats)
+
+    store = get_price_store().resample(frequency)
+    if selected_fields is None:
+        selected_fields = store.column_names
+
+    # 逐只股票二分定位日期区间
+    ranges = [store.locate(s, start_date, end_date) for s in securities]
+
+    # 处理停牌数据：只保留正常交易的数据（Trdsta == 1）
+    if skip_paused and 'Trdsta' in store.columns:
+        rows = np.concatenate([np.arange(lo, hi) for lo, hi in ranges]) if ranges else np.arange(0)
+        rows = rows[store.columns['Trdsta'][rows] == 1]
+    elif len(ranges) == 1:
+        lo, hi = ranges[0]
+        if count and count > 0:
+            lo = max(lo, hi - count)
+        rows = slice(lo, hi)
+    else:
+        # 每只股票最多贡献 count 条记录，合并后再整体截取
+        if count and count > 0:
+            ranges = [(max(lo, hi - count), hi) for lo, hi in ranges]
+        rows = np.concatenate([np.arange(lo, hi) for lo, hi in ranges]) if ranges else np.arange(0)
+
+    df = store.take(rows, selected_fields)
+
+    # 按日期排序（单只股票的切片本身已有序）
+    if len(securities) > 1 and 'Trddt' in df.columns:
+        df = df.sort_values('Trddt', kind='mergesort')
+
+    return _finish_price_frame(df, count, panel)
 
-    # 按日期排序
-    if 'Trddt' in df.columns:
-        df = df.sort_values('Trddt')
 
+def _finish_price_frame(df, count, panel, stats=None):
+    """get_price 的公共收尾：截取记录数、设置面板索引"""
     # 限制返回的记录数量
     if count and count > 0:
         df = df.tail(count)
@@ -108,72 +793,287 @@ def get_price(security, start_date=None, end_date=None, frequency='daily', field
     if panel and 'Stkcd' in df.columns and 'Trddt' in df.columns:
         df = df.set_index(['Stkcd', 'Trddt'])
 
+    if stats is not None:
+        df.attrs['scan_stats'] = stats
     return df
 
 
-# 在Data_Handling.py中添加以下函数（可放在get_price函数之后）
-def get_all_securities(date=None):
+def get_all_securities(date=None, chunksize=None, only_normal=False):
+    """
+    获取全部（或某一交易日有行情的）股票代码列表
+    :param chunksize: 指定时流式读取文件，只读取 Stkcd、Trddt（及 Trdsta）字段
+    :param only_normal: 只返回当日正常交易（Trdsta == 1）的股票，需同时指定 date
+    """
+    if chunksize:
+        codes = set()
+        for chunk in iter_price_chunks(start_date=date, end_date=date, fields=[], skip_paused=only_normal,
+                                       chunksize=chunksize):
+            codes.update(chunk['Stkcd'])
+        return sorted(codes)
+
+    store = get_price_store()
 
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"数据文件不存在: {file_path}")
+    # 按日期筛选：查预计算的成员位图
+    if date is not None:
+        return store.get_membership().securities_on(date, normal_only=only_normal).tolist()
 
-    # 读取CSV文件
-    df = pd.read_csv(file_path, dtype=str)
+    return store.securities.tolist()
 
-    # 处理日期列
-    if 'Trddt' in df.columns:
-        df['Trddt'] = pd.to_datetime(df['Trddt'].str.replace('"', ''))
 
-    # 处理股票代码
-    if 'Stkcd' in df.columns:
-        df['Stkcd'] = df['Stkcd'].str.replace('"', '').str.zfill(6)  # 统一6位代码格式
+# DataHandler 中使用的字段别名
+COLUMN_RENAMES = {'Clsprc': 'close', 'Opnprc': 'open', 'Hiprc': 'high', 'Loprc': 'low'}
+FIELD_ALIASES = {alias: name for name, alias in COLUMN_RENAMES.items()}
 
-    # 按日期筛选
-    if date is not None:
-        target_date = pd.to_datetime(date)
-        df = df[df['Trddt'] == target_date]
 
-    # 去重并返回股票代码列表
-    return df['Stkcd'].dropna().unique().tolist()
 class DataHandler:
-    def __init__(self, file_path):
+    def __init__(self, file_path, backend='frame', frequency='daily'):
+        """
+        :param file_path: 数据文件路径
+        :param backend: 'frame' 使用 pandas MultiIndex 数据；
+                        'panel' 使用内存映射的稠密面板，单日切片为零拷贝视图
+        :param frequency: K线周期：'daily'、'weekly'、'monthly' 或 'Nd'，非日线时由日线聚合（结果缓存复用）
+        """
+        if backend not in ('frame', 'panel'):
+            raise ValueError(f"无效的数据后端: {backend}，可选: 'frame', 'panel'")
         self.file_path = file_path
-        self.stock_data = self._load_data()
-        self.dates = pd.DatetimeIndex(self.stock_data.index.unique(level=0)).sort_values()
+        self.backend = backend
+        # 与 get_price / get_all_securities 共用同一份行情存储
+        self.price_store = get_price_store(file_path).resample(frequency)
+        self.frequency = self.price_store.frequency
+        self._resampled = {self.frequency: self}
+        set_data_file(file_path)
+        self.dates = pd.DatetimeIndex(self.price_store.dates)
+        self.securities = pd.Index(self.price_store.securities.astype(str), name='Stkcd')
+
+        self._stock_data = None
+        self._field_matrices = {}  # {字段: (交易日 × 股票) float64 矩阵}，供 BarData 使用
+        self.panel = None
+        if backend == 'panel':
+            self.panel = self.price_store.get_panel()
+        else:
+            self._stock_data = self._load_data()
+
+    @property
+    def stock_data(self):
+        """按 (Trddt, Stkcd) 索引的全部数据，面板后端下首次访问时才构建"""
+        if self._stock_data is None:
+            self._stock_data = self._load_data()
+        return self._stock_data
+
+    def resample(self, frequency):
+        """获取同一数据文件、同一后端的另一周期的 DataHandler（每个周期只创建一次）"""
+        key = _parse_frequency(frequency)
+        handler = self._resampled.get(key)
+        if handler is None:
+            handler = DataHandler(self.file_path, self.backend, key)
+            handler._resampled = self._resampled
+            self._resampled[key] = handler
+        return handler
 
     def get_previous_trading_day(self, current_date):
         """获取当前日期的上一个有效交易日"""
         current_date = pd.to_datetime(current_date)
-        # 获取所有小于当前日期的交易日并排序
-        previous_days = self.dates[self.dates < current_date]
-        if len(previous_days) == 0:
+        # 交易日已排序，二分查找第一个不小于当前日期的位置
+        pos = self.dates.searchsorted(current_date, side='left')
+        if pos == 0:
             return None  # 没有上一个交易日
-        return previous_days[-1]  # 返回最近的一个交易日
+        return self.dates[pos - 1]  # 返回最近的一个交易日
 
     def _load_data(self):
-        """加载并预处理CSV数据"""
-
-        df = pd.read_csv(self.file_path)
-        # 转换日期、统一股票代码为字符串（补前导零至6位）
-        df['Trddt'] = pd.to_datetime(df['Trddt'], errors='coerce')  # 强制转换，错误值设为NaT
-        # 新增：检查日期转换情况
-        invalid_dates = df['Trddt'].isna().sum()
-
-        df = df.dropna(subset=['Trddt'])  # 删除无效日期记录
-
-        df['Stkcd'] = df['Stkcd'].astype(str).str.zfill(6)
-        df.rename(columns={'Clsprc': 'close', 'Opnprc': 'open', 'Hiprc': 'high', 'Loprc': 'low'}, inplace=True)
+        """从共享行情存储构建按 (Trddt, Stkcd) 索引的数据"""
+        df = self.price_store.to_frame(self.price_store.date_order)
+        df.rename(columns=COLUMN_RENAMES, inplace=True)
         return df.set_index(['Trddt', 'Stkcd'])
+
     def get_stock_data(self):
         """回测引擎需要的：获取所有股票数据（用于提取日期列表）"""
         df = self.stock_data.reset_index()  # 此时列：Trddt, Stkcd, close, open...
         return df.set_index('Trddt')  # 单索引：Trddt（日期）
+
     def get_single_day_data(self, date):
         """回测引擎需要的：获取某一天所有股票的收盘价"""
         date = pd.to_datetime(date)
+        if self.panel is not None:
+            close = self.panel.get(date, 'Clsprc')
+            if close is None:
+                return pd.Series([np.nan], index=[None])  # 无数据日期返回NaN
+            # 面板后端：index 为全部股票，当日无行情的股票为 NaN
+            return pd.Series(close, index=self.securities, name='close', copy=False)
         if date not in self.stock_data.index.levels[0]:
             return pd.Series([np.nan], index=[None])  # 无数据日期返回NaN
         day_data = self.stock_data.loc[date]
         return day_data['close']  # 返回 Series：index=股票代码，value=收盘价
 
+    def get_day_array(self, date, field='close'):
+        """
+        获取某一天全部股票单个字段的数组，顺序与 self.securities 一致，无行情为 NaN
+        面板后端返回零拷贝视图；非交易日返回 None
+        """
+        name = FIELD_ALIASES.get(field, field)
+        if self.panel is not None:
+            return self.panel.get(date, name)
+        date = pd.to_datetime(date)
+        if date not in self.stock_data.index.levels[0]:
+            return None
+        day_data = self.stock_data.loc[date]
+        return day_data[COLUMN_RENAMES.get(name, name)].reindex(self.securities).to_numpy(dtype=float)
+
+    def get_day_values(self, date, field='close'):
+        """
+        获取某一天全部股票单个字段的 float64 数组（取自行情存储的原始值，不经过 float32 面板），
+        顺序与 self.securities 一致，无行情为 NaN；非交易日返回 None。用于成交价等需要精确价格的计算
+        """
+        name = FIELD_ALIASES.get(field, field)
+        store = self.price_store
+        lo, hi = store.locate_date(date)
+        if lo == hi:
+            return None
+        rows = store.date_order[lo:hi]
+        values = np.full(len(self.securities), np.nan)
+        values[store.grid_positions()[1][rows]] = store.columns[name][rows]
+        return values
+
+    def get_price_matrix(self, field='close', dates=None):
+        """
+        获取单个字段的 (交易日 × 股票) 矩阵（float64，无行情为 NaN），供向量化回测使用
+        :param dates: 可选的交易日子集（须为有效交易日）
+        """
+        name = FIELD_ALIASES.get(field, field)
+        values = self.price_store.field_matrix(name)
+        index = self.dates
+        if dates is not None:
+            rows = self.dates.get_indexer(pd.DatetimeIndex(dates))
+            values = values[rows]
+            index = pd.DatetimeIndex(dates)
+        return pd.DataFrame(values, index=index, columns=self.securities, copy=False)
+
+    def get_field_matrix(self, field='close', float64=False):
+        """
+        单个字段的 (交易日 × 股票) 数组，只构建一次：面板后端直接返回面板上的零拷贝视图（float32），
+        否则为缓存的 float64 矩阵；无行情为 NaN
+        :param float64: 为真时总是返回缓存的 float64 矩阵（取自行情存储，不经过 float32 面板）
+        """
+        name = FIELD_ALIASES.get(field, field)
+        if not float64 and self.panel is not None and name in self.panel.field_index:
+            return self.panel.field(name)
+        matrix = self._field_matrices.get(name)
+        if matrix is None:
+            matrix = self._field_matrices[name] = self.price_store.field_matrix(name)
+        return matrix
+
+
+# BarData 的字段名
+BAR_FIELDS = {'Open': 'Opnprc', 'High': 'Hiprc', 'Low': 'Loprc', 'Close': 'Clsprc', 'Volume': 'Dnshrtrd',
+              'Amount': 'Dnvaltrd'}
+
+
+class BarSeries:
+    """
+    单个字段截至当前K线的序列（float64），所有结果都是底层数组的视图或标量，不复制数据。索引约定：
+    - 整数：series[0] 为当前K线全部股票的一维数组，series[-k] 为 k 根K线之前，不能取正数（未来K线）
+    - 切片：作用于按时间从早到晚排列、以当前K线结尾的可回看窗口，返回 (K线, 股票) 的二维数组，
+      如 series[-5:] 为包括当前K线在内的最近 5 根K线，series[-5:-1] 为此前的 4 根K线
+    - 股票代码：series['000001'] 为单只股票当前K线的值
+    """
+    __slots__ = ('values', 'bar')
+
+    def __init__(self, values, bar):
+        self.values = values  # (交易日 × 股票) 数组
+        self.bar = bar
+
+    def __getitem__(self, key):
+        bar = self.bar
+        pos = bar.pos
+        if pos < 0:
+            raise IndexError("BarData 尚未定位到交易日")
+        if isinstance(key, str):
+            return self.values[pos, bar.security_index[key]]
+        if isinstance(key, slice):
+            return self.values[bar.start:pos + 1][key]
+        if key > 0 or pos + key < bar.start:
+            raise IndexError(f"超出可回看的K线范围: {key}")
+        return self.values[pos + key]
+
+    def __len__(self):
+        return max(0, self.bar.pos + 1 - self.bar.start)
+
+    @property
+    def current(self):
+        """当前K线全部股票的值"""
+        return self[0]
+
+    def history(self, security, count=None):
+        """单只股票最近 count 根K线（默认全部可回看的K线）的一维视图，最后一个元素为当前K线"""
+        bar = self.bar
+        lo = bar.start if count is None else max(bar.start, bar.pos + 1 - count)
+        return self.values[lo:bar.pos + 1, bar.security_index[security]]
+
+
+class BarData:
+    """
+    策略钩子使用的行情访问器：data.Close、data.Volume 等返回 BarSeries，按当前K线取值、切片回看
+    回测引擎每根K线只移动游标（seek），各字段的 BarSeries 在首次访问时创建并一直复用，
+    取值都是 DataHandler.get_field_matrix 的 float64 数组上的视图，逐根K线不分配新的对象
+    """
+    __slots__ = ('data_handler', 'dates', 'securities', 'security_index', 'lookback', 'pos', 'start', 'date',
+                 '_series')
+
+    def __init__(self, data_handler, lookback=None):
+        """
+        :param data_handler: 数据处理器
+        :param lookback: 最多可回看的K线数量（含当前K线），None 表示不限制
+        """
+        self.data_handler = data_handler
+        self.dates = data_handler.price_store.dates
+        self.securities = data_handler.securities
+        self.security_index = {str(code): i for i, code in enumerate(self.securities)}
+        self.lookback = lookback
+        self.pos = -1
+        self.start = 0
+        self.date = None
+        self._series = {}
+
+    def seek(self, date):
+        """把游标移到某一交易日，不是交易日时返回 False（游标不变）"""
+        target = _to_datetime64(date)
+        pos = int(np.searchsorted(self.dates, target))
+        if pos == len(self.dates) or self.dates[pos] != target:
+            return False
+        self.pos = pos
+        self.start = 0 if self.lookback is None else max(0, pos + 1 - self.lookback)
+        self.date = date
+        return True
+
+    def __getitem__(self, field):
+        """按字段名（BAR_FIELDS 中的名称或原始字段名，如 'Dsmvosd'）取 BarSeries"""
+        series = self._series.get(field)
+        if series is None:
+            name = BAR_FIELDS.get(field, field)
+            # 与成交价、估值同源的 float64 矩阵：panel 后端的 float32 面板只用于选股
+            series = BarSeries(self.data_handler.get_field_matrix(name, float64=True), self)
+            self._series[field] = series
+        return series
+
+    @property
+    def Open(self):
+        return self['Open']
+
+    @property
+    def High(self):
+        return self['High']
+
+    @property
+    def Low(self):
+        return self['Low']
+
+    @property
+    def Close(self):
+        return self['Close']
+
+    @property
+    def Volume(self):
+        return self['Volume']
 
+    @property
+    def Amount(self):
+        return self['Amount']
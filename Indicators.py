@@ -0,0 +1,477 @@
+import copy
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from Data_Handling import FIELD_ALIASES, _to_datetime64
+from Utilities import cache_stats
+
+
+class Indicator:
+    """
+    增量技术指标基类
+    状态按股票保存在数组中（顺序与 DataHandler.securities 一致），每根K线对全市场做一次数组更新，
+    每只股票的更新为 O(1)；当日无行情（NaN）的股票不更新，保留上一次的状态与数值
+    value 为全市场的指标数组，数据不足一个周期的股票为 NaN
+    """
+    recursive = False  # 数值依赖全部历史（而非固定窗口）的指标，预热时需回放全部历史
+
+    def __init__(self, period, field='close'):
+        if int(period) < 1:
+            raise ValueError(f"指标周期必须为正整数: {period}")
+        self.period = int(period)
+        self.fields = (field,)
+        self.count = None  # 每只股票已更新的K线数量
+        self.value = None
+        self.security_index = {}
+
+    @property
+    def warmup(self):
+        """得到第一个有效值所需的K线数量"""
+        return self.period
+
+    def bind(self, securities):
+        """按股票列表分配状态数组"""
+        n = len(securities)
+        self.security_index = {str(code): i for i, code in enumerate(securities)}
+        self.count = np.zeros(n, dtype=np.int64)
+        self.value = np.full(n, np.nan)
+        self._allocate(n)
+        return self
+
+    def _allocate(self, n):
+        pass
+
+    def update(self, *arrays):
+        """
+        用当日全市场数据更新指标
+        :param arrays: 与 fields 一一对应的当日数组
+        """
+        valid = ~np.isnan(arrays[0])
+        for values in arrays[1:]:
+            valid &= ~np.isnan(values)
+        cols = np.flatnonzero(valid)
+        if len(cols):
+            self._update(cols, *(values[cols] for values in arrays))
+            self.count[cols] += 1
+
+    def _update(self, cols, *values):
+        raise NotImplementedError
+
+    def ready(self):
+        """已有有效值的股票（布尔数组）"""
+        return ~np.isnan(self.value)
+
+    def get(self, security):
+        """单只股票的当前指标值，未知股票返回 NaN"""
+        i = self.security_index.get(str(security))
+        return np.nan if i is None else float(self.value[i])
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.period}, {', '.join(self.fields)})"
+
+
+class SMA(Indicator):
+    """简单移动平均：环形缓冲区保存最近 period 个值，维护滚动和"""
+    RESYNC_INTERVAL = 1024  # 每隔若干次更新用缓冲区重新求和，消除浮点累积误差
+
+    def _allocate(self, n):
+        self._buffer = np.zeros((self.period, n))
+        self._sum = np.zeros(n)
+        self._updates = 0
+
+    def _update(self, cols, values):
+        count = self.count[cols]
+        slot = count % self.period
+        old = self._buffer[slot, cols]
+        self._buffer[slot, cols] = values
+        self._sum[cols] += values - old
+        self._updates += 1
+        if self._updates % self.RESYNC_INTERVAL == 0:
+            self._sum = self._buffer.sum(axis=0)
+        self.value[cols] = np.where(count + 1 >= self.period, self._sum[cols] / self.period, np.nan)
+
+
+class EMA(Indicator):
+    """
+    指数移动平均：alpha = 2 / (period + 1)，以首个值为初值
+    无停牌时与 pandas 的 ewm(span=period, adjust=False, min_periods=period) 一致
+    """
+    recursive = True
+
+    def _allocate(self, n):
+        self.alpha = 2.0 / (self.period + 1)
+        self._ema = np.zeros(n)
+
+    def _update(self, cols, values):
+        count = self.count[cols]
+        previous = self._ema[cols]
+        ema = np.where(count == 0, values, previous + self.alpha * (values - previous))
+        self._ema[cols] = ema
+        self.value[cols] = np.where(count + 1 >= self.period, ema, np.nan)
+
+
+def _wilder(average, values, n, period):
+    """
+    Wilder 平滑：前 period 个值取简单平均，之后 average = (average * (period - 1) + value) / period
+    :param n: 本次是第几个值（从 1 开始，0 表示没有新值）
+    """
+    seeding = (n >= 1) & (n <= period)
+    smoothed = (average * (period - 1) + values) / period
+    return np.where(seeding, average + values / period, np.where(n > period, smoothed, average))
+
+
+class RSI(Indicator):
+    """相对强弱指标（Wilder 平滑），需要 period + 1 根K线"""
+    recursive = True
+
+    @property
+    def warmup(self):
+        return self.period + 1
+
+    def _allocate(self, n):
+        self._previous = np.zeros(n)
+        self._avg_gain = np.zeros(n)
+        self._avg_loss = np.zeros(n)
+
+    def _update(self, cols, values):
+        n = self.count[cols]  # 价格变动的序号：第 n 根K线带来第 n 个变动
+        change = np.where(n > 0, values - self._previous[cols], 0.0)
+        self._previous[cols] = values
+        avg_gain = _wilder(self._avg_gain[cols], np.maximum(change, 0), n, self.period)
+        avg_loss = _wilder(self._avg_loss[cols], np.maximum(-change, 0), n, self.period)
+        self._avg_gain[cols] = avg_gain
+        self._avg_loss[cols] = avg_loss
+
+        # 无下跌时 RSI 为 100，无涨跌时为 50
+        rs = np.divide(avg_gain, avg_loss, out=np.full(len(cols), np.inf), where=avg_loss > 0)
+        rsi = np.where(avg_loss > 0, 100 - 100 / (1 + rs), np.where(avg_gain > 0, 100.0, 50.0))
+        self.value[cols] = np.where(n >= self.period, rsi, np.nan)
+
+
+class ATR(Indicator):
+    """平均真实波幅（Wilder 平滑）；首根K线的真实波幅为最高价减最低价"""
+    recursive = True
+
+    def __init__(self, period=14):
+        super().__init__(period)
+        self.fields = ('high', 'low', 'close')
+
+    def _allocate(self, n):
+        self._previous_close = np.zeros(n)
+        self._atr = np.zeros(n)
+
+    def _update(self, cols, high, low, close):
+        count = self.count[cols]
+        previous_close = self._previous_close[cols]
+        true_range = np.where(
+            count > 0,
+            np.maximum(high - low, np.maximum(np.abs(high - previous_close), np.abs(low - previous_close))),
+            high - low
+        )
+        self._previous_close[cols] = close
+        atr = _wilder(self._atr[cols], true_range, count + 1, self.period)
+        self._atr[cols] = atr
+        self.value[cols] = np.where(count + 1 >= self.period, atr, np.nan)
+
+
+class _RollingExtreme(Indicator):
+    """滚动极值：环形缓冲区 + 当前极值，只有移出窗口的值恰为当前极值时才重新扫描该股票的窗口"""
+    _combine = None
+    _reduce = None
+
+    def _allocate(self, n):
+        self._buffer = np.full((self.period, n), np.nan)
+        self._extreme = np.full(n, np.nan)
+
+    def _update(self, cols, values):
+        count = self.count[cols]
+        slot = count % self.period
+        old = self._buffer[slot, cols]
+        self._buffer[slot, cols] = values
+        current = self._extreme[cols]
+        extreme = type(self)._combine(current, values)
+        stale = old == current  # 窗口未满时 old 为 NaN，不会触发重新扫描
+        if stale.any():
+            extreme[stale] = type(self)._reduce(self._buffer[:, cols[stale]], axis=0)
+        self._extreme[cols] = extreme
+        self.value[cols] = np.where(count + 1 >= self.period, extreme, np.nan)
+
+
+class RollingMax(_RollingExtreme):
+    """最近 period 根K线的最大值"""
+    _combine = np.fmax
+    _reduce = np.max
+
+
+class RollingMin(_RollingExtreme):
+    """最近 period 根K线的最小值"""
+    _combine = np.fmin
+    _reduce = np.min
+
+
+def compute_indicator(indicator, store, out=None):
+    """
+    在整个行情存储上逐日回放增量更新，得到 (交易日, 股票) 的指标矩阵
+    每个交易日是一次全市场的数组运算，结果与事件驱动模式下逐日更新的数值一致
+    :param indicator: 指标（只使用其类型与参数，不改变它的状态）
+    :param store: PriceStore
+    :param out: 可选的输出数组（如内存映射文件）
+    """
+    matrices = [store.field_matrix(FIELD_ALIASES.get(field, field)) for field in indicator.fields]
+    replica = copy.copy(indicator).bind(store.securities)
+    if out is None:
+        out = np.empty((len(store.dates), len(store.securities)))
+    for t in range(len(store.dates)):
+        replica.update(*(values[t] for values in matrices))
+        out[t] = replica.value
+    return out
+
+
+class IndicatorCache:
+    """
+    指标矩阵缓存：同一份数据上的同一指标（类型、周期、字段）只计算一次
+    以 (指标, 参数, 数据版本) 为键；有行情缓存目录时矩阵写入 <缓存目录>/indicators 并以内存映射打开，
+    参数扫描中的各工作进程共享同一份物理内存
+    内存中的矩阵与磁盘上的文件均按最近最少使用（LRU）淘汰，总大小不超过 max_bytes
+    """
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # {键: 指标矩阵}
+        self._bytes = 0
+        self.stats = cache_stats('indicator')
+
+    @staticmethod
+    def key(indicator, store):
+        """缓存键：没有数据版本（未使用二进制缓存）时以存储对象本身区分"""
+        version = store.version or f"store-{id(store)}"
+        return type(indicator).__name__, indicator.period, tuple(indicator.fields), version
+
+    def get(self, indicator, store):
+        """获取指标矩阵，未命中时计算并缓存"""
+        key = self.key(indicator, store)
+        values = self._entries.get(key)
+        if values is not None:
+            self._entries.move_to_end(key)
+            self.stats.hit()
+            return values
+
+        path = self._path(key, store)
+        shape = (len(store.dates), len(store.securities))
+        values = None
+        if path is not None and os.path.exists(path):
+            values = np.load(path, mmap_mode='r')
+            if values.shape == shape:
+                os.utime(path)  # 记录最近使用时间，供磁盘淘汰参考
+                self.stats.hit()
+            else:
+                values = None
+        if values is None:
+            self.stats.miss()
+            values = self._compute(indicator, store, path, shape)
+
+        self._entries[key] = values
+        self._bytes += values.nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return values
+
+    def _path(self, key, store):
+        if store.cache_dir is None or store.version is None:
+            return None
+        tag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(store.cache_dir, 'indicators', f"{key[0]}-{tag}.npy")
+
+    def _compute(self, indicator, store, path, shape):
+        if path is None:
+            return compute_indicator(indicator, store)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=shape)
+        except OSError:
+            # 缓存目录不可写时只在内存中缓存
+            return compute_indicator(indicator, store)
+        compute_indicator(indicator, store, out)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+        self._prune(directory, keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def _prune(self, directory, keep):
+        """按最近使用时间删除最旧的矩阵文件，直到目录总大小不超过 max_bytes"""
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.npy') and '.tmp-' not in name:
+                stat = os.stat(path)
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)  # 已映射该文件的进程仍可继续读取
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """清空内存中的矩阵（磁盘文件保留）"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_indicator_cache = None  # 进程内共享的指标缓存
+
+
+def get_indicator_cache():
+    """获取进程内共享的指标缓存"""
+    global _indicator_cache
+    if _indicator_cache is None:
+        _indicator_cache = IndicatorCache()
+    return _indicator_cache
+
+
+def _last_valid_bars(matrices, end, window):
+    """
+    每只股票在第 end 行之前最近 window 根各字段均有行情的K线，下对齐为 (window × 股票) 的数组，不足处为 NaN
+    最近 window 行内无停牌的股票直接切片，其余股票逐只向前查找
+    :param matrices: 各字段的 (交易日 × 股票) 矩阵
+    """
+    lo = max(end - window, 0)
+    bars = [np.full((window, values.shape[1]), np.nan) for values in matrices]
+    for values, out in zip(matrices, bars):
+        out[window - (end - lo):] = values[lo:end]
+    if lo == 0:
+        return bars  # 全部历史都在窗口内
+    valid = np.ones((end - lo, matrices[0].shape[1]), dtype=bool)
+    for values in matrices:
+        valid &= ~np.isnan(values[lo:end])
+    for col in np.flatnonzero(~valid.all(axis=0)):
+        column_valid = np.ones(end, dtype=bool)
+        for values in matrices:
+            column_valid &= ~np.isnan(values[:end, col])
+        rows = np.flatnonzero(column_valid)[-window:]
+        for values, out in zip(matrices, bars):
+            out[:, col] = np.nan
+            out[window - len(rows):, col] = values[rows, col]
+    return bars
+
+
+class IndicatorSet:
+    """
+    策略声明的指标集合，由回测引擎在每个交易日开盘前（策略钩子之前）用当日数据更新
+    策略在 initialize 中通过 context['indicators'].add(name, indicator) 声明指标
+    指定 cache 时指标矩阵从 IndicatorCache 获取，每日只需取出对应行（零拷贝），不再增量计算
+    仅事件驱动模式会更新；向量化模式的策略直接对价格矩阵做运算
+    """
+    def __init__(self, data_handler, cache=None):
+        self.data_handler = data_handler
+        self.cache = cache
+        self.securities = data_handler.securities
+        self.security_index = {str(code): i for i, code in enumerate(self.securities)}
+        self._indicators = {}
+        self._matrices = {}  # {名称: 缓存的指标矩阵}
+
+    def add(self, name, indicator):
+        """声明指标并返回它；同名指标会被替换"""
+        self._indicators[name] = indicator.bind(self.securities)
+        self._matrices.pop(name, None)
+        if self.cache is not None:
+            self._matrices[name] = self.cache.get(indicator, self.data_handler.price_store)
+        return indicator
+
+    def __getitem__(self, name):
+        return self._indicators[name]
+
+    def __contains__(self, name):
+        return name in self._indicators
+
+    def __len__(self):
+        return len(self._indicators)
+
+    def __iter__(self):
+        return iter(self._indicators.items())
+
+    def position(self, security):
+        """股票在指标数组中的位置，未知股票返回 None"""
+        return self.security_index.get(str(security))
+
+    def _incremental(self):
+        return [indicator for name, indicator in self._indicators.items() if name not in self._matrices]
+
+    @property
+    def warmup(self):
+        """需要增量更新的指标得到有效值所需的最多K线数量"""
+        return max((indicator.warmup for indicator in self._incremental()), default=0)
+
+    def warmup_dates(self, dates, start_date):
+        """
+        预热需要逐日回放的交易日：有递归型指标（EMA、RSI、ATR）时为 start_date 之前的全部历史，否则为空
+        （固定窗口的指标由 warm_up_windows 直接用各股票最近的有效K线预热）
+        """
+        incremental = self._incremental()
+        if not any(indicator.recursive for indicator in incremental):
+            return dates[:0]
+        return dates[dates < start_date]
+
+    def warm_up_windows(self, start_date):
+        """
+        只有固定窗口指标时，用每只股票在 start_date 之前最近 warmup 根有行情的K线预热
+        停牌日不计入窗口：最近 warmup 个交易日内有停牌的股票向前多取，结果与在全部历史上逐日更新（IndicatorCache）一致
+        """
+        incremental = self._incremental()
+        if not incremental or any(indicator.recursive for indicator in incremental):
+            return
+        store = self.data_handler.price_store
+        end = int(np.searchsorted(store.dates, _to_datetime64(start_date)))
+        if end == 0:
+            return
+        groups = {}
+        for indicator in incremental:
+            groups.setdefault(indicator.fields, []).append(indicator)
+        for fields, indicators in groups.items():
+            window = max(indicator.warmup for indicator in indicators)
+            matrices = [store.field_matrix(FIELD_ALIASES.get(field, field)) for field in fields]
+            bars = _last_valid_bars(matrices, end, window)
+            for row in range(window):
+                for indicator in indicators:
+                    indicator.update(*(values[row] for values in bars))
+
+    def warm_up(self, dates, start_date):
+        """在 start_date 之前的交易日上预热需要增量更新的指标，使指标在回测首日即可用"""
+        for date in self.warmup_dates(dates, start_date):
+            self.update(date)
+        self.warm_up_windows(start_date)
+
+    def update(self, date):
+        """用某一交易日的数据更新全部指标，同一字段只读取一次"""
+        if not self._indicators:
+            return
+        if self._matrices:
+            dates = self.data_handler.price_store.dates
+            target = _to_datetime64(date)
+            pos = int(np.searchsorted(dates, target))
+            if pos == len(dates) or dates[pos] != target:
+                return  # 非交易日
+            for name, values in self._matrices.items():
+                self._indicators[name].value = values[pos]
+        arrays = {}
+        for indicator in self._incremental():
+            for field in indicator.fields:
+                if field not in arrays:
+                    arrays[field] = self.data_handler.get_day_values(date, field)  # float64，与指标缓存同源
+                    if arrays[field] is None:
+                        return  # 非交易日
+            indicator.update(*(arrays[field] for field in indicator.fields))
@@ -0,0 +1,404 @@
+import itertools
+import contextlib
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Data_Handling import get_price_store
+from Backtest_Engine import Account, init_worker, run_backtest_job
+from Performance_Analysis import PerformanceAnalysis
+
+
+def expand_grid(param_grid):
+    """
+    将参数网格展开为参数字典列表
+    按键的声明顺序做笛卡尔积，展开顺序固定，保证结果可复现
+    :param param_grid: {参数名: 候选值列表}
+    """
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[key] for key in keys))]
+
+
+def _prepare_data(file_path, backend):
+    """在主进程中预先编译二进制缓存（及面板），工作进程只做内存映射，不重复解析 CSV"""
+    store = get_price_store(file_path)
+    if backend == 'panel':
+        store.get_panel()
+    return store
+
+
+class _SerialExecutor:
+    """在当前进程中顺序执行任务，n_jobs 为 1 时代替进程池"""
+    n_jobs = 1
+
+    def map(self, fn, iterable, chunksize=1):
+        return map(fn, iterable)
+
+
+@contextlib.contextmanager
+def open_pool(file_path, n_jobs=None, backend='panel'):
+    """
+    打开可在多轮任务间复用的进程池
+    :param n_jobs: 进程数，默认使用全部 CPU；为 1 时在当前进程中顺序执行
+    """
+    _prepare_data(file_path, backend)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1:
+        init_worker(file_path, backend)
+        yield _SerialExecutor()
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker,
+                             initargs=(file_path, backend)) as executor:
+        executor.n_jobs = n_jobs
+        yield executor
+
+
+def run_jobs(file_path, jobs, n_jobs=None, backend='panel', executor=None):
+    """
+    在进程池中执行回测任务
+    :param file_path: 数据文件路径
+    :param jobs: run_backtest_job 接受的任务字典列表
+    :param n_jobs: 进程数，默认使用全部 CPU；为 1 时在当前进程中顺序执行
+    :param backend: 工作进程中 DataHandler 使用的数据后端
+    :param executor: open_pool 打开的进程池，为空时临时创建
+    :return: 与 jobs 顺序一致的绩效指标字典列表（与进程数无关）
+    """
+    if executor is None:
+        with open_pool(file_path, 1 if len(jobs) <= 1 else n_jobs, backend) as pool:
+            return run_jobs(file_path, jobs, executor=pool)
+
+    # 每个进程分到若干批任务，减少进程间通信次数
+    chunksize = max(1, len(jobs) // (executor.n_jobs * 4))
+    return list(executor.map(run_backtest_job, jobs, chunksize=chunksize))
+
+
+def _make_jobs(strategy_class, params_list, start_date, end_date, initial_cash, mode, **options):
+    """每组参数一个 run_backtest_job 任务字典，各搜索方法共用"""
+    return [{
+        'strategy_class': strategy_class,
+        'params': params,
+        'start_date': start_date,
+        'end_date': end_date,
+        'initial_cash': initial_cash,
+        'mode': mode,
+        **options,
+    } for params in params_list]
+
+
+def _results_table(params_list, results, sort_by=None):
+    """参数与绩效指标合并为结果表（参数列在前）；sort_by 不为空时按该指标稳定降序排列"""
+    table = pd.DataFrame([{**params, **result} for params, result in zip(params_list, results)])
+    if sort_by:
+        table = table.sort_values(sort_by, ascending=False, kind='mergesort').reset_index(drop=True)
+    return table
+
+
+def grid_search(file_path, strategy_class, param_grid, start_date=None, end_date=None, initial_cash=100000,
+                mode='event', n_jobs=None, backend='panel', sort_by=None):
+    """
+    网格搜索：对参数网格中的每组参数运行一次回测
+    :param file_path: 数据文件路径
+    :param strategy_class: 策略类（须定义在可导入的模块中，才能传给工作进程）
+    :param param_grid: {参数名: 候选值列表}，参数以关键字参数传给策略类构造函数
+    :param start_date: 回测开始日期
+    :param end_date: 回测结束日期
+    :param initial_cash: 初始资金
+    :param mode: 回测模式，'event' 或 'vector'
+    :param n_jobs: 进程数
+    :param backend: 数据后端
+    :param sort_by: 按该绩效指标降序排列结果
+    :return: DataFrame，每行一组参数，列为参数与 PerformanceAnalysis 绩效指标
+    """
+    params_list = expand_grid(param_grid)
+    jobs = _make_jobs(strategy_class, params_list, start_date, end_date, initial_cash, mode)
+    results = run_jobs(file_path, jobs, n_jobs=n_jobs, backend=backend)
+    return _results_table(params_list, results, sort_by)
+
+
+def sample_params(param_distributions, n_iter, seed=0):
+    """
+    从参数分布中随机抽样
+    :param param_distributions: {参数名: 候选值列表（等概率抽取）| callable(rng) | 带 rvs(random_state=...) 的分布对象}
+    :param n_iter: 抽样组数
+    :param seed: 随机种子，相同种子得到相同的参数序列
+    """
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(n_iter):
+        params = {}
+        for name, dist in param_distributions.items():
+            if hasattr(dist, 'rvs'):
+                params[name] = dist.rvs(random_state=rng)
+            elif callable(dist):
+                params[name] = dist(rng)
+            else:
+                params[name] = dist[rng.integers(len(dist))]
+        samples.append(params)
+    return samples
+
+
+def random_search(file_path, strategy_class, param_distributions, n_iter=20, start_date=None, end_date=None,
+                  initial_cash=100000, mode='event', n_jobs=None, backend='panel', seed=0, sort_by=None):
+    """
+    随机搜索：从参数分布中抽取 n_iter 组参数，在完整区间上回测
+    参数含义同 grid_search，param_distributions 的格式见 sample_params
+    """
+    params_list = sample_params(param_distributions, n_iter, seed)
+    jobs = _make_jobs(strategy_class, params_list, start_date, end_date, initial_cash, mode)
+    results = run_jobs(file_path, jobs, n_jobs=n_jobs, backend=backend)
+    return _results_table(params_list, results, sort_by)
+
+
+def _trade_dates(file_path, start_date, end_date):
+    """数据文件在 [start_date, end_date] 内的交易日"""
+    dates = pd.DatetimeIndex(get_price_store(file_path).dates)
+    if start_date is not None:
+        dates = dates[dates >= pd.to_datetime(start_date)]
+    if end_date is not None:
+        dates = dates[dates <= pd.to_datetime(end_date)]
+    if len(dates) == 0:
+        raise ValueError("没有找到符合条件的交易日期，请检查日期范围是否在数据范围内")
+    return dates
+
+
+def _rung_lengths(total_days, min_days, eta):
+    """各轮回测窗口长度（交易日数）：min_days, min_days*eta, ...，最后一轮为完整区间"""
+    lengths = []
+    length = min(min_days, total_days)
+    while length < total_days:
+        lengths.append(length)
+        length *= eta
+    lengths.append(total_days)
+    return lengths
+
+
+def successive_halving(file_path, strategy_class, param_distributions, n_candidates=None, start_date=None,
+                       end_date=None, min_days=20, eta=3, budget=None, metric='sharpe_ratio', initial_cash=100000,
+                       mode='event', n_jobs=None, backend='panel', seed=0, params_list=None, executor=None):
+    """
+    逐次减半搜索：先在较短的区间上评估全部候选参数，只把排名前 1/eta 的候选晋级到 eta 倍长的区间，
+    直到最后一轮在完整区间上回测；每一轮的回测区间都从 start_date 开始
+    :param n_candidates: 首轮候选数量
+    :param min_days: 首轮回测窗口的交易日数
+    :param eta: 每轮淘汰比例与窗口增长倍数
+    :param budget: 计算预算（全部回测的交易日总数）；给定且未指定 n_candidates 时据此确定首轮候选数量
+    :param metric: 排名使用的绩效指标（越大越好，NaN 视为最差）
+    :param params_list: 直接指定的候选参数列表（此时忽略 param_distributions 与 n_candidates）
+    :param executor: open_pool 打开的进程池，用于在多次调用间复用
+    :return: 全部评估记录的 DataFrame，列包括 candidate、rung、days、参数与绩效指标；
+             按轮次、指标降序排列，最后一轮的第一行即为最优参数
+    """
+    dates = _trade_dates(file_path, start_date, end_date)
+    lengths = _rung_lengths(len(dates), min_days, eta)
+
+    if params_list is None:
+        if n_candidates is None:
+            if budget is None:
+                n_candidates = eta ** (len(lengths) - 1)
+            else:
+                # 每轮的消耗约为 首轮候选数 × min_days，总预算平均分给各轮
+                n_candidates = max(1, int(budget // (lengths[0] * len(lengths))))
+        params_list = sample_params(param_distributions, n_candidates, seed)
+
+    if executor is None:
+        with open_pool(file_path, n_jobs, backend) as pool:
+            return successive_halving(file_path, strategy_class, None, start_date=start_date, end_date=end_date,
+                                      min_days=min_days, eta=eta, metric=metric, initial_cash=initial_cash,
+                                      mode=mode, n_jobs=n_jobs, backend=backend, params_list=params_list,
+                                      executor=pool)
+
+    records = []
+    survivors = list(range(len(params_list)))
+    for rung, length in enumerate(lengths):
+        window_end = dates[length - 1]
+        jobs = _make_jobs(strategy_class, [params_list[i] for i in survivors], dates[0], window_end,
+                          initial_cash, mode)
+        results = run_jobs(file_path, jobs, executor=executor)
+        scores = []
+        for i, result in zip(survivors, results):
+            records.append({'candidate': i, 'rung': rung, 'days': length, 'end_date': window_end,
+                            **params_list[i], **result})
+            score = result.get(metric, np.nan)
+            scores.append(-np.inf if score is None or np.isnan(score) else score)
+
+        if rung == len(lengths) - 1:
+            break
+        # 稳定排序：分数相同时按候选编号，结果与进程数无关
+        order = np.argsort(-np.asarray(scores, dtype=float), kind='stable')
+        keep = max(1, math.ceil(len(survivors) / eta))
+        survivors = [survivors[j] for j in order[:keep]]
+
+    history = pd.DataFrame(records)
+    history = history.sort_values(['rung', metric], ascending=[True, False], kind='mergesort',
+                                  na_position='last')
+    return history.reset_index(drop=True)
+
+
+def hyperband(file_path, strategy_class, param_distributions, start_date=None, end_date=None, min_days=20, eta=3,
+              metric='sharpe_ratio', initial_cash=100000, mode='event', n_jobs=None, backend='panel', seed=0):
+    """
+    Hyperband：以不同的"候选数量 / 首轮窗口长度"组合运行多组逐次减半，
+    避免单一首轮窗口过短而误淘汰需要较长区间才能体现优势的参数
+    :return: 全部评估记录，新增 bracket 列；按 bracket、rung、指标排列
+    """
+    dates = _trade_dates(file_path, start_date, end_date)
+    s_max = len(_rung_lengths(len(dates), min_days, eta)) - 1
+
+    histories = []
+    with open_pool(file_path, n_jobs, backend) as pool:
+        for bracket, s in enumerate(range(s_max, -1, -1)):
+            n_candidates = math.ceil((s_max + 1) / (s + 1) * eta ** s)
+            bracket_min_days = max(1, len(dates) // eta ** s) if s < s_max else min_days
+            history = successive_halving(file_path, strategy_class, param_distributions,
+                                         n_candidates=n_candidates, start_date=start_date, end_date=end_date,
+                                         min_days=bracket_min_days, eta=eta, metric=metric,
+                                         initial_cash=initial_cash, mode=mode, backend=backend,
+                                         seed=seed + bracket, executor=pool)
+            history.insert(0, 'bracket', bracket)
+            histories.append(history)
+    return pd.concat(histories, ignore_index=True)
+
+
+def walk_forward_windows(dates, train_days, test_days, step_days=None, anchored=False):
+    """
+    划分滚动的样本内（训练）/样本外（测试）窗口
+    :param dates: 交易日序列
+    :param train_days: 训练窗口交易日数
+    :param test_days: 测试窗口交易日数（最后一个测试窗口可能不足）
+    :param step_days: 相邻窗口的间隔交易日数，默认等于 test_days，即测试窗口首尾相接；
+                      不能小于 test_days（测试窗口重叠时衔接净值会把重叠区间的收益计算两次）
+    :param anchored: 为真时训练窗口始终从第一个交易日开始（扩展窗口）
+    :return: [(train_start, train_end, test_start, test_end), ...]
+    """
+    dates = pd.DatetimeIndex(dates)
+    if step_days is None:
+        step_days = test_days
+    if train_days < 1 or test_days < 1 or step_days < 1:
+        raise ValueError("训练窗口、测试窗口与步长必须为正整数")
+    if step_days < test_days:
+        raise ValueError(f"步长（{step_days}）不能小于测试窗口（{test_days}），否则测试窗口重叠")
+    windows = []
+    offset = 0
+    while offset + train_days < len(dates):
+        train_start = 0 if anchored else offset
+        test_start = offset + train_days
+        test_end = min(test_start + test_days, len(dates))
+        windows.append((dates[train_start], dates[test_start - 1], dates[test_start], dates[test_end - 1]))
+        offset += step_days
+    if not windows:
+        raise ValueError(f"交易日数量（{len(dates)}）不足以划分训练窗口（{train_days}）与测试窗口")
+    return windows
+
+
+def stitch_equity(curves, initial_cash):
+    """
+    衔接各测试窗口的净值曲线：每个窗口都以 initial_cash 独立回测，按窗口收益率复利衔接，
+    后一窗口从前一窗口的期末总资产开始
+    :param curves: 按时间顺序排列的每日总资产 Series 列表
+    """
+    stitched = []
+    level = initial_cash
+    for curve in curves:
+        curve = curve * (level / initial_cash)
+        level = curve.iloc[-1]
+        stitched.append(curve)
+    return pd.concat(stitched)
+
+
+def walk_forward(file_path, strategy_class, param_grid=None, param_distributions=None, n_iter=20, train_days=250,
+                 test_days=60, step_days=None, anchored=False, start_date=None, end_date=None,
+                 metric='sharpe_ratio', initial_cash=100000, mode='event', n_jobs=None, backend='panel', seed=0,
+                 cost_model=None):
+    """
+    滚动前推分析：在每个训练窗口上优化参数，用最优参数回测紧随其后的测试窗口，再把各测试窗口的净值衔接起来
+    全部窗口的样本内优化放在同一个进程池中并行执行，工作进程只加载一次数据，在所有窗口间复用
+    :param param_grid: 参数网格（网格搜索），与 param_distributions 二选一
+    :param param_distributions: 参数分布（随机搜索，抽取 n_iter 组，所有窗口使用同一组候选）
+    :param train_days: 训练窗口交易日数
+    :param test_days: 测试窗口交易日数
+    :param step_days: 相邻窗口的间隔交易日数，默认等于 test_days，不能小于 test_days
+    :param anchored: 为真时训练窗口始终从 start_date 开始
+    :param metric: 选择参数使用的绩效指标（越大越好，NaN 视为最差）
+    :param cost_model: 交易成本模型（CostModel）
+    其余参数含义同 grid_search
+    :return: 字典：
+             windows —— 每个窗口一行：窗口起止日期、最优参数、样本内指标（is_ 前缀）与样本外绩效指标；
+             in_sample —— 全部样本内回测记录；
+             equity —— 衔接后的样本外每日总资产 Series；
+             summary —— 衔接后样本外区间的绩效指标
+    """
+    if (param_grid is None) == (param_distributions is None):
+        raise ValueError("param_grid 与 param_distributions 须且只能指定一个")
+    params_list = expand_grid(param_grid) if param_grid is not None else \
+        sample_params(param_distributions, n_iter, seed)
+    dates = _trade_dates(file_path, start_date, end_date)
+    windows = walk_forward_windows(dates, train_days, test_days, step_days, anchored)
+
+    with open_pool(file_path, n_jobs, backend) as pool:
+        # 全部窗口 × 全部候选参数一次性提交，进程池在窗口之间也能并行
+        jobs = []
+        for train_start, train_end, _, _ in windows:
+            jobs.extend(_make_jobs(strategy_class, params_list, train_start, train_end, initial_cash, mode,
+                                   cost_model=cost_model))
+        results = run_jobs(file_path, jobs, executor=pool)
+
+        records, best_params = [], []
+        for w, (train_start, train_end, test_start, test_end) in enumerate(windows):
+            window_results = results[w * len(params_list):(w + 1) * len(params_list)]
+            scores = []
+            for candidate, (params, result) in enumerate(zip(params_list, window_results)):
+                records.append({'window': w, 'candidate': candidate, 'train_start': train_start,
+                                'train_end': train_end, **params, **result})
+                score = result.get(metric, np.nan)
+                scores.append(-np.inf if score is None or np.isnan(score) else score)
+            # 稳定排序：分数相同时取候选编号较小者，结果与进程数无关
+            best = int(np.argsort(-np.asarray(scores, dtype=float), kind='stable')[0])
+            best_params.append((best, window_results[best]))
+
+        jobs = [_make_jobs(strategy_class, [params_list[best]], test_start, test_end, initial_cash, mode,
+                           cost_model=cost_model, details=True)[0]
+                for (best, _), (_, _, test_start, test_end) in zip(best_params, windows)]
+        out_of_sample = run_jobs(file_path, jobs, executor=pool)
+
+    rows = []
+    for w, ((best, is_result), result) in enumerate(zip(best_params, out_of_sample)):
+        train_start, train_end, test_start, test_end = windows[w]
+        rows.append({'window': w, 'train_start': train_start, 'train_end': train_end, 'test_start': test_start,
+                     'test_end': test_end, 'candidate': best, **params_list[best],
+                     **{f'is_{key}': value for key, value in is_result.items()},
+                     **{key: value for key, value in result.items() if key not in ('equity', 'trades')}})
+
+    # 衔接后的样本外区间按一个账户计算绩效
+    equity = stitch_equity([result['equity'] for result in out_of_sample], initial_cash)
+    account = Account(initial_cash)
+    account.total_assets = equity.tolist()
+    account.dates = list(equity.index)
+    # 成交记录按日期排序后写入（TradeLedger 要求按日期追加）
+    trades = pd.concat([result['trades'] for result in out_of_sample], ignore_index=True)
+    trades = trades.sort_values('date', kind='stable')
+    account.trade_history.extend(trades['date'], trades['stock_code'].astype(str), trades['action'].astype(str),
+                                 trades['price'], trades['amount'], trades['cost'], trades['revenue'])
+    return {
+        'windows': pd.DataFrame(rows),
+        'in_sample': pd.DataFrame(records),
+        'equity': equity,
+        'summary': PerformanceAnalysis(account).get_summary(),
+    }
+
+
+if __name__ == '__main__':
+    from Strategy_Core import MA5Strategy
+
+    file_path = r"C:\Users\chanpi\Desktop\Backtesting\测试用文件\TRD_Dalyr.csv"
+    results = grid_search(
+        file_path,
+        MA5Strategy,
+        param_grid={'security': ['000001', '000002', '000004']},
+        start_date=pd.to_datetime('2025-09-02'),
+        end_date=pd.to_datetime('2025-9-15'),
+        sort_by='sharpe_ratio'
+    )
+    print(results)
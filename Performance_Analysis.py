@@ -55,11 +55,12 @@ class PerformanceAnalysis:
         return np.sqrt(252) * (excess_returns.mean() / (excess_returns.std() + 1e-8))
 
     def get_max_drawdown(self):
-        """计算最大回撤"""
+        """计算最大回撤（在净值 1 + 累计收益率 上计算，峰值恒为正）"""
         if self.cumulative_returns is None:
             self.calculate_cumulative_returns()
-        peak = self.cumulative_returns.expanding().max()
-        drawdown = (self.cumulative_returns - peak) / peak
+        wealth = 1 + self.cumulative_returns
+        peak = wealth.expanding().max()
+        drawdown = wealth / peak - 1
         return drawdown.min() * 100  # 转换为百分比
 
     def get_trade_count(self):
@@ -68,20 +69,300 @@ class PerformanceAnalysis:
 
     def get_buy_sell_count(self):
         """获取买入/卖出次数"""
-        if not self.account.trade_history:
-            return 0, 0
-        trades = pd.DataFrame(self.account.trade_history)
-        buy_count = len(trades[trades['action'] == 'buy'])
-        sell_count = len(trades[trades['action'] == 'sell'])
-        return buy_count, sell_count
+        trades = self.account.trade_history
+        return trades.count('buy'), trades.count('sell')
 
     def get_avg_sell_profit(self):
         """计算平均每次卖出收益"""
-        if not self.account.trade_history:
-            return 0.0
-        trades = pd.DataFrame(self.account.trade_history)
-        sell_trades = trades[trades['action'] == 'sell']
-        if sell_trades.empty:
+        trades = self.account.trade_history
+        if trades.count('sell') == 0:
             return 0.0
         # 收益 = 卖出收入 - 买入成本（需匹配对应的买入记录，此处简化为卖出收入直接计算）
-        return (sell_trades['revenue']).mean()
\ No newline at end of file
+        sells = trades.column('action') == trades.ACTIONS.index('sell')
+        return trades.column('revenue')[sells].mean()
+
+    def get_summary(self):
+        """汇总全部绩效指标，便于批量回测结果整理成表格"""
+        buy_count, sell_count = self.get_buy_sell_count()
+        return {
+            'total_return': self.get_total_return(),
+            'annualized_return': self.get_annualized_return(),
+            'sharpe_ratio': self.get_sharpe_ratio(),
+            'max_drawdown': self.get_max_drawdown(),
+            'trade_count': self.get_trade_count(),
+            'buy_count': buy_count,
+            'sell_count': sell_count,
+            'avg_sell_profit': self.get_avg_sell_profit(),
+            'final_assets': self.account.total_assets[-1],
+        }
+
+
+class OnlineMetrics:
+    """
+    逐根K线更新的绩效指标，由 Account.calculate_total_assets 在每次估值时调用 update，O(1) 内存
+    收益率的均值与方差用 Welford 算法累积，口径与 PerformanceAnalysis 一致（首根K线收益率记为 0）；
+    回测进行中即可读取，用于参数搜索中提前终止明显不佳的回测
+    """
+
+    def __init__(self, initial_cash):
+        self.initial_cash = initial_cash
+        self.count = 0  # 已更新的K线数量
+        self.first_date = None
+        self.last_date = None
+        self.last_total = None  # 最近一次总资产
+        self.last_position_value = None  # 最近一次持仓市值
+        self.mean = 0.0  # 单根K线收益率均值
+        self._m2 = 0.0  # 收益率离差平方和
+        self.peak = None  # 总资产峰值
+        self.drawdown = 0.0  # 当前回撤（小数，非正）
+        self.min_drawdown = 0.0  # 最大回撤（小数，非正）
+        self.traded_value = 0.0  # 累计成交金额
+        self._total_sum = 0.0  # 总资产之和，用于计算平均总资产
+        self._exposure_sum = 0.0  # 持仓市值占总资产比例之和
+        self._exposure_count = 0
+
+    def update(self, date, total, position_value=None):
+        """
+        用一根K线的估值更新指标
+        :param total: 当日总资产
+        :param position_value: 当日持仓市值（None 表示未知，不计入仓位暴露）
+        """
+        if self.count == 0:
+            ret = 0.0
+            self.first_date = date
+            self.peak = total
+        else:
+            ret = total / self.last_total - 1 if self.last_total else 0.0
+        self.count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (ret - self.mean)
+
+        self.last_date = date
+        self.last_total = total
+        self.last_position_value = position_value
+        self._total_sum += total
+        if total > self.peak:
+            self.peak = total
+        self.drawdown = total / self.peak - 1 if self.peak > 0 else 0.0
+        if self.drawdown < self.min_drawdown:
+            self.min_drawdown = self.drawdown
+        if position_value is not None and total:
+            self._exposure_sum += position_value / total
+            self._exposure_count += 1
+
+    def extend(self, dates, totals, position_values=None):
+        """按顺序用多根K线的估值更新指标（向量化回测等一次性得到整段净值的场景）"""
+        if position_values is None:
+            position_values = [None] * len(totals)
+        for date, total, position_value in zip(dates, totals, position_values):
+            self.update(date, total, position_value)
+
+    def add_trade(self, value):
+        """记录一笔成交的金额（用于计算换手率）"""
+        self.traded_value += value
+
+    @property
+    def variance(self):
+        """收益率样本方差（与 pandas 的 std 口径一致，ddof=1）"""
+        return self._m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def total_return(self):
+        """总收益率（%）"""
+        if self.count < 2:
+            return 0.0
+        return (self.last_total / self.initial_cash - 1) * 100
+
+    @property
+    def annualized_return(self):
+        """年化收益率（小数）"""
+        if self.count < 2:
+            return 0.0
+        days = (self.last_date - self.first_date).days
+        if days == 0:
+            return 0.0
+        return (1 + self.total_return / 100) ** (365 / days) - 1
+
+    def sharpe_ratio(self, risk_free_rate=0):
+        """夏普比率（默认无风险利率为0）"""
+        return np.sqrt(252) * ((self.mean - risk_free_rate / 252) / (np.sqrt(self.variance) + 1e-8))
+
+    @property
+    def max_drawdown(self):
+        """最大回撤（%，非正）"""
+        return self.min_drawdown * 100
+
+    @property
+    def turnover(self):
+        """换手率：累计成交金额 / 平均总资产"""
+        if self.count == 0 or self._total_sum == 0:
+            return 0.0
+        return self.traded_value / (self._total_sum / self.count)
+
+    @property
+    def exposure(self):
+        """平均仓位：持仓市值占总资产比例的均值"""
+        return self._exposure_sum / self._exposure_count if self._exposure_count else np.nan
+
+    def get_summary(self):
+        """当前的指标快照"""
+        return {
+            'bars': self.count,
+            'total_return': self.total_return,
+            'annualized_return': self.annualized_return,
+            'sharpe_ratio': self.sharpe_ratio(),
+            'max_drawdown': self.max_drawdown,
+            'drawdown': self.drawdown * 100,
+            'turnover': self.turnover,
+            'exposure': self.exposure,
+            'final_assets': self.last_total,
+        }
+
+
+class EarlyStop:
+    """
+    提前终止条件，供 BacktestEngine(early_stop=...) 在每根K线之后检查（可序列化，能随任务传给工作进程）
+    最大回撤低于 max_drawdown 时立即终止；运行满 min_bars 根K线后，夏普比率或总收益率低于阈值时终止
+    """
+
+    def __init__(self, max_drawdown=None, min_sharpe=None, min_return=None, min_bars=20):
+        """
+        :param max_drawdown: 最大回撤阈值（%，如 -30）
+        :param min_sharpe: 夏普比率下限
+        :param min_return: 总收益率下限（%）
+        :param min_bars: 检查夏普比率与收益率前至少运行的K线数量
+        """
+        self.max_drawdown = max_drawdown
+        self.min_sharpe = min_sharpe
+        self.min_return = min_return
+        self.min_bars = min_bars
+
+    def __call__(self, metrics):
+        """返回终止原因，继续运行时返回 None"""
+        if self.max_drawdown is not None and metrics.max_drawdown < self.max_drawdown:
+            return f"最大回撤 {metrics.max_drawdown:.2f}% 低于 {self.max_drawdown}%"
+        if metrics.count < self.min_bars:
+            return None
+        if self.min_sharpe is not None and metrics.sharpe_ratio() < self.min_sharpe:
+            return f"夏普比率 {metrics.sharpe_ratio():.2f} 低于 {self.min_sharpe}"
+        if self.min_return is not None and metrics.total_return < self.min_return:
+            return f"总收益率 {metrics.total_return:.2f}% 低于 {self.min_return}%"
+        return None
+
+
+def realized_pnl(stock_codes, actions, amounts, costs, revenues):
+    """
+    按移动平均成本计算每笔卖出的已实现盈亏：卖出净收入 - 持仓平均成本（含买入费用）× 卖出数量
+    各参数为按时间排序的等长数组（与 TradeLedger.to_frame 的同名列一致），actions 为 'buy' / 'sell'
+    :return: 与成交记录等长的数组，买入记录为 NaN
+    """
+    pnl = np.full(len(amounts), np.nan)
+    holdings = {}  # {股票代码: [持股数量, 持仓成本]}
+    for i, (code, action, amount, cost, revenue) in enumerate(zip(stock_codes, actions, amounts, costs, revenues)):
+        shares, basis = holdings.get(code, (0, 0.0))
+        if action == 'buy':
+            holdings[code] = (shares + amount, basis + cost)
+        elif shares > 0:
+            sold_basis = basis * min(amount, shares) / shares
+            pnl[i] = revenue - sold_basis
+            holdings[code] = (shares - amount, basis - sold_basis)
+    return pnl
+
+
+def equity_matrix(curves):
+    """
+    把多条每日总资产 Series（如 run_backtest_job(details=True) 返回的 equity）对齐为 (回测 × 交易日) 矩阵
+    :return: (矩阵, 交易日 DatetimeIndex)，某条曲线缺少的日期为 NaN
+    """
+    frame = pd.concat(list(curves), axis=1, ignore_index=True).sort_index()
+    return frame.to_numpy(dtype=float).T, pd.DatetimeIndex(frame.index)
+
+
+def _ffill_rows(values):
+    """沿每行向前填充 NaN"""
+    mask = np.isnan(values)
+    if not mask.any():
+        return values
+    idx = np.where(mask, 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+def batch_metrics(equity, dates, initial_cash=100000, trade_runs=None, trade_pnl=None, chunk_size=1024,
+                  risk_free_rate=0):
+    """
+    批量计算多次回测的绩效指标：按行分块做数组运算，内存占用只与 chunk_size × 交易日数 有关
+    收益率、夏普比率与最大回撤的口径与 PerformanceAnalysis 一致（首日收益率记为 0，回撤在净值上计算）
+    :param equity: (回测 × 交易日) 的每日总资产矩阵（可为内存映射数组），各行须从同一交易日开始；
+                   行尾的 NaN（如提前终止后的日期）按前值填充
+    :param dates: 交易日序列，与 equity 的列对应
+    :param initial_cash: 初始资金（标量或每次回测一个值）
+    :param trade_runs: 每笔已平仓交易所属的回测序号（行号），与 trade_pnl 对应，用于计算胜率
+    :param trade_pnl: 每笔已平仓交易的盈亏（如 realized_pnl 的卖出记录）
+    :param chunk_size: 每块计算的回测数量
+    :return: DataFrame，每行一次回测：total_return（%）、annualized_return、sharpe_ratio、sortino_ratio、
+             max_drawdown（%）、max_drawdown_duration（K线数）、calmar_ratio、win_rate、closed_trades、final_assets
+    """
+    n_runs, n_dates = equity.shape
+    dates = pd.DatetimeIndex(dates)
+    if len(dates) != n_dates:
+        raise ValueError(f"交易日数量（{len(dates)}）与净值矩阵的列数（{n_dates}）不一致")
+    initial_cash = np.broadcast_to(np.asarray(initial_cash, dtype=float), (n_runs,))
+    days = (dates[-1] - dates[0]).days if n_dates > 1 else 0
+
+    columns = {name: np.full(n_runs, np.nan) for name in (
+        'total_return', 'annualized_return', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown',
+        'max_drawdown_duration', 'calmar_ratio', 'final_assets')}
+    positions = np.arange(n_dates)
+    for lo in range(0, n_runs, chunk_size):
+        hi = min(lo + chunk_size, n_runs)
+        values = _ffill_rows(np.asarray(equity[lo:hi], dtype=float))
+        final = values[:, -1]
+
+        returns = np.zeros_like(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[:, 1:] = values[:, 1:] / values[:, :-1] - 1
+        excess = returns - risk_free_rate / 252
+        mean = excess.mean(axis=1)
+        std = excess.std(axis=1, ddof=1) if n_dates > 1 else np.full(hi - lo, np.nan)
+        downside = np.sqrt((np.minimum(excess, 0) ** 2).mean(axis=1))
+
+        total_return = (final / initial_cash[lo:hi] - 1) * 100 if n_dates > 1 else np.zeros(hi - lo)
+        annualized = (1 + total_return / 100) ** (365 / days) - 1 if days > 0 else np.zeros(hi - lo)
+
+        wealth = values / values[:, :1]
+        peak = np.maximum.accumulate(wealth, axis=1)
+        drawdown = wealth / peak - 1
+        max_drawdown = drawdown.min(axis=1)
+        # 回撤持续时间：距上一次创新高的K线数的最大值
+        last_peak = np.maximum.accumulate(np.where(drawdown < 0, 0, positions), axis=1)
+        duration = (positions - last_peak).max(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            calmar = np.where(max_drawdown < 0, annualized / -max_drawdown, np.nan)
+        columns['total_return'][lo:hi] = total_return
+        columns['annualized_return'][lo:hi] = annualized
+        columns['sharpe_ratio'][lo:hi] = np.sqrt(252) * (mean / (std + 1e-8))
+        columns['sortino_ratio'][lo:hi] = np.sqrt(252) * (mean / (downside + 1e-8))
+        columns['max_drawdown'][lo:hi] = max_drawdown * 100
+        columns['max_drawdown_duration'][lo:hi] = duration
+        columns['calmar_ratio'][lo:hi] = calmar
+        columns['final_assets'][lo:hi] = final
+
+    closed = np.zeros(n_runs, dtype=np.int64)
+    wins = np.zeros(n_runs, dtype=np.int64)
+    if trade_runs is not None:
+        trade_runs = np.asarray(trade_runs, dtype=np.int64)
+        trade_pnl = np.asarray(trade_pnl, dtype=float)
+        valid = ~np.isnan(trade_pnl)
+        closed = np.bincount(trade_runs[valid], minlength=n_runs)
+        wins = np.bincount(trade_runs[valid & (trade_pnl > 0)], minlength=n_runs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['win_rate'] = np.where(closed > 0, wins / closed, np.nan)
+    columns['closed_trades'] = closed
+    columns['max_drawdown_duration'] = columns['max_drawdown_duration'].astype(np.int64)
+
+    order = ['total_return', 'annualized_return', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown',
+             'max_drawdown_duration', 'calmar_ratio', 'win_rate', 'closed_trades', 'final_assets']
+    return pd.DataFrame({name: columns[name] for name in order})
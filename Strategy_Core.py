@@ -1,10 +1,17 @@
 from Utilities import log
 import pandas as pd
+import numpy as np
+from Indicators import SMA
 
 
 class MA5Strategy:
-    def __init__(self, context):
+    def __init__(self, context, security='000001'):
+        """
+        :param context: 回测上下文
+        :param security: 交易的股票代码（可作为参数优化的参数）
+        """
         self.context = context
+        self.security = security
         self.g = type('Global', (object,), {})  # 模拟全局变量g
         # 初始化时添加security属性的默认值，避免属性不存在的错误
         self.g.security = None
@@ -12,7 +19,7 @@ class MA5Strategy:
     def initialize(self):
         """初始化策略"""
         log.info('初始函数开始运行且全局只运行一次')
-        self.g.security = '000001'  # 使用数字格式的股票代码
+        self.g.security = self.security  # 使用数字格式的股票代码
         self.context['security'] = self.g.security
         self.g.previous_price = None  # 用于存储前一天的收盘价
 
@@ -26,7 +33,7 @@ class MA5Strategy:
 
     def market_open(self, date):
         """开盘时运行"""
-        log.info(f'函数运行时间(market_open)：{str(date)}')
+        log.info('函数运行时间(market_open)：%s', date)
         security = self.g.security  # 现在这里不会再报错了
 
         # 调用DataHandler的get_price获取当前价格
@@ -34,7 +41,11 @@ class MA5Strategy:
         current_data = get_price(security, count=1, fields=['Clsprc'], end_date=date)
 
         if len(current_data) == 0:
-            log.info(f'无法获取当前价格数据，跳过交易：{date}')
+            log.info('无法获取当前价格数据，跳过交易：%s', date)
+            return
+        # 停牌日 get_price 返回的是此前最近一个交易日的收盘价：不交易，也不更新前一日价格（与向量化模式一致）
+        if current_data.index.get_level_values('Trddt')[-1] != date:
+            log.info('当日停牌，跳过交易：%s', date)
             return
 
         # 获取当前价格
@@ -43,8 +54,8 @@ class MA5Strategy:
         account = self.context['account']
 
         # 调试信息
-        log.info(f"当前价格: {current_price}, 前一天价格: {self.g.previous_price}")
-        log.info(f"可用现金: {cash}")
+        log.info("当前价格: %s, 前一天价格: %s", current_price, self.g.previous_price)
+        log.info("可用现金: %s", cash)
 
         # 如果有前一天的价格数据，执行交易逻辑
         if self.g.previous_price is not None:
@@ -71,11 +82,22 @@ class MA5Strategy:
                     account=account
                 )
         else:
-            log.info(f'没有前一天价格数据，跳过交易：{date}')
+            log.info('没有前一天价格数据，跳过交易：%s', date)
 
         # 更新前一天价格为今天的价格（供明天使用）
         self.g.previous_price = current_price
 
+    def generate_signals(self, close):
+        """
+        向量化模式：今日收盘价高于昨日则买入（1），否则卖出（-1），区间首日无前一日价格不交易（0）
+        :param close: (交易日 × 股票) 的收盘价 DataFrame
+        """
+        price = close[[self.g.security]].ffill()  # 停牌日沿用最近收盘价，与 get_price 的取值一致
+        change = price.diff()
+        signals = np.where(change > 0, 1, -1)
+        signals[change.isna().to_numpy()] = 0
+        return pd.DataFrame(signals, index=close.index, columns=price.columns)
+
     def trading_function(self, date, security, action, price, cash, account):
         """统一处理买入卖出的交易函数"""
         if action == 'buy':
@@ -85,59 +107,42 @@ class MA5Strategy:
                 if buy_amount > 0:
                     success = account.buy(date, security, price, buy_amount)
                     if success:
-                        log.info(f"🎯 买入信号触发！买入 {security}，价格：{price:.2f}，数量：{buy_amount}")
+                        log.info("🎯 买入信号触发！买入 %s，价格：%.2f，数量：%s", security, price, buy_amount)
                         # 更新现金信息
                         self.context['portfolio']['available_cash'] = account.cash
                     else:
-                        log.info(f"买入失败，可能由于现金不足")
+                        log.info("买入失败，可能由于现金不足")
                 else:
-                    log.info(f"计算出的买入数量为0，跳过买入")
+                    log.info("计算出的买入数量为0，跳过买入")
             else:
-                log.info(f"今日价格高于昨日，但现金不足，无法买入")
+                log.info("今日价格高于昨日，但现金不足，无法买入")
 
         elif action == 'sell':
             # 检查是否有持仓
             has_position = security in account.positions and account.positions[security] > 0
-            log.info(
-                f"检查持仓: {security} 在持仓中: {security in account.positions}, 持仓数量: {account.positions.get(security, 0)}")
+            log.info("检查持仓: %s 在持仓中: %s, 持仓数量: %s",
+                     security, security in account.positions, account.positions.get(security, 0))
 
             if has_position:
                 sell_amount = account.positions[security]  # 卖出全部持仓
                 success = account.sell(date, security, price, sell_amount)
                 if success:
-                    log.info(f"📉 卖出信号触发！卖出 {security}，价格：{price:.2f}，数量：{sell_amount}")
+                    log.info("📉 卖出信号触发！卖出 %s，价格：%.2f，数量：%s", security, price, sell_amount)
                 else:
-                    log.info(f"卖出失败")
+                    log.info("卖出失败")
             else:
-                log.info(f"今日价格不高于昨日，但无持仓可卖，跳过交易")
+                log.info("今日价格不高于昨日，但无持仓可卖，跳过交易")
 
     def calculate_buy_amount(self, cash, price):
-        """计算可买入数量（考虑手续费）"""
-        # 估算手续费（买入佣金万分之三，最低5元）
-        # 先计算不考虑手续法的最大数量
-        max_amount = int(cash / price)
-
-        # 如果最大数量为0，直接返回0
-        if max_amount == 0:
-            return 0
-
-        # 计算手续费
-        cost = price * max_amount
-        commission = max(0.0003 * cost, 5)
-        total_cost = cost + commission
-
-        # 如果总成本超过现金，减少买入数量
-        while total_cost > cash and max_amount > 0:
-            max_amount -= 1
-            cost = price * max_amount
-            commission = max(0.0003 * cost, 5)
-            total_cost = cost + commission
-
-        return max_amount
+        """计算可买入数量（考虑手续费、整手与滑点，由账户的成本模型闭式求解）"""
+        return self.context['account'].max_buy_amount(self.g.security, price, cash)
 
     def after_market_close(self, date):
         """收盘后运行"""
-        log.info(f'函数运行时间(after_market_close)：{str(date)}')
+        # 收盘后只输出账户状态，日志关闭时直接跳过（避免为打日志而查询价格）
+        if not log.is_enabled_for(log.INFO):
+            return
+        log.info('函数运行时间(after_market_close)：%s', date)
 
         # 打印账户状态
         account = self.context['account']
@@ -152,19 +157,77 @@ class MA5Strategy:
                 current_price = current_data['Clsprc'].iloc[-1]
                 position_value = current_price * account.positions[self.g.security]
                 total_assets = cash + position_value
-                log.info(
-                    f"持仓情况: {self.g.security} - 数量: {account.positions[self.g.security]}, 当前价格: {current_price:.2f}, 持仓市值: {position_value:.2f}")
+                log.info("持仓情况: %s - 数量: %s, 当前价格: %.2f, 持仓市值: %.2f",
+                         self.g.security, account.positions[self.g.security], current_price, position_value)
 
-        log.info(f"账户状态 - 现金: {cash:.2f}, 总资产: {total_assets:.2f}")
+        log.info("账户状态 - 现金: %.2f, 总资产: %.2f", cash, total_assets)
 
         # 打印交易历史
         if account.trade_history:
-            # 只打印当天的交易记录
-            today_trades = [trade for trade in account.trade_history
-                            if pd.to_datetime(trade['date']).date() == date.date()]
+            # 只打印当天的交易记录（按日期索引直接定位）
+            today_trades = account.trade_history.on_date(date)
             for trade in today_trades:
-                log.info(f'当日成交记录：{trade}')
+                log.info('当日成交记录：%s', trade)
         else:
             log.info('当日无成交记录')
 
-        log.info('一天结束\n')
\ No newline at end of file
+        log.info('一天结束\n')
+
+
+class MACrossStrategy(MA5Strategy):
+    """均线交叉策略：短期均线高于长期均线时买入，低于时卖出；均线由回测引擎逐日增量更新"""
+
+    def __init__(self, context, security='000001', fast=5, slow=20):
+        """
+        :param fast: 短期均线周期
+        :param slow: 长期均线周期
+        """
+        super().__init__(context, security)
+        self.fast = fast
+        self.slow = slow
+
+    def initialize(self):
+        """初始化策略并声明指标"""
+        self.g.security = self.security
+        self.context['security'] = self.g.security
+        indicators = self.context['indicators']
+        self.g.fast_ma = indicators.add('fast_ma', SMA(self.fast))
+        self.g.slow_ma = indicators.add('slow_ma', SMA(self.slow))
+        self.g.position = indicators.position(self.g.security)
+        log.info("策略初始化完成：%s 均线交叉 MA%s / MA%s", self.g.security, self.fast, self.slow)
+
+    def market_open(self, date):
+        """开盘时运行"""
+        if self.g.position is None:
+            return
+        fast = self.g.fast_ma.value[self.g.position]
+        slow = self.g.slow_ma.value[self.g.position]
+        if np.isnan(fast) or np.isnan(slow) or fast == slow:
+            return
+
+        # 当日全市场收盘价数组（多策略回测时各策略共享同一份），NaN 表示停牌
+        closes = self.context['data_handler'].get_day_values(date, 'close')
+        price = closes[self.g.position] if closes is not None else np.nan
+        if np.isnan(price):
+            log.info('当日停牌，跳过交易：%s', date)
+            return
+        log.info("当前价格: %s, MA%s: %.4f, MA%s: %.4f", price, self.fast, fast, self.slow, slow)
+        self.trading_function(
+            date=date,
+            security=self.g.security,
+            action='buy' if fast > slow else 'sell',
+            price=price,
+            cash=self.context['portfolio']['available_cash'],
+            account=self.context['account']
+        )
+
+    def generate_signals(self, close):
+        """
+        向量化模式：短期均线高于长期均线为 1，低于为 -1；均线只在有行情的交易日上计算
+        :param close: (交易日 × 股票) 的收盘价 DataFrame
+        """
+        price = close[self.g.security].dropna()
+        fast = price.rolling(self.fast).mean()
+        slow = price.rolling(self.slow).mean()
+        signals = np.sign(fast - slow).fillna(0).reindex(close.index, fill_value=0)
+        return signals.to_frame(self.g.security)
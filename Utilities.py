@@ -1,16 +1,288 @@
+import atexit
+import contextlib
+import functools
+import json
+import queue
+import threading
+import time
+
 import pandas as pd
 
 
+# 日志级别
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+SILENT = 100  # 静默：丢弃全部日志（参数优化等批量回测使用）
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR', SILENT: 'SILENT'}
+
+
+class ConsoleSink:
+    """直接打印到控制台"""
+
+    def write(self, line):
+        print(line)
+
+    def close(self):
+        pass
+
+
+class BufferedFileSink:
+    """
+    缓冲写文件：调用方只把日志行放入队列，由后台线程批量写入文件
+    :param path: 日志文件路径
+    :param flush_interval: 后台线程最长等待多久写一次（秒）
+    """
+    _STOP = object()
+
+    def __init__(self, path, flush_interval=0.5, encoding='utf-8'):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding=encoding)
+        self._thread = threading.Thread(target=self._worker, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, line):
+        self._queue.put(line)
+
+    def _worker(self):
+        while True:
+            try:
+                line = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._file.flush()
+                continue
+            # 一次取出队列中已有的全部日志，合并写入
+            lines = []
+            while True:
+                if line is self._STOP:
+                    self._file.write(''.join(lines))
+                    self._file.flush()
+                    return
+                lines.append(line + '\n')
+                try:
+                    line = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._file.write(''.join(lines))
+
+    def close(self):
+        """写完队列中剩余的日志后关闭文件"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._file.close()
+
+
 class Log:
-    @staticmethod
-    def info(msg):
-        print(f"[INFO] {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')} - {msg}")
+    """
+    分级日志
+    - 低于当前级别的日志在格式化之前即返回，关闭的级别几乎没有开销；
+    - 消息支持 % 风格的惰性格式化：log.info('价格: %.2f', price)，只有需要输出时才格式化；
+    - 默认输出到控制台，可通过 to_file 追加后台线程写入的文件输出
+    """
+    DEBUG = DEBUG
+    INFO = INFO
+    WARNING = WARNING
+    ERROR = ERROR
+    SILENT = SILENT
+
+    def __init__(self, level=INFO):
+        self.level = level
+        self.sinks = [ConsoleSink()]
+        self._last_second = None
+        self._last_stamp = ''
+
+    def set_level(self, level):
+        """设置日志级别，可传入级别数值或名称（如 'WARNING'）"""
+        if isinstance(level, str):
+            level = {name: value for value, name in LEVEL_NAMES.items()}[level.upper()]
+        self.level = level
+
+    def is_enabled_for(self, level):
+        """该级别的日志是否会输出，用于跳过只为打日志而做的计算"""
+        return level >= self.level
+
+    @contextlib.contextmanager
+    def silenced(self):
+        """在 with 块内丢弃全部日志"""
+        level = self.level
+        self.level = SILENT
+        try:
+            yield self
+        finally:
+            self.level = level
+
+    def to_file(self, path, console=False, flush_interval=0.5):
+        """
+        将日志写入文件（后台线程缓冲写入）；已有的文件输出先写完并关闭
+        :param console: 是否同时保留控制台输出
+        """
+        for old in self.sinks:
+            old.close()
+        sink = BufferedFileSink(path, flush_interval=flush_interval)
+        self.sinks = ([ConsoleSink()] if console else []) + [sink]
+        return sink
+
+    def close(self):
+        """关闭所有输出并恢复控制台输出"""
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = [ConsoleSink()]
+
+    def _timestamp(self):
+        # 同一秒内复用格式化好的时间戳
+        now = int(time.time())
+        if now != self._last_second:
+            self._last_second = now
+            self._last_stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        return self._last_stamp
+
+    def _emit(self, level, msg, args):
+        if args:
+            msg = msg % args
+        line = f"[{LEVEL_NAMES[level]}] {self._timestamp()} - {msg}"
+        for sink in self.sinks:
+            sink.write(line)
 
-    @staticmethod
-    def error(msg):
-        print(f"[ERROR] {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')} - {msg}")
+    def debug(self, msg, *args):
+        if DEBUG >= self.level:
+            self._emit(DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if INFO >= self.level:
+            self._emit(INFO, msg, args)
+
+    def warning(self, msg, *args):
+        if WARNING >= self.level:
+            self._emit(WARNING, msg, args)
+
+    def error(self, msg, *args):
+        if ERROR >= self.level:
+            self._emit(ERROR, msg, args)
 
 
 log = Log()  # 实例化log，供策略调用
+atexit.register(log.close)
+
+
+class CacheStats:
+    """缓存命中统计：各缓存始终累计，开销只是一次整数加法"""
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else float('nan')
+
+
+CACHE_STATS = {}  # {缓存名称: CacheStats}
+
+
+def cache_stats(name):
+    """获取（必要时创建）指定缓存的命中统计"""
+    stats = CACHE_STATS.get(name)
+    if stats is None:
+        stats = CACHE_STATS[name] = CacheStats(name)
+    return stats
+
+
+class Profiler:
+    """
+    回测热点统计：记录各策略钩子、数据/交易接口的累计耗时和调用次数，以及运行期间的缓存命中率
+    只有被 instrument 包装的函数才会计时；未启用时不做任何包装，没有额外开销
+    """
+
+    def __init__(self):
+        self.timings = {}  # {名称: [调用次数, 累计秒数]}
+        self._cache_start = {}
+        self._patches = []
+
+    def start(self):
+        """记录缓存统计的起点，报告中的命中数为运行期间的增量"""
+        self._cache_start = {name: (stats.hits, stats.misses) for name, stats in CACHE_STATS.items()}
+
+    def wrap(self, func, name):
+        """返回计时包装后的函数"""
+        record = self.timings.setdefault(name, [0, 0.0])
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += perf_counter() - start
+        return timed
+
+    def instrument(self, target, attrs, prefix):
+        """
+        将对象（实例、类或模块）上的函数替换为计时版本，restore 时恢复
+        :param attrs: 属性名列表，不存在的属性会被忽略
+        :param prefix: 统计名称前缀，如 'strategy'
+        """
+        for attr in attrs:
+            func = getattr(target, attr, None)
+            if func is None:
+                continue
+            own = attr in vars(target)
+            original = vars(target)[attr] if own else None
+            self._patches.append((target, attr, own, original))
+            setattr(target, attr, self.wrap(func, f"{prefix}.{attr}"))
+
+    def restore(self):
+        """撤销全部替换"""
+        while self._patches:
+            target, attr, own, original = self._patches.pop()
+            if own:
+                setattr(target, attr, original)
+            else:
+                delattr(target, attr)
+
+    def report(self):
+        """
+        :return: (耗时统计列表, 缓存统计列表)
+        """
+        timings = [{
+            'name': name,
+            'calls': calls,
+            'total_seconds': seconds,
+            'mean_us': seconds / calls * 1e6 if calls else 0.0,
+        } for name, (calls, seconds) in sorted(self.timings.items(), key=lambda item: -item[1][1]) if calls]
+        caches = []
+        for name, stats in CACHE_STATS.items():
+            hits0, misses0 = self._cache_start.get(name, (0, 0))
+            hits, misses = stats.hits - hits0, stats.misses - misses0
+            if hits or misses:
+                caches.append({'name': name, 'hits': hits, 'misses': misses,
+                               'hit_rate': hits / (hits + misses)})
+        return timings, caches
 
+    def to_frame(self):
+        """耗时统计表（DataFrame）"""
+        timings, _ = self.report()
+        return pd.DataFrame(timings, columns=['name', 'calls', 'total_seconds', 'mean_us'])
 
+    def to_json(self, path=None):
+        """导出为 JSON 字符串，指定 path 时同时写入文件"""
+        timings, caches = self.report()
+        text = json.dumps({'timings': timings, 'caches': caches}, ensure_ascii=False, indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
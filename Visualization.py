@@ -1,12 +1,148 @@
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 
+# matplotlib 只在真正绘图时导入：关闭绘图的批量回测不加载它
+# 保存图片时直接使用 matplotlib.figure.Figure 渲染，不经过 pyplot 与 GUI 后端，无显示器的机器上也可运行
+
+
+def lttb(values, n_out, x=None):
+    """
+    Largest-Triangle-Three-Buckets 降采样：保留曲线形状的前提下选出 n_out 个点
+    :param values: 纵坐标序列
+    :param n_out: 输出点数（不少于 3；序列不长于 n_out 时原样保留）
+    :param x: 横坐标序列，默认按位置等间距
+    :return: 选中点的位置数组（升序，含首尾两点）
+    """
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if n_out is None or n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    # 首尾两点之外的点均分为 n_out - 2 个桶，edges[i] 为第 i 个桶的起始位置
+    edges = np.append(np.arange(n_out - 1) * (n - 2) // (n_out - 2) + 1, n)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = edges[i + 1], edges[i + 2]
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        # 与上一个选中点、下一桶均值构成的三角形面积最大的点
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _draw_curves(fig, dates, total_assets, initial_cash, max_points=None, title=None):
+    """在 fig 上绘制资产曲线与累计收益率曲线；max_points 不为空时先用 LTTB 降采样"""
+    dates = pd.DatetimeIndex(dates)
+    total_assets = np.asarray(total_assets, dtype=float)
+    cumulative_returns = total_assets / total_assets[0] - 1  # 与 (1 + 日收益率).cumprod() - 1 相同
+    keep = lttb(total_assets, max_points)
+    dates, total_assets, cumulative_returns = dates[keep], total_assets[keep], cumulative_returns[keep]
+
+    # 绘制资产曲线
+    ax = fig.add_subplot(2, 1, 1)
+    ax.plot(dates, total_assets, label='Total Assets')
+    ax.axhline(y=initial_cash, color='r', linestyle='--', label='Initial Capital')
+    ax.set_title(title or 'Capital Curve')
+    ax.legend()
+    ax.grid(True)
+
+    # 绘制收益率曲线
+    ax = fig.add_subplot(2, 1, 2)
+    ax.plot(dates, cumulative_returns, label='Strategy Cumulative Return')
+    ax.set_title('Cumulative Returns')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+
+
+def _save(fig, path):
+    """按扩展名（png / svg / pdf 等）保存图片并返回路径"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(path)
+    return path
+
+
+def render_equity(equity, path, initial_cash=100000, max_points=2000, title=None, figsize=(12, 8), dpi=100):
+    """
+    无界面地把一条资产曲线保存为图片
+    :param equity: 每日总资产 Series（如 run_backtest_job(details=True) 返回的 equity）
+    :param path: 输出文件路径，格式由扩展名决定（.png / .svg）
+    :param max_points: 绘图前 LTTB 降采样后的最大点数（None 表示不降采样）
+    :return: 输出文件路径
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=dpi)
+    _draw_curves(fig, equity.index, equity.to_numpy(), initial_cash, max_points, title)
+    return _save(fig, path)
+
+
+def render_heatmap(results, x, y, metric, path, title=None, figsize=(8, 6), dpi=100, cmap='RdYlGn'):
+    """
+    无界面地把参数扫描结果画成热力图
+    :param results: 参数扫描结果表（如 grid_search 的返回值），每行一组参数及其绩效
+    :param x: 横轴参数名
+    :param y: 纵轴参数名
+    :param metric: 着色的绩效指标列名；同一格有多行时取均值
+    :param path: 输出文件路径，格式由扩展名决定（.png / .svg）
+    :return: 输出文件路径
+    """
+    from matplotlib.figure import Figure
+    table = results.pivot_table(index=y, columns=x, values=metric, aggfunc='mean')
+    fig = Figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_subplot(1, 1, 1)
+    image = ax.imshow(table.to_numpy(dtype=float), cmap=cmap, aspect='auto', origin='lower')
+    ax.set_xticks(range(len(table.columns)), [str(v) for v in table.columns])
+    ax.set_yticks(range(len(table.index)), [str(v) for v in table.index])
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(title or metric)
+    fig.colorbar(image, ax=ax, label=metric)
+    fig.tight_layout()
+    return _save(fig, path)
+
+
+_RENDERERS = {'equity': render_equity, 'heatmap': render_heatmap}
+
+
+def _render_job(job):
+    """执行单个绘图任务：kind 选择绘图函数，其余键作为参数"""
+    job = dict(job)
+    return _RENDERERS[job.pop('kind')](**job)
+
+
+def render_jobs(jobs, n_jobs=None):
+    """
+    在进程池中批量绘图（如每组参数一张资产曲线、每对参数一张热力图）
+    :param jobs: 任务字典列表，kind 为 'equity'（参数同 render_equity）或 'heatmap'（参数同 render_heatmap）
+    :param n_jobs: 进程数，默认使用全部 CPU；为 1 时在当前进程中顺序执行
+    :return: 与 jobs 顺序一致的输出文件路径列表
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (n_jobs * 4))
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=chunksize))
+
 
 class BacktestVisualization:
-    def __init__(self, account, strategy_returns=None):
+    def __init__(self, account, strategy_returns=None, max_points=2000):
+        """
+        :param max_points: 绘图前 LTTB 降采样后的最大点数（None 表示不降采样）
+        """
         self.account = account
         self.strategy_returns = strategy_returns
+        self.max_points = max_points
 
     def calculate_returns(self):
         """计算策略收益率"""
@@ -16,52 +152,31 @@ class BacktestVisualization:
             ).pct_change().fillna(0)
         return self.strategy_returns
 
-    def plot_results(self):
-        """绘制回测结果"""
-        # 计算收益率
-        returns = self.calculate_returns()
-
-        plt.figure(figsize=(12, 8))
-
-        # 绘制资产曲线
-        plt.subplot(2, 1, 1)
-        plt.plot(self.account.dates, self.account.total_assets, label='Total Assets')
-        plt.axhline(y=self.account.initial_cash, color='r', linestyle='--', label='Initial Capital')
-        plt.title('Capital Curve')
-        plt.legend()
-        plt.grid(True)
-
-        # 绘制收益率曲线
-        plt.subplot(2, 1, 2)
-        cumulative_returns = (1 + returns).cumprod() - 1
-        plt.plot(self.account.dates, cumulative_returns, label='Strategy Cumulative Return')
-        plt.title('Cumulative Returns')
-        plt.legend()
-        plt.grid(True)
-
-        plt.tight_layout()
+    def plot_results(self, path=None):
+        """
+        绘制回测结果
+        :param path: 为空时弹出窗口显示；否则不经过 GUI 直接保存为图片（格式由扩展名决定），返回文件路径
+        """
+        if path is not None:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(12, 8))
+            _draw_curves(fig, self.account.dates, self.account.total_assets, self.account.initial_cash,
+                         self.max_points)
+            return _save(fig, path)
+
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(12, 8))
+        _draw_curves(fig, self.account.dates, self.account.total_assets, self.account.initial_cash,
+                     self.max_points)
         plt.show()
 
     def print_performance(self):
-        """打印绩效指标"""
-        # 计算总收益率
-        total_return = (self.account.total_assets[-1] / self.account.initial_cash - 1) * 100
-
-        # 计算收益率序列
-        returns = self.calculate_returns()
-
-        # 计算年化收益率
-        days = (self.account.dates[-1] - self.account.dates[0]).days
-        annualized_return = (1 + total_return / 100) ** (365 / days) - 1 if days > 0 else 0
-
-        # 计算夏普比率 (假设无风险利率为0)
-        sharpe_ratio = np.sqrt(252) * (returns.mean() / (returns.std() + 1e-8))
-
-        # 计算最大回撤
-        cumulative_returns = (1 + returns).cumprod()
-        peak = cumulative_returns.expanding().max()
-        drawdown = (cumulative_returns - peak) / peak
-        max_drawdown = drawdown.min() * 100
+        """打印绩效指标（直接读取账户在回测过程中逐日累积的 OnlineMetrics，不再重新计算收益率序列）"""
+        metrics = self.account.metrics
+        total_return = metrics.total_return
+        annualized_return = metrics.annualized_return
+        sharpe_ratio = metrics.sharpe_ratio()
+        max_drawdown = metrics.max_drawdown
 
         print(f"\n绩效指标:")
         print(f"总收益率: {total_return:.2f}%")
@@ -69,13 +184,12 @@ class BacktestVisualization:
         print(f"夏普比率: {sharpe_ratio:.2f}")
         print(f"最大回撤: {max_drawdown:.2f}%")
         print(f"交易次数: {len(self.account.trade_history)}")
+        print(f"换手率: {metrics.turnover:.2f}")
+        print(f"平均仓位: {metrics.exposure * 100:.2f}%")
 
         # 如果有交易历史，打印交易统计
-        if self.account.trade_history:
-            trades = pd.DataFrame(self.account.trade_history)
-            buy_trades = trades[trades['action'] == 'buy']
-            sell_trades = trades[trades['action'] == 'sell']
-
+        trades = self.account.trade_history
+        if trades:
             print(f"\n交易统计:")
-            print(f"买入次数: {len(buy_trades)}")
-            print(f"卖出次数: {len(sell_trades)}")
+            print(f"买入次数: {trades.count('buy')}")
+            print(f"卖出次数: {trades.count('sell')}")
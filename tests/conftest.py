@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # 回测结束时的绘图不弹出窗口
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Data_Handling import DataHandler  # noqa: E402
+
+
+def write_csmar_file(path, n_stocks=20, n_days=120, seed=7, suspend_rate=0.05):
+    """
+    写入 CSMAR 格式的模拟日行情文件：价格为几何随机游走，000001 全程无停牌，
+    其余股票每日以 suspend_rate 的概率停牌（当日无记录）
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2015-01-05', periods=n_days).strftime('%Y-%m-%d')
+    frames = []
+    for i in range(n_stocks):
+        returns = np.clip(rng.normal(0.0003, 0.02, n_days), -0.1, 0.1)
+        close = (rng.uniform(5, 50) * np.cumprod(1 + returns)).round(2)
+        pre_close = np.concatenate([[close[0]], close[:-1]])
+        opn = (pre_close * (1 + rng.normal(0, 0.005, n_days))).round(2)
+        high = (np.maximum(opn, close) * (1 + np.abs(rng.normal(0, 0.005, n_days)))).round(2)
+        low = (np.minimum(opn, close) * (1 - np.abs(rng.normal(0, 0.005, n_days)))).round(2)
+        volume = rng.integers(100_000, 10_000_000, n_days)
+        change = (close / pre_close - 1).round(6)
+        frame = pd.DataFrame({
+            'Stkcd': f"{i + 1:06d}", 'Trddt': dates, 'Opnprc': opn, 'Hiprc': high, 'Loprc': low, 'Clsprc': close,
+            'Dnshrtrd': volume, 'Dnvaltrd': (volume * close).round(2), 'Dsmvosd': (close * 1e5).round(2),
+            'Dsmvtll': (close * 1.2e5).round(2), 'Dretwd': change, 'Dretnd': change, 'Adjprcwd': close,
+            'Adjprcnd': close, 'Markettype': 4, 'Capchgdt': '2014-12-31', 'Trdsta': 1, 'PreClosePrice': pre_close,
+            'ChangeRatio': change, 'LimitDown': (pre_close * 0.9).round(2), 'LimitUp': (pre_close * 1.1).round(2),
+        })
+        if i > 0:
+            frame = frame[rng.random(n_days) >= suspend_rate]
+        frames.append(frame)
+    pd.concat(frames).to_csv(path, index=False, quoting=2)
+
+
+@pytest.fixture(scope='session')
+def data_file(tmp_path_factory):
+    """模拟 CSMAR 日行情文件：20 只股票 120 个交易日"""
+    path = tmp_path_factory.mktemp('data') / 'daily.csv'
+    write_csmar_file(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def data_handler(data_file):
+    return DataHandler(data_file)
@@ -0,0 +1,158 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Data_Handling
+from Backtest_Engine import BacktestEngine, MultiStrategyEngine, TradeLedger
+from Data_Handling import DataHandler
+from Strategy_Core import MA5Strategy, MACrossStrategy
+from Utilities import log
+
+
+def ma5_strategy(security):
+    """交易指定股票的 MA5Strategy"""
+    class Strategy(MA5Strategy):
+        def initialize(self):
+            super().initialize()
+            self.g.security = security
+            self.context['security'] = security
+    return Strategy
+
+
+def suspended_securities(data_handler, count=3):
+    """区间内有停牌日（当日无行情）的股票（首日停牌不影响信号，不计入）"""
+    close = data_handler.get_price_matrix('close')
+    suspended = close.iloc[1:].isna().any()
+    return list(suspended.index[suspended.to_numpy()][:count])
+
+
+@pytest.mark.parametrize('backend', ['frame', 'panel'])
+def test_ma5_event_vector_parity_with_suspensions(data_file, backend):
+    data_handler = DataHandler(data_file, backend=backend)
+    securities = ['000001'] + suspended_securities(data_handler)
+    assert len(securities) == 4
+    for security in securities:
+        engines = {}
+        for mode in ('event', 'vector'):
+            engines[mode] = BacktestEngine(data_handler, ma5_strategy(security), 100000, mode=mode)
+            engines[mode].run()
+        event, vector = engines['event'].account, engines['vector'].account
+        assert len(event.trade_history) == len(vector.trade_history), security
+        for event_trade, vector_trade in zip(event.trade_history, vector.trade_history):
+            assert event_trade['date'] == vector_trade['date'], security
+            assert event_trade['amount'] == vector_trade['amount'], security
+            assert np.isclose(event_trade['price'], vector_trade['price']), security
+        assert np.isclose(event.cash, vector.cash), security
+        # 停牌日的持仓按最近收盘价估值，两种模式的每日总资产一致
+        np.testing.assert_allclose(event.total_assets, vector.total_assets, rtol=1e-12, err_msg=security)
+
+
+def test_trade_ledger_behaves_like_a_list_of_dicts():
+    ledger = TradeLedger(capacity=2)
+    dates = pd.bdate_range('2015-01-05', periods=4)
+    records = []
+    for i in range(10):  # 超出初始容量，按倍数扩容
+        action = 'buy' if i % 3 else 'sell'
+        record = {'date': dates[i // 3], 'stock_code': f'{i % 4:06d}', 'action': action, 'price': 10.0 + i,
+                  'amount': 100 * (i + 1)}
+        record['cost' if action == 'buy' else 'revenue'] = 1000.0 * i
+        ledger.append(record['date'], record['stock_code'], action, record['price'], record['amount'],
+                      cost=record.get('cost', np.nan), revenue=record.get('revenue', np.nan))
+        records.append(record)
+
+    assert len(ledger) == 10 and ledger
+    assert list(ledger) == records
+    assert ledger[-1] == records[-1] and ledger[2:5] == records[2:5]
+    with pytest.raises(IndexError):
+        ledger[10]
+    assert ledger.on_date(dates[1]) == records[3:6]
+    assert ledger.on_date(dates[3]) == records[9:]
+    assert ledger.count() == 10 and ledger.count('sell') == 4
+
+    prices = ledger.column('price')
+    assert not prices.flags.writeable
+    np.testing.assert_array_equal(prices, [record['price'] for record in records])
+    frame = ledger.to_frame()
+    assert list(frame['stock_code'].astype(str)) == [record['stock_code'] for record in records]
+    assert list(frame['action'].astype(str)) == [record['action'] for record in records]
+
+
+def test_trade_ledger_extend_matches_append():
+    appended, extended = TradeLedger(), TradeLedger()
+    dates = pd.to_datetime(['2015-01-05', '2015-01-05', '2015-01-07'])
+    rows = [(dates[0], '000001', 'buy', 10.0, 100, 1005.0, np.nan),
+            (dates[1], '000002', 'buy', 20.0, 200, 4005.0, np.nan),
+            (dates[2], '000001', 'sell', 11.0, 100, np.nan, 1093.9)]
+    for row in rows:
+        appended.append(*row)
+    extended.extend(*(list(column) for column in zip(*rows)))
+    assert list(extended) == list(appended)
+    assert extended.on_date('2015-01-05') == appended[:2]
+    assert extended.on_date('2015-01-06') == []
+
+
+def test_profiler_counts_calls_and_restores_the_originals(data_handler, tmp_path):
+    get_price = Data_Handling.get_price
+    plain = BacktestEngine(data_handler, MA5Strategy, 100000)
+    profiled = BacktestEngine(data_handler, MA5Strategy, 100000, profile=True)
+    with log.silenced():
+        plain.run(show_results=False)
+        profiled.run(show_results=False)
+    assert plain.profiler is None
+
+    # 计时包装不改变回测结果，运行结束后全部恢复
+    assert profiled.account.total_assets == plain.account.total_assets
+    assert Data_Handling.get_price is get_price
+    assert 'market_open' not in vars(profiled.strategy) and 'buy' not in vars(profiled.account)
+
+    calls = profiled.profiler.to_frame().set_index('name')['calls']
+    n_bars = len(data_handler.dates)
+    assert calls['strategy.market_open'] == calls['engine._run_bar'] == n_bars
+    assert calls['valuation.calculate_total_assets'] == n_bars
+    assert calls['data.get_price'] >= n_bars
+    assert calls['trading.buy'] == profiled.account.trade_history.count('buy')
+
+    report = json.loads(profiled.profiler.to_json(str(tmp_path / 'profile.json')))
+    assert {row['name'] for row in report['timings']} == set(calls.index)
+    assert json.loads((tmp_path / 'profile.json').read_text(encoding='utf-8')) == report
+
+
+def test_multi_strategy_engine_matches_separate_runs(data_handler):
+    specs = [(MACrossStrategy, {'security': '000001', 'fast': 3, 'slow': 10}),
+             (MACrossStrategy, {'security': '000002', 'fast': 5, 'slow': 20}),
+             (MACrossStrategy, {'security': '000003', 'fast': 5, 'slow': 10})]
+    weights = [2, 1, 1]
+    multi = MultiStrategyEngine(data_handler, specs, initial_cash=400000, weights=weights, combine=True)
+    with log.silenced():
+        performances = multi.run()
+        singles = []
+        for (strategy_class, params), cash in zip(specs, (200000, 100000, 100000)):
+            engine = BacktestEngine(data_handler, strategy_class, cash, strategy_params=params)
+            engine.run(show_results=False)
+            singles.append(engine.account)
+
+    # 在同一次日期遍历中运行，结果与各自单独回测一致
+    assert len(performances) == len(specs)
+    for account, single in zip(multi.accounts, singles):
+        assert account.initial_cash == single.initial_cash
+        np.testing.assert_allclose(account.total_assets, single.total_assets)
+        pd.testing.assert_frame_equal(account.trade_history.to_frame(), single.trade_history.to_frame())
+    assert sum(len(single.trade_history) for single in singles) > 0
+
+    # 组合账户为各策略账户之和，成交记录按日期合并
+    combined = multi.combined
+    assert combined.initial_cash == 400000
+    np.testing.assert_allclose(combined.total_assets, np.sum([single.total_assets for single in singles], axis=0))
+    trades = combined.trade_history.to_frame()
+    assert len(trades) == sum(len(single.trade_history) for single in singles)
+    assert trades['date'].is_monotonic_increasing
+    summary = multi.get_summary()
+    assert list(summary['strategy']) == [0, 1, 2, 'combined']
+
+
+@pytest.mark.parametrize('weights', [[1, 2], [1, -1, 1], [0, 0, 0]])
+def test_multi_strategy_engine_rejects_invalid_weights(data_handler, weights):
+    with pytest.raises(ValueError):
+        MultiStrategyEngine(data_handler, [MACrossStrategy] * 3, weights=weights)
@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+
+from Benchmark import CSMAR_COLUMNS, benchmark, compare_results, generate_csmar_file, main
+from Data_Handling import DataHandler
+
+
+def test_generate_csmar_file_is_reproducible(tmp_path):
+    first, second = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    rows = generate_csmar_file(str(first), n_stocks=7, n_days=30, seed=3, block_size=3)
+    generate_csmar_file(str(second), n_stocks=7, n_days=30, seed=3, block_size=3)
+    assert first.read_bytes() == second.read_bytes()
+
+    frame = pd.read_csv(first, dtype={'Stkcd': str})
+    assert list(frame.columns) == CSMAR_COLUMNS and len(frame) == rows
+    assert (frame.groupby('Stkcd').size()['000001']) == 30  # 000001 全程无停牌
+    data_handler = DataHandler(str(first))
+    assert len(data_handler.dates) == 30 and len(data_handler.securities) == 7
+
+
+def test_compare_results_flags_changes_beyond_the_threshold():
+    baseline = {'results': {'load': {'median': 1.0}, 'query': {'median': 1.0}, 'run': {'median': 1.0}}}
+    current = {'results': {'load': {'median': 1.05}, 'query': {'median': 1.5}, 'run': {'median': 0.5},
+                           'extra': {'median': 0.1}}}
+    table = compare_results(baseline, current, threshold=0.1).set_index('benchmark')
+    assert table['status'].to_dict() == {'load': 'ok', 'query': 'regression', 'run': 'improvement', 'extra': 'new'}
+    assert table.loc['query', 'ratio'] == 1.5
+
+
+def test_benchmark_report_round_trips_through_json(tmp_path):
+    report = benchmark(n_stocks=5, n_days=40, repeat=1, n_queries=5, work_dir=str(tmp_path))
+    assert report['meta']['securities'] == 5 and report['meta']['dates'] == 40
+    for name in ('load_csv', 'get_price_latest', 'get_price_latest_legacy', 'backtest_event', 'backtest_vector'):
+        assert report['results'][name]['median'] > 0
+    output = tmp_path / 'bench.json'
+    output.write_text(json.dumps(report), encoding='utf-8')
+
+    # 耗时放大 100 倍的结果：作为当前结果时全部判定为回退，作为基准时 --compare 返回 0
+    slower = {'meta': report['meta'], 'results': {name: {**result, 'median': result['median'] * 100}
+                                                   for name, result in report['results'].items()}}
+    (tmp_path / 'slow.json').write_text(json.dumps(slower), encoding='utf-8')
+    assert (compare_results(str(output), str(tmp_path / 'slow.json'))['status'] == 'regression').all()
+    assert main(['--stocks', '5', '--days', '40', '--repeat', '1', '--queries', '5', '--work-dir', str(tmp_path),
+                 '--compare', str(tmp_path / 'slow.json')]) == 0
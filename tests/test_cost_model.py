@@ -0,0 +1,38 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from Backtest_Engine import Account
+from Cost_Model import CostModel
+
+
+def brute_force_max_buy(model, cash, price):
+    """逐手递减试算：从资金可覆盖的最大整手数开始，直到总成本不超过资金"""
+    lot = model.lot_size
+    amount = int(cash // price) // lot * lot
+    while amount > 0:
+        value = price * amount
+        if value + model.buy_fees(value) <= cash:
+            return amount
+        amount -= lot
+    return 0
+
+
+@pytest.mark.parametrize('rate, min_fee, lot, transfer', list(itertools.product(
+    [0, 0.0001, 0.0003, 0.003], [0, 5], [1, 100], [0, 0.00001])))
+def test_max_buy_amounts_matches_brute_force(rate, min_fee, lot, transfer):
+    model = CostModel(commission_rate=rate, min_commission=min_fee, lot_size=lot, transfer_fee_rate=transfer)
+    rng = np.random.default_rng(0)
+    cash = np.concatenate([rng.uniform(0, 200000, 150), rng.uniform(0, 3000, 50)]).round(2)
+    prices = rng.uniform(1, 200, 200).round(2)
+    expected = [brute_force_max_buy(model, c, p) for c, p in zip(cash, prices)]
+    assert model.max_buy_amounts(cash, prices).tolist() == expected
+
+
+def test_fee_free_model_buys_with_all_cash():
+    model = CostModel(commission_rate=0, min_commission=0)
+    assert model.max_buy_amount(100000, 10.0) == 10000
+    assert model.max_fill_amounts(100000, np.array([10.0]))[0] == 10000
+    account = Account(100000, cost_model=model)
+    assert account.max_buy_amount('000001', 10.0) == 10000
@@ -0,0 +1,231 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Benchmark import legacy_get_price
+from conftest import write_csmar_file
+from Data_Handling import BarData, DataHandler, get_all_securities, get_price, load_price_store, set_data_file
+from Utilities import cache_stats
+
+
+def _normalize(frame):
+    """统一日期索引的精度，便于逐值比较"""
+    frame = frame.reset_index()
+    frame['Trddt'] = frame['Trddt'].astype('datetime64[ns]')
+    return frame
+
+
+def test_price_store_cache_is_reused_until_the_source_changes(tmp_path):
+    path = str(tmp_path / 'daily.csv')
+    write_csmar_file(path, n_stocks=5, n_days=30)
+    stats = cache_stats('price_store.disk')
+    parsed = load_price_store(path, use_cache=False)
+
+    misses = stats.misses
+    store = load_price_store(path)
+    assert stats.misses == misses + 1 and os.path.exists(f"{path}.cache/manifest.json")
+    hits = stats.hits
+    cached = load_price_store(path)
+    assert stats.hits == hits + 1
+    # 缓存以内存映射打开，内容与直接解析 CSV 一致
+    assert isinstance(cached.columns['Clsprc'], np.memmap)
+    for name in ('Stkcd', 'Trddt', 'Clsprc', 'Dnshrtrd'):
+        np.testing.assert_array_equal(cached.columns[name], parsed.columns[name])
+    assert cached.version == store.version
+
+    # 只修改时间（内容哈希不变）时复用缓存
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    misses = stats.misses
+    load_price_store(path)
+    assert stats.misses == misses
+
+    # 内容变化时重新解析
+    write_csmar_file(path, n_stocks=5, n_days=30, seed=8)
+    rebuilt = load_price_store(path)
+    assert stats.misses == misses + 1
+    assert rebuilt.version != store.version
+    np.testing.assert_array_equal(rebuilt.columns['Clsprc'], load_price_store(path, use_cache=False).columns['Clsprc'])
+
+
+@pytest.mark.parametrize('security, kwargs', [
+    ('000001', {'count': 1, 'fields': ['Clsprc'], 'end_date': '2015-03-02'}),
+    ('000003', {'count': 20, 'fields': ['Opnprc', 'Hiprc', 'Loprc', 'Clsprc'], 'end_date': '2015-04-01'}),
+    ('000004', {'start_date': '2015-02-01', 'end_date': '2015-03-10', 'fields': ['Clsprc', 'Dnshrtrd']}),
+    (['000002', '000005'], {'start_date': '2015-02-01', 'end_date': '2015-02-20', 'fields': ['Clsprc']}),
+])
+def test_get_price_matches_legacy_csv_scan(data_file, security, kwargs):
+    set_data_file(data_file)
+    expected = legacy_get_price(data_file, security, **kwargs)
+    assert len(expected)
+    pd.testing.assert_frame_equal(_normalize(get_price(security, **kwargs)), _normalize(expected))
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'start_date': '2015-02-01', 'end_date': '2015-03-01'},
+    {'count': 7, 'fields': ['Clsprc']},
+    {'end_date': '2015-02-20', 'fields': ['Clsprc', 'Trdsta'], 'skip_paused': True},
+])
+def test_chunked_get_price_matches_store(data_file, kwargs):
+    set_data_file(data_file)
+    # 同一日期的多只股票按传入顺序排列，与文件中的顺序无关
+    securities = ['000005', '000002', '000003']
+    expected = get_price(securities, **kwargs)
+    ranks = expected.index.get_level_values('Stkcd').map(securities.index).to_numpy()
+    dates = expected.index.get_level_values('Trddt')
+    same_day = dates[1:] == dates[:-1]
+    assert (ranks[1:] > ranks[:-1])[same_day].all()
+    pd.testing.assert_frame_equal(get_price(securities, chunksize=50, **kwargs), expected)
+
+
+def test_chunked_scan_pushes_filters_down(data_file):
+    set_data_file(data_file)
+    rows = len(load_price_store(data_file).codes)
+    frame = get_price('000002', start_date='2015-02-01', end_date='2015-03-01', fields=['Clsprc'], chunksize=500)
+    stats = frame.attrs['scan_stats']
+    assert stats.rows_scanned == rows and stats.chunks == -(-rows // 500)
+    assert stats.rows_kept == len(frame) == len(get_price('000002', start_date='2015-02-01', end_date='2015-03-01'))
+    assert list(frame.columns) == ['Clsprc']
+
+    for date in (pd.Timestamp('2015-01-05'), pd.Timestamp('2015-03-02')):
+        for only_normal in (False, True):
+            assert get_all_securities(date, chunksize=500, only_normal=only_normal) == \
+                get_all_securities(date, only_normal=only_normal)
+
+
+@pytest.mark.parametrize('backend', ['frame', 'panel'])
+def test_bar_series_indexing_convention(data_file, backend):
+    data_handler = DataHandler(data_file, backend=backend)
+    data = BarData(data_handler, lookback=10)
+    dates = data_handler.dates
+    closes = np.vstack([data_handler.get_day_values(date, 'close') for date in dates])
+    assert data.seek(dates[30])
+    close = data.Close
+
+    assert close[0].dtype == np.float64
+    np.testing.assert_array_equal(close[0], closes[30])
+    np.testing.assert_array_equal(close[-3], closes[27])
+    np.testing.assert_array_equal(close[-5:], closes[26:31])
+    np.testing.assert_array_equal(close[-5:-1], closes[26:30])
+    assert close['000001'] == closes[30, 0]
+    np.testing.assert_array_equal(close.history('000001', 4), closes[27:31, 0])
+    assert len(close) == 10
+    for key in (1, -10):  # 未来K线、超出 lookback
+        with pytest.raises(IndexError):
+            close[key]
+
+
+def test_panel_backend_matches_frame_backend(data_file):
+    frame = DataHandler(data_file)
+    panel = DataHandler(data_file, backend='panel')
+    assert panel.dates.equals(frame.dates) and panel.securities.equals(frame.securities)
+    for date in frame.dates[::7]:
+        for field in ('close', 'open', 'Dnshrtrd'):
+            np.testing.assert_allclose(panel.get_day_array(date, field), frame.get_day_array(date, field),
+                                       rtol=1e-6, equal_nan=True)
+        # 面板后端的单日收盘价覆盖全部股票，停牌为 NaN
+        closes = panel.get_single_day_data(date)
+        traded = frame.get_single_day_data(date)
+        np.testing.assert_allclose(closes.dropna(), traded.reindex(closes.dropna().index), rtol=1e-6)
+        assert closes.notna().sum() == len(traded)
+    assert panel.get_day_array(pd.Timestamp('2015-01-03'), 'close') is None  # 非交易日
+
+
+def test_panel_is_memory_mapped_from_the_cache(tmp_path):
+    path = str(tmp_path / 'daily.csv')
+    write_csmar_file(path, n_stocks=5, n_days=30)
+    store = load_price_store(path)
+    panel = store.get_panel()
+    assert store.get_panel() is panel
+    assert isinstance(panel.values, np.memmap)
+    assert [name for name in os.listdir(store.cache_dir) if name.startswith('panel-')]
+
+    # 另一个进程（重新加载的存储）直接映射已写好的面板文件
+    reopened = load_price_store(path).get_panel()
+    np.testing.assert_array_equal(reopened.values, panel.values)
+    assert reopened.values.dtype == np.float32
+
+
+def test_membership_bitmaps_match_the_rows(tmp_path):
+    path = str(tmp_path / 'daily.csv')
+    write_csmar_file(path, n_stocks=12, n_days=40)
+    rows = pd.read_csv(path, dtype={'Stkcd': str})
+    rows = rows[~((rows['Stkcd'] == '000003') & (rows['Trddt'] < '2015-01-20'))]  # 上市较晚
+    rows = rows[~((rows['Stkcd'] == '000004') & (rows['Trddt'] > '2015-02-10'))]  # 提前退市
+    rows.loc[rows.index[::7], 'Trdsta'] = 3  # 非正常交易
+    rows.to_csv(path, index=False)
+
+    membership = load_price_store(path, use_cache=False).get_membership()
+    codes = np.asarray(membership.securities).astype(str)
+    dates = pd.DatetimeIndex(membership.dates)
+    trddt = pd.to_datetime(rows['Trddt'])
+    for date in dates[::3]:
+        day = rows[trddt == date]
+        for normal_only, expected in ((False, day), (True, day[day['Trdsta'] == 1])):
+            assert list(membership.securities_on(date, normal_only).astype(str)) == sorted(expected['Stkcd'])
+            assert membership.count(date, normal_only) == len(expected)
+            np.testing.assert_array_equal(membership.mask(date, normal_only), np.isin(codes, expected['Stkcd']))
+
+    previous, current = dates[0], dates[1]
+    before = set(rows.loc[trddt == previous, 'Stkcd'])
+    after = set(rows.loc[trddt == current, 'Stkcd'])
+    assert set(membership.added(previous, current).astype(str)) == after - before
+    assert set(membership.removed(previous, current).astype(str)) == before - after
+    assert list(membership.new_listings(pd.Timestamp('2015-01-20')).astype(str)) == ['000003']
+    assert list(membership.delistings(pd.Timestamp('2015-02-10')).astype(str)) == ['000004']
+
+
+def _reference_bars(rows, frequency):
+    """用 pandas 分组聚合日线，作为周期K线的参照：K线日期为周期内（全市场）最后一个交易日"""
+    calendar = pd.Series(pd.to_datetime(rows['Trddt']).unique()).sort_values(ignore_index=True)
+    if frequency == 'weekly':
+        periods = calendar.dt.to_period('W-SUN')
+    elif frequency == 'monthly':
+        periods = calendar.dt.to_period('M')
+    else:
+        periods = pd.Series(calendar.index // int(frequency[:-1]))
+    bar_date = dict(zip(calendar, calendar.groupby(periods.to_numpy()).transform('max')))
+    rows = rows.assign(Trddt=pd.to_datetime(rows['Trddt']).map(bar_date))
+    bars = rows.groupby(['Stkcd', 'Trddt'], sort=True).agg(
+        Opnprc=('Opnprc', 'first'), Hiprc=('Hiprc', 'max'), Loprc=('Loprc', 'min'), Clsprc=('Clsprc', 'last'),
+        Dnshrtrd=('Dnshrtrd', 'sum'), Dretwd=('Dretwd', lambda r: (1 + r).prod() - 1))
+    return bars.reset_index()
+
+
+@pytest.mark.parametrize('frequency', ['weekly', 'monthly', '5d'])
+def test_resampled_bars_match_a_pandas_groupby(data_file, frequency):
+    rows = pd.read_csv(data_file, dtype={'Stkcd': str})
+    expected = _reference_bars(rows, frequency)
+    store = load_price_store(data_file, use_cache=False)
+    bars = store.resample(frequency).to_frame()
+    assert len(bars) == len(expected)
+    np.testing.assert_array_equal(bars['Stkcd'].astype(str), expected['Stkcd'])
+    np.testing.assert_array_equal(bars['Trddt'].astype('datetime64[ns]'), expected['Trddt'].astype('datetime64[ns]'))
+    for name in ('Opnprc', 'Hiprc', 'Loprc', 'Clsprc', 'Dnshrtrd', 'Dretwd'):
+        np.testing.assert_allclose(bars[name].astype(float), expected[name].astype(float), rtol=1e-9)
+
+    # 同一周期只构建一次；日线请求返回原存储
+    assert store.resample(frequency) is store.resample(frequency)
+    assert store.resample('daily') is store
+    with pytest.raises(ValueError):
+        store.resample('2w')
+
+
+def test_resampled_data_handler_and_get_price(data_file):
+    set_data_file(data_file)
+    data_handler = DataHandler(data_file)
+    weekly = data_handler.resample('weekly')
+    assert weekly is data_handler.resample('1w') and weekly.frequency == '1w'
+    assert weekly.resample('daily') is data_handler
+    # 周线日期为每周最后一个交易日
+    days = pd.Series(data_handler.dates)
+    last_days = days.groupby(days.dt.to_period('W-SUN').to_numpy()).max()
+    assert list(weekly.dates) == list(last_days)
+
+    frame = get_price('000001', frequency='weekly', fields=['Clsprc'])
+    daily = get_price('000001', fields=['Clsprc'])['Clsprc']
+    assert list(frame.index.get_level_values('Trddt')) == list(last_days)
+    np.testing.assert_allclose(frame['Clsprc'].to_numpy(), daily.loc[('000001', list(last_days))].to_numpy())
+    with pytest.raises(ValueError):
+        get_price('000001', frequency='weekly', chunksize=100)
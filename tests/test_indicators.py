@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Backtest_Engine import BacktestEngine
+from Data_Handling import DataHandler
+from Indicators import EMA, RSI, SMA, IndicatorCache, IndicatorSet, RollingMax, RollingMin
+from Strategy_Core import MACrossStrategy
+from Utilities import log
+
+
+@pytest.mark.parametrize('backend', ['frame', 'panel'])
+def test_warm_up_matches_cache_with_suspensions(data_file, backend):
+    data_handler = DataHandler(data_file, backend=backend)
+    store = data_handler.price_store
+    closes = store.field_matrix('Clsprc')
+    start = 60
+    # 回测首日之前最近 5 个交易日内有停牌的股票，其窗口需要向前多取
+    suspended = np.isnan(closes[start - 5:start]).any(axis=0)
+    assert suspended.any()
+
+    cache = IndicatorCache()
+    for make in (lambda: SMA(5), lambda: RollingMax(5), lambda: RollingMin(5), lambda: EMA(5)):
+        indicators = IndicatorSet(data_handler)
+        indicator = indicators.add('x', make())
+        indicators.warm_up(data_handler.dates, data_handler.dates[start])
+        expected = cache.get(make(), store)[start - 1]
+        np.testing.assert_allclose(indicator.value, expected, rtol=1e-12, equal_nan=True, err_msg=repr(indicator))
+
+        # 预热后逐日更新仍与缓存一致
+        for pos in range(start, start + 10):
+            indicators.update(data_handler.dates[pos])
+        np.testing.assert_allclose(indicator.value, cache.get(make(), store)[start + 9], rtol=1e-12,
+                                   equal_nan=True, err_msg=repr(indicator))
+
+
+def _traded_reference(closes, transform):
+    """对每只股票只在有行情的K线上计算参考值，停牌日沿用上一个值"""
+    frame = pd.DataFrame(closes)
+    return np.column_stack([transform(frame[col].dropna()).reindex(frame.index).ffill().to_numpy()
+                            for col in frame.columns])
+
+
+def _wilder_rsi(values, period):
+    """逐值计算的 Wilder RSI，作为参考实现"""
+    out = pd.Series(np.nan, index=values.index)
+    changes = values.diff().to_numpy()[1:]
+    for i in range(period, len(changes) + 1):
+        if i == period:
+            gain = np.maximum(changes[:period], 0).mean()
+            loss = np.maximum(-changes[:period], 0).mean()
+        else:
+            gain = (gain * (period - 1) + max(changes[i - 1], 0)) / period
+            loss = (loss * (period - 1) + max(-changes[i - 1], 0)) / period
+        out.iloc[i] = 100 - 100 / (1 + gain / loss) if loss > 0 else (100.0 if gain > 0 else 50.0)
+    return out
+
+
+@pytest.mark.parametrize('indicator, transform', [
+    (SMA(5), lambda s: s.rolling(5).mean()),
+    (EMA(5), lambda s: s.ewm(span=5, adjust=False, min_periods=5).mean()),
+    (RollingMax(5), lambda s: s.rolling(5).max()),
+    (RollingMin(5), lambda s: s.rolling(5).min()),
+    (RSI(6), lambda s: _wilder_rsi(s, 6)),
+], ids=['SMA', 'EMA', 'RollingMax', 'RollingMin', 'RSI'])
+def test_incremental_indicators_skip_suspended_bars(data_handler, indicator, transform):
+    closes = np.vstack([data_handler.get_day_values(date, 'close') for date in data_handler.dates])
+    assert np.isnan(closes).any()
+    expected = _traded_reference(closes, transform)
+    indicator.bind(data_handler.securities)
+    for row, values in enumerate(closes):
+        indicator.update(values)
+        np.testing.assert_allclose(indicator.value, expected[row], rtol=1e-9, equal_nan=True,
+                                   err_msg=f'{indicator!r} bar {row}')
+
+
+class RecordingMACross(MACrossStrategy):
+    """记录每个交易日开盘时看到的短期均线"""
+
+    def market_open(self, date):
+        self.context.setdefault('seen', []).append(self.g.fast_ma.get(self.g.security))
+
+
+def test_engine_updates_indicators_before_hooks(data_handler):
+    engine = BacktestEngine(data_handler, RecordingMACross, 100000, strategy_params={'security': '000001', 'fast': 5})
+    with log.silenced():
+        engine.run(show_results=False)
+    closes = pd.Series([data_handler.get_day_values(date, 'close')[0] for date in data_handler.dates])
+    np.testing.assert_allclose(engine.context['seen'], closes.rolling(5).mean(), rtol=1e-9, equal_nan=True)
@@ -0,0 +1,78 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Backtest_Engine import BacktestEngine
+from Data_Handling import DataHandler
+from Strategy_Core import MACrossStrategy
+from Utilities import log
+
+# 模块文件名含空格，按路径导入
+_spec = importlib.util.spec_from_file_location(
+    'parameter_optimization', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Parameter Optimization.py'))
+parameter_optimization = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(parameter_optimization)
+
+
+def test_grid_and_random_search_share_table_layout(data_file):
+    grid = parameter_optimization.grid_search(data_file, MACrossStrategy, {'fast': [3, 5], 'slow': [10, 20]},
+                                              n_jobs=1, sort_by='sharpe_ratio')
+    sampled = parameter_optimization.random_search(data_file, MACrossStrategy, {'fast': [3, 5], 'slow': [10, 20]},
+                                                   n_iter=4, n_jobs=1, sort_by='sharpe_ratio')
+    assert list(grid.columns) == list(sampled.columns)
+    assert list(grid.columns[:2]) == ['fast', 'slow']
+    assert grid['sharpe_ratio'].is_monotonic_decreasing
+
+    # 相同参数的绩效与参数组的来源无关
+    merged = sampled.merge(grid, on=['fast', 'slow'], suffixes=('', '_grid'))
+    assert (merged['final_assets'] == merged['final_assets_grid']).all()
+
+
+def test_walk_forward_windows_tile_the_test_period():
+    dates = pd.bdate_range('2020-01-01', periods=10)
+    windows = parameter_optimization.walk_forward_windows(dates, 4, 3)
+    assert [(test_start, test_end) for _, _, test_start, test_end in windows] == \
+        [(dates[4], dates[6]), (dates[7], dates[9])]
+    anchored = parameter_optimization.walk_forward_windows(dates, 4, 3, anchored=True)
+    assert [train_start for train_start, _, _, _ in anchored] == [dates[0], dates[0]]
+    for step_days in (0, 2):  # 步长为 0 或小于测试窗口（测试窗口重叠）
+        with pytest.raises(ValueError):
+            parameter_optimization.walk_forward_windows(dates, 4, 3, step_days)
+
+
+def test_walk_forward_stitches_out_of_sample_windows(data_file):
+    result = parameter_optimization.walk_forward(data_file, MACrossStrategy, {'fast': [3, 5], 'slow': [10]},
+                                                 train_days=40, test_days=20, n_jobs=1)
+    windows, equity = result['windows'], result['equity']
+    assert len(windows) == 4
+    assert len(result['in_sample']) == 4 * 2
+    # 样本外净值覆盖全部测试窗口且不重复，按各窗口收益率复利衔接
+    assert equity.index.is_unique and equity.index.is_monotonic_increasing
+    assert equity.index[0] == windows['test_start'].iloc[0] and equity.index[-1] == windows['test_end'].iloc[-1]
+    growth = np.prod(windows['final_assets'] / 100000)
+    assert np.isclose(equity.iloc[-1], 100000 * growth)
+    assert result['summary']['trade_count'] == windows['trade_count'].sum()
+
+
+def test_expand_grid_keeps_declaration_order():
+    assert parameter_optimization.expand_grid({'b': [1, 2], 'a': ['x', 'y']}) == [
+        {'b': 1, 'a': 'x'}, {'b': 1, 'a': 'y'}, {'b': 2, 'a': 'x'}, {'b': 2, 'a': 'y'}]
+
+
+def test_grid_search_is_independent_of_worker_count(data_file):
+    grid = {'security': ['000001', '000002', '000003'], 'fast': [3, 5], 'slow': [10]}
+    serial = parameter_optimization.grid_search(data_file, MACrossStrategy, grid, n_jobs=1)
+    parallel = parameter_optimization.grid_search(data_file, MACrossStrategy, grid, n_jobs=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+    # 与在当前进程中直接回测的结果一致
+    engine = BacktestEngine(DataHandler(data_file, backend='panel'), MACrossStrategy, 100000,
+                            strategy_params={'security': '000002', 'fast': 5, 'slow': 10})
+    with log.silenced():
+        engine.run(show_results=False)
+    row = serial[(serial['security'] == '000002') & (serial['fast'] == 5)].iloc[0]
+    assert np.isclose(row['final_assets'], engine.account.total_assets[-1])
+    assert row['trade_count'] == len(engine.account.trade_history)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Backtest_Engine import BacktestEngine, run_backtest_job
+from Performance_Analysis import EarlyStop, OnlineMetrics, batch_metrics, equity_matrix, realized_pnl
+from Strategy_Core import MACrossStrategy
+from Utilities import log
+
+
+def run_engine(data_handler, mode='event', **kwargs):
+    engine = BacktestEngine(data_handler, MACrossStrategy, 100000, mode=mode,
+                            strategy_params={'security': '000001', 'fast': 3, 'slow': 10}, **kwargs)
+    with log.silenced():
+        engine.run(show_results=False)
+    return engine
+
+
+@pytest.mark.parametrize('mode', ['event', 'vector'])
+def test_online_metrics_match_performance_analysis(data_handler, mode):
+    engine = run_engine(data_handler, mode)
+    metrics, summary = engine.account.metrics, engine.performance.get_summary()
+    assert metrics.count == len(engine.account.total_assets) == len(data_handler.dates)
+    for name in ('total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown', 'final_assets'):
+        assert metrics.get_summary()[name] == pytest.approx(summary[name], rel=1e-9, abs=1e-9)
+
+    # 换手率 = 累计成交金额（不含费用）/ 平均总资产
+    trades = engine.account.trade_history.to_frame()
+    assert len(trades) > 0
+    traded = (trades['price'] * trades['amount']).sum()
+    assert metrics.turnover == pytest.approx(traded / np.mean(engine.account.total_assets))
+    assert 0 <= metrics.exposure <= 1
+
+
+def test_online_metrics_extend_matches_update():
+    dates = pd.bdate_range('2015-01-05', periods=6)
+    totals = [100000, 101000, 99000, 99500, 102000, 98000]
+    one_by_one, batch = OnlineMetrics(100000), OnlineMetrics(100000)
+    for date, total in zip(dates, totals):
+        one_by_one.update(date, total)
+    batch.extend(dates, totals)
+    assert one_by_one.get_summary() == batch.get_summary()
+    returns = pd.Series(totals).pct_change().fillna(0)
+    assert batch.variance == pytest.approx(returns.var())
+    assert batch.max_drawdown == pytest.approx((98000 / 102000 - 1) * 100)
+    assert np.isnan(batch.exposure)
+
+
+def test_early_stop_halts_the_run(data_handler):
+    full = run_engine(data_handler)
+    worst = full.account.metrics.max_drawdown
+    assert worst < 0 and full.stopped_at is None
+
+    # 回撤阈值取完整回测最大回撤的一半：在首次跌破阈值的K线处终止，此前的结果与完整回测一致
+    stopped = run_engine(data_handler, early_stop=EarlyStop(max_drawdown=worst / 2))
+    bars = len(stopped.account.total_assets)
+    assert stopped.stopped_at == data_handler.dates[bars - 1] and bars < len(data_handler.dates)
+    assert stopped.account.total_assets == full.account.total_assets[:bars]
+    assert stopped.account.metrics.max_drawdown < worst / 2
+    wealth = pd.Series(full.account.total_assets[:bars - 1])
+    assert (wealth / wealth.cummax() - 1).min() * 100 >= worst / 2
+
+
+def test_early_stop_waits_for_min_bars():
+    metrics = OnlineMetrics(100000)
+    rule = EarlyStop(min_return=0, min_bars=3)
+    for i, total in enumerate([100000, 99000, 98000]):
+        metrics.update(pd.Timestamp('2015-01-05') + pd.Timedelta(days=i), total)
+        assert bool(rule(metrics)) == (i == 2)
+    assert EarlyStop(min_sharpe=10, min_bars=3)(metrics)
+    assert EarlyStop(max_drawdown=-5)(metrics) is None
+
+
+def test_batch_metrics_match_per_run_performance(data_handler):
+    results = [run_backtest_job({'strategy_class': MACrossStrategy, 'details': True,
+                                 'params': {'security': security, 'fast': fast, 'slow': 10}}, data_handler)
+               for security in ('000001', '000002') for fast in (3, 5)]
+    equity, dates = equity_matrix(result['equity'] for result in results)
+    assert equity.shape == (len(results), len(data_handler.dates)) and dates.equals(data_handler.dates)
+
+    trade_runs, trade_pnl = [], []
+    for run, result in enumerate(results):
+        trades = result['trades']
+        pnl = realized_pnl(trades['stock_code'], trades['action'], trades['amount'], trades['cost'],
+                           trades['revenue'])
+        trade_runs.extend([run] * len(pnl))
+        trade_pnl.extend(pnl)
+    table = batch_metrics(equity, dates, trade_runs=trade_runs, trade_pnl=trade_pnl)
+    for name in ('total_return', 'annualized_return', 'sharpe_ratio', 'max_drawdown', 'final_assets'):
+        np.testing.assert_allclose(table[name], [result[name] for result in results], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(table['closed_trades'], [result['sell_count'] for result in results])
+    assert table['win_rate'].between(0, 1).all()
+
+    # 分块大小不影响结果
+    pd.testing.assert_frame_equal(batch_metrics(equity, dates, trade_runs=trade_runs, trade_pnl=trade_pnl,
+                                                chunk_size=3), table)
+
+
+def test_batch_metrics_drawdown_and_padding():
+    dates = pd.bdate_range('2015-01-05', periods=6)
+    equity = np.array([[100, 110, 99, 104, 121, 120],
+                       [100, 90, 95, np.nan, np.nan, np.nan]], dtype=float)
+    table = batch_metrics(equity, dates, initial_cash=100)
+    assert table['max_drawdown'].tolist() == pytest.approx([-10, -10])
+    assert table['max_drawdown_duration'].tolist() == [2, 5]
+    # 提前终止后的 NaN 按最后的总资产填充
+    assert table.loc[1, 'final_assets'] == 95 and table.loc[1, 'total_return'] == pytest.approx(-5)
+    assert np.isnan(table['win_rate']).all() and (table['closed_trades'] == 0).all()
+    with pytest.raises(ValueError):
+        batch_metrics(equity, dates[:-1])
+
+
+def test_realized_pnl_uses_the_average_cost():
+    pnl = realized_pnl(['000001'] * 4, ['buy', 'buy', 'sell', 'sell'], [100, 100, 100, 100],
+                       [1000, 1200, 0, 0], [0, 0, 1300, 900])
+    assert np.isnan(pnl[:2]).all()
+    assert pnl[2:].tolist() == pytest.approx([200, -200])
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from Backtest_Engine import BacktestEngine
+from Strategy_Core import MA5Strategy
+from Utilities import log
+from trading_function import LimitOrderStyle, StopOrderStyle, TradingFunctions
+
+
+class StopRefillStrategy(MA5Strategy):
+    """
+    第 1 天买入 other；第 2 天挂出资金不足的止损市价买单（触发后部分成交），随后卖出 other，
+    收盘后账户重新有现金，第 3 天开盘挂单的剩余数量继续撮合
+    """
+
+    def __init__(self, context, security='000001', other='000002'):
+        super().__init__(context, security)
+        self.other = other
+        self.order = None
+        self.bar = 0
+
+    def initialize(self):
+        pass
+
+    def market_open(self, date):
+        trading = self.context['trading']
+        self.bar += 1
+        if self.bar == 1:
+            trading.order_value(self.other, 50000)
+        elif self.bar == 2:
+            self.order = trading.order(self.security, 10_000_000, style=StopOrderStyle(0.01))
+            trading.order_target(self.other, 0)
+
+
+def test_triggered_stop_market_order_fills_remainder_at_open(data_handler):
+    dates = data_handler.dates
+    closes = np.vstack([data_handler.get_day_values(date, 'close') for date in dates[:2]])
+    other = data_handler.securities[1:][~np.isnan(closes[:, 1:]).any(axis=0)][0]
+
+    engine = BacktestEngine(data_handler, StopRefillStrategy, 100000, strategy_params={'other': other})
+    with log.silenced():
+        engine.run(dates[0], dates[2], show_results=False)
+
+    order = engine.strategy.order
+    assert order.triggered
+    assert order.status == 'partial'  # 剩余数量仍超出可用资金，继续挂单
+    trades = [trade for trade in engine.trading.trades if trade['order_id'] == order.order_id]
+    assert [trade['date'] for trade in trades] == [dates[1], dates[2]]
+
+    # 触发后的剩余数量按市价单以开盘价成交
+    position = engine.account.security_index['000001']
+    assert np.isclose(trades[1]['price'], data_handler.get_day_values(dates[2], 'open')[position])
+
+
+class CancelStrategy(MA5Strategy):
+    """第 1 天提交两笔买单并撤销第一笔"""
+
+    def initialize(self):
+        self.orders = []
+
+    def market_open(self, date):
+        if self.orders:
+            return
+        trading = self.context['trading']
+        self.orders = [trading.order(self.security, 100), trading.order(self.security, 200)]
+        assert trading.cancel_order(self.orders[0])
+        assert not trading.cancel_order(self.orders[0])  # 已撤销的订单不能再撤
+
+
+def test_cancel_pending_order_before_close(data_handler):
+    engine = BacktestEngine(data_handler, CancelStrategy, 100000)
+    with log.silenced():
+        engine.run(data_handler.dates[0], data_handler.dates[1], show_results=False)
+
+    cancelled, kept = engine.strategy.orders
+    assert cancelled.status == 'cancelled'
+    assert kept.status == 'filled'
+    assert engine.account.positions['000001'] == 200
+    assert not engine.trading._pending
+
+
+def test_order_rejects_unknown_style():
+    trading = TradingFunctions({})
+    with pytest.raises(ValueError, match='无效的下单方式'):
+        trading.order('000001', 100, style='limit')
+    assert len(trading.orders) == 0
+    with log.silenced():
+        assert trading.order('000001', 100, style=LimitOrderStyle(10)) is not None
+
+
+class BatchStrategy(MA5Strategy):
+    """第 2 根K线开盘时一次提交多笔订单，记录提交后的状态"""
+
+    def initialize(self):
+        self.orders = {}
+        self.bar = 0
+
+    def market_open(self, date):
+        self.bar += 1
+        if self.bar != 2:
+            return
+        trading = self.context['trading']
+        self.orders['first'] = trading.order('000001', 100)
+        self.orders['target'] = trading.order_target('000001', 300)  # 扣除队列中的 100 股
+        self.orders['cancelled'] = trading.order('000001', 1000)
+        trading.cancel_order(self.orders['cancelled'])
+        self.orders['large'] = trading.order_value('000001', 10 ** 7)  # 超出剩余资金，部分成交
+        self.statuses = {name: order.status for name, order in self.orders.items()}
+        self.cash = self.context['account'].cash
+
+
+def test_orders_within_a_bar_fill_together_at_the_close(data_handler):
+    dates = data_handler.dates
+    engine = BacktestEngine(data_handler, BatchStrategy, 100000)
+    with log.silenced():
+        engine.run(dates[0], dates[2], show_results=False)
+    strategy = engine.strategy
+    orders = strategy.orders
+
+    # 提交时尚未成交，收盘时按提交顺序统一撮合
+    assert strategy.statuses == {'first': 'open', 'target': 'open', 'cancelled': 'cancelled', 'large': 'open'}
+    assert strategy.cash == 100000
+    assert orders['target'].amount == 200
+    assert [order.status for order in (orders['first'], orders['target'], orders['large'])] == \
+        ['filled', 'filled', 'partial']
+    close = data_handler.get_day_values(dates[1], 'close')[0]
+    trades = engine.trading.get_trades()
+    assert [trade['order_id'] for trade in trades] == [orders[name].order_id for name in ('first', 'target', 'large')]
+    assert all(trade['date'] == dates[1] and trade['price'] == close for trade in trades)
+    assert engine.account.positions['000001'] == 300 + orders['large'].filled_amount
+    assert engine.account.cash >= 0
@@ -0,0 +1,18 @@
+from Utilities import Log
+
+
+def test_to_file_closes_previous_file_sink(tmp_path):
+    log = Log()
+    first = log.to_file(str(tmp_path / 'first.log'), flush_interval=60)
+    log.info('first %s', 1)
+    second = log.to_file(str(tmp_path / 'second.log'), flush_interval=60)
+    log.info('second %s', 2)
+
+    # 切换文件时旧输出已写完缓冲并关闭，后台线程退出
+    assert first._file.closed
+    assert not first._thread.is_alive()
+    assert (tmp_path / 'first.log').read_text(encoding='utf-8').rstrip().endswith('first 1')
+
+    log.close()
+    assert second._file.closed
+    assert (tmp_path / 'second.log').read_text(encoding='utf-8').rstrip().endswith('second 2')
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from Backtest_Engine import BacktestEngine
+from Strategy_Core import MACrossStrategy
+from Utilities import log
+from Visualization import lttb, render_equity, render_heatmap, render_jobs
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    rng = np.random.default_rng(0)
+    values = np.cumsum(rng.normal(size=5000))
+    values[1234] += 100  # 孤立的尖峰必须保留
+    keep = lttb(values, 200)
+    assert len(keep) == 200 and keep[0] == 0 and keep[-1] == len(values) - 1
+    assert (np.diff(keep) > 0).all()
+    assert 1234 in keep
+    # 点数不多于 n_out、或 n_out 无效时原样保留
+    for n_out in (5000, 6000, None, 2):
+        np.testing.assert_array_equal(lttb(values, n_out), np.arange(len(values)))
+
+
+def test_render_equity_and_heatmap_without_a_display(tmp_path):
+    equity = pd.Series(100000 * np.cumprod(1 + np.linspace(-0.01, 0.01, 300)),
+                       index=pd.bdate_range('2015-01-05', periods=300))
+    png = render_equity(equity, str(tmp_path / 'plots' / 'equity.png'), max_points=50)
+    with open(png, 'rb') as f:
+        assert f.read(8) == PNG_HEADER
+    svg = render_equity(equity, str(tmp_path / 'equity.svg'), max_points=None)
+    assert '<svg' in (tmp_path / 'equity.svg').read_text(encoding='utf-8')[:500] and svg.endswith('.svg')
+
+    results = pd.DataFrame({'fast': [3, 3, 5, 5], 'slow': [10, 20, 10, 20], 'sharpe_ratio': [0.1, 0.5, -0.2, 0.3]})
+    path = render_heatmap(results, 'fast', 'slow', 'sharpe_ratio', str(tmp_path / 'heatmap.png'))
+    assert (tmp_path / 'heatmap.png').read_bytes()[:8] == PNG_HEADER and path.endswith('heatmap.png')
+
+
+def test_render_jobs_in_a_process_pool(tmp_path):
+    equity = pd.Series(np.linspace(100000, 110000, 100), index=pd.bdate_range('2015-01-05', periods=100))
+    jobs = [{'kind': 'equity', 'equity': equity, 'path': str(tmp_path / f'equity-{i}.png'), 'title': str(i)}
+            for i in range(3)]
+    assert render_jobs(jobs, n_jobs=2) == [job['path'] for job in jobs]
+    for job in jobs:
+        with open(job['path'], 'rb') as f:
+            assert f.read(8) == PNG_HEADER
+
+
+def test_engine_saves_the_plot(data_handler, tmp_path):
+    engine = BacktestEngine(data_handler, MACrossStrategy, 100000)
+    path = str(tmp_path / 'result.png')
+    with log.silenced():
+        engine.run(show_results=False, save_plot=path)
+    assert (tmp_path / 'result.png').read_bytes()[:8] == PNG_HEADER
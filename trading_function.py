@@ -3,8 +3,48 @@ import numpy as np
 from Utilities import log
 
 
+class MarketOrderStyle:
+    """市价单：以当前K线收盘价立即成交"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MarketOrderStyle()"
+
+
+class LimitOrderStyle:
+    """限价单：买入价格不高于、卖出价格不低于 limit_price 时成交，未成交时挂单至撤销"""
+    __slots__ = ('limit_price',)
+
+    def __init__(self, limit_price):
+        self.limit_price = float(limit_price)
+
+    def __repr__(self):
+        return f"LimitOrderStyle({self.limit_price})"
+
+
+class StopOrderStyle:
+    """
+    止损单：买入在价格涨到、卖出在价格跌到 stop_price 时触发
+    limit_price 为空时触发后按市价成交，否则触发后转为限价单
+    """
+    __slots__ = ('stop_price', 'limit_price')
+
+    def __init__(self, stop_price, limit_price=None):
+        self.stop_price = float(stop_price)
+        self.limit_price = None if limit_price is None else float(limit_price)
+
+    def __repr__(self):
+        return f"StopOrderStyle({self.stop_price}, {self.limit_price})"
+
+
+ORDER_STYLES = (MarketOrderStyle, LimitOrderStyle, StopOrderStyle)  # 支持的下单方式（另可传入 None 表示市价）
+OPEN_STATUSES = ('open', 'partial')  # 未完成（可撤销）的订单状态
+
+
 class Order:
     """订单类，用于记录订单信息"""
+    __slots__ = ('order_id', 'security', 'amount', 'original_amount', 'style', 'side', 'pindex', 'close_today',
+                 '_status', 'filled_amount', 'filled_price', 'create_time', 'fill_time', 'triggered', '_book')
     ORDER_ID = 0  # 类变量，用于生成唯一订单ID
 
     def __init__(self, security, amount, style=None, side='long', pindex=0, close_today=False):
@@ -13,38 +53,139 @@ class Order:
         self.security = security  # 股票代码
         self.amount = amount  # 数量（正数为买入，负数为卖出）
         self.original_amount = amount  # 原始委托数量
-        self.style = style  # 下单方式（如市价、限价等）
+        self.style = style  # 下单方式（None 或 MarketOrderStyle 为市价，另有 LimitOrderStyle、StopOrderStyle）
         self.side = side  # 多空方向
         self.pindex = pindex
         self.close_today = close_today
-        self.status = 'open'  # 订单状态：open, filled, cancelled, partial
+        self._book = None  # 所属订单簿，状态变化时同步索引
+        self._status = 'open'  # 订单状态：open, filled, cancelled, partial, failed
         self.filled_amount = 0  # 已成交数量
         self.filled_price = 0.0  # 成交均价
         self.create_time = pd.Timestamp.now()  # 创建时间
         self.fill_time = None  # 成交时间
+        self.triggered = False  # 止损单是否已触发
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        previous, self._status = self._status, status
+        if self._book is not None and previous != status:
+            self._book._reindex(self, previous)
+
+    @property
+    def is_market(self):
+        """是否为市价单"""
+        return self.style is None or isinstance(self.style, MarketOrderStyle)
+
+    @property
+    def remaining(self):
+        """未成交数量（正数）"""
+        return abs(self.amount) - self.filled_amount
 
     def __repr__(self):
         return (f"Order(id={self.order_id}, security={self.security}, amount={self.amount}, "
                 f"status={self.status}, filled={self.filled_amount})")
 
 
+class OrderBook:
+    """
+    订单簿：按订单ID、股票代码和状态建立索引，增删查与状态变更均为 O(1)
+    挂单（未完成的限价/止损单）单独索引，每根K线只需遍历挂单
+    """
+    def __init__(self):
+        self._orders = {}  # {订单ID: 订单}，按下单顺序
+        self._by_security = {}  # {股票代码: {订单ID: 订单}}
+        self._by_status = {}  # {状态: {订单ID: 订单}}
+        self._resting = {}  # {订单ID: 订单}，未完成的限价/止损单
+
+    def add(self, order):
+        order._book = self
+        self._orders[order.order_id] = order
+        self._by_security.setdefault(order.security, {})[order.order_id] = order
+        self._by_status.setdefault(order.status, {})[order.order_id] = order
+        if not order.is_market and order.status in OPEN_STATUSES:
+            self._resting[order.order_id] = order
+
+    def _reindex(self, order, previous):
+        """订单状态变化时更新状态索引（由 Order.status 调用）"""
+        self._by_status.get(previous, {}).pop(order.order_id, None)
+        self._by_status.setdefault(order.status, {})[order.order_id] = order
+        if order.status not in OPEN_STATUSES:
+            self._resting.pop(order.order_id, None)
+
+    def get(self, order_id):
+        return self._orders.get(order_id)
+
+    def __contains__(self, order):
+        return self._orders.get(getattr(order, 'order_id', None)) is order
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __iter__(self):
+        return iter(self._orders.values())
+
+    def open_orders(self):
+        """未完成订单，按下单顺序"""
+        orders = [order for status in OPEN_STATUSES for order in self._by_status.get(status, {}).values()]
+        return sorted(orders, key=lambda order: order.order_id)
+
+    def resting_orders(self):
+        """未完成的限价/止损单，按下单顺序"""
+        return list(self._resting.values())
+
+    def query(self, order_id=None, security=None, status=None):
+        """按条件查询订单，从最小的索引开始过滤"""
+        if order_id:
+            order = self._orders.get(order_id)
+            candidates = {} if order is None else {order_id: order}
+        elif security and status:
+            by_security = self._by_security.get(security, {})
+            by_status = self._by_status.get(status, {})
+            candidates = by_security if len(by_security) <= len(by_status) else by_status
+        elif security:
+            candidates = self._by_security.get(security, {})
+        elif status:
+            candidates = self._by_status.get(status, {})
+        else:
+            return list(self._orders.values())
+        result = [order for order in candidates.values()
+                  if (not security or order.security == security) and (not status or order.status == status)]
+        result.sort(key=lambda order: order.order_id)
+        return result
+
+
 class TradingFunctions:
+    """
+    下单接口
+    一根K线内提交的订单先进入队列，由回测引擎在收盘时调用 execute_pending 统一撮合：
+    当日价格只按交易日取一次全市场数组，订单按提交顺序依次使用现金，成交一次性写入账户
+    """
     def __init__(self, context):
         self.context = context
-        self.orders = []  # 所有订单列表
+        self.orders = OrderBook()  # 所有订单（按ID、股票、状态索引）
         self.trades = []  # 所有成交记录
+        self._pending = {}  # {订单ID: 订单}，本根K线提交、尚未撮合的订单（按提交顺序），撤单为 O(1)
+        self._pending_amounts = {}  # {股票代码: 队列中的净委托数量}，供目标下单扣除
+        self._day_cache = {}  # {字段: (日期, 当日全市场价格数组)}
 
     def order(self, security, amount, style=None, side='long', pindex=0, close_today=False):
         """
-        按股数下单
+        按股数下单，订单在当根K线收盘时撮合（状态在此之前为 open）
         :param security: 股票代码
         :param amount: 下单数量（正数为买入，负数为卖出）
-        :param style: 下单方式
+        :param style: 下单方式：None/MarketOrderStyle 以收盘价成交；
+                      LimitOrderStyle/StopOrderStyle 先按当日收盘价检查，未成交则挂单，之后每根K线按 OHLC 撮合
         :param side: 多空方向
         :param pindex: 价格指数
         :param close_today: 是否平今
         :return: 订单对象
         """
+        if style is not None and not isinstance(style, ORDER_STYLES):
+            raise ValueError(f"无效的下单方式: {style!r}，可选: None, MarketOrderStyle, LimitOrderStyle, StopOrderStyle")
         if amount == 0:
             log.warning("下单数量不能为0")
             return None
@@ -59,16 +200,15 @@ class TradingFunctions:
             close_today=close_today
         )
 
-        # 尝试立即成交（简化处理，实际回测中可能需要根据市场情况处理）
-        self._execute_order(order)
-
-        self.orders.append(order)
-        log.info(f"创建订单: {order}")
+        self.orders.add(order)
+        self._pending[order.order_id] = order
+        self._pending_amounts[security] = self._pending_amounts.get(security, 0) + amount
+        log.info("创建订单: %s", order)
         return order
 
     def order_target(self, security, amount, style=None, side='long', pindex=0, close_today=False):
         """
-        目标股数下单（计算与当前持仓的差额并下单）
+        目标股数下单（计算与当前持仓及本根K线已提交订单的差额并下单）
         :param security: 股票代码
         :param amount: 目标持仓数量
         :param style: 下单方式
@@ -78,10 +218,10 @@ class TradingFunctions:
         :return: 订单对象
         """
         account = self.context['account']
-        current_amount = account.positions.get(security, 0)
+        current_amount = account.positions.get(security, 0) + self._pending_amounts.get(security, 0)
         order_amount = amount - current_amount
         if order_amount == 0:
-            log.info(f"目标持仓已达，无需下单: {security}")
+            log.info("目标持仓已达，无需下单: %s", security)
             return None
         return self.order(security, order_amount, style, side, pindex, close_today)
 
@@ -100,22 +240,15 @@ class TradingFunctions:
             log.warning("下单金额不能为0")
             return None
 
-        # 获取当前价格
-        from Data_Handling import get_price
-        current_data = get_price(security, count=1, fields=['Clsprc'], end_date=self.context['current_dt'])
-        if len(current_data) == 0:
-            log.error(f"无法获取 {security} 价格数据，下单失败")
-            return None
-
-        current_price = current_data['Clsprc'].iloc[-1]
-        if current_price <= 0:
-            log.error(f"无效价格: {current_price}，下单失败")
+        # 获取当前价格（与撮合使用同一份当日价格）
+        current_price = self._current_price(security)
+        if current_price is None:
             return None
 
         # 计算股数（向下取整，确保金额不超过指定值）
         amount = int(abs(value) / current_price)
         if amount <= 0:
-            log.warning(f"计算出的下单数量为0: {security}")
+            log.warning("计算出的下单数量为0: %s", security)
             return None
 
         # 保持与价值相同的方向（正为买，负为卖）
@@ -133,20 +266,12 @@ class TradingFunctions:
         :param close_today: 是否平今
         :return: 订单对象
         """
-        # 获取当前价格
-        from Data_Handling import get_price
-        current_data = get_price(security, count=1, fields=['Clsprc'], end_date=self.context['current_dt'])
-        if len(current_data) == 0:
-            log.error(f"无法获取 {security} 价格数据，下单失败")
-            return None
-
-        current_price = current_data['Clsprc'].iloc[-1]
-        if current_price <= 0:
-            log.error(f"无效价格: {current_price}，下单失败")
+        current_price = self._current_price(security)
+        if current_price is None:
             return None
 
         # 计算目标股数
-        target_amount = int(abs(value) / current_price) if current_price != 0 else 0
+        target_amount = int(abs(value) / current_price)
         return self.order_target(security, target_amount, style, side, pindex, close_today)
 
     def cancel_order(self, order):
@@ -159,12 +284,14 @@ class TradingFunctions:
             log.error("订单不存在")
             return False
 
-        if order.status != 'open' and order.status != 'partial':
-            log.warning(f"订单 {order.order_id} 无法撤销，当前状态: {order.status}")
+        if order.status not in OPEN_STATUSES:
+            log.warning("订单 %s 无法撤销，当前状态: %s", order.order_id, order.status)
             return False
 
         order.status = 'cancelled'
-        log.info(f"订单已撤销: {order}")
+        if self._pending.pop(order.order_id, None) is not None:
+            self._pending_amounts[order.security] -= order.amount
+        log.info("订单已撤销: %s", order)
         return True
 
     def get_open_orders(self):
@@ -172,7 +299,7 @@ class TradingFunctions:
         获取未完成订单
         :return: 未完成订单列表
         """
-        return [order for order in self.orders if order.status in ['open', 'partial']]
+        return self.orders.open_orders()
 
     def get_orders(self, order_id=None, security=None, status=None):
         """
@@ -182,16 +309,7 @@ class TradingFunctions:
         :param status: 订单状态
         :return: 符合条件的订单列表
         """
-        result = self.orders
-
-        if order_id:
-            result = [order for order in result if order.order_id == order_id]
-        if security:
-            result = [order for order in result if order.security == security]
-        if status:
-            result = [order for order in result if order.status == status]
-
-        return result
+        return self.orders.query(order_id, security, status)
 
     def get_trades(self):
         """
@@ -200,92 +318,139 @@ class TradingFunctions:
         """
         return self.trades.copy()
 
-    def _execute_order(self, order):
+    def _day_prices(self, date, field='close'):
+        """当日全市场价格数组（顺序与 account.security_index 一致），同一交易日只读取一次"""
+        cached = self._day_cache.get(field)
+        if cached is None or cached[0] != date:
+            cached = (date, self.context['data_handler'].get_day_values(date, field))
+            self._day_cache[field] = cached
+        return cached[1]
+
+    def _lookup(self, securities, date, field='close'):
+        """按股票代码取当日价格，无行情（停牌、非交易日、未知代码）为 NaN"""
+        prices = self._day_prices(date, field)
+        index = self.context['account'].security_index
+        if prices is None or index is None:
+            return np.full(len(securities), np.nan)
+        positions = np.fromiter((index.get(str(security), -1) for security in securities), dtype=np.int64,
+                                count=len(securities))
+        return np.where(positions >= 0, prices[positions], np.nan)
+
+    def _current_price(self, security):
+        """当日收盘价，无法获取时记录错误并返回 None"""
+        current_price = self._lookup([security], self.context['current_dt'])[0]
+        if np.isnan(current_price):
+            log.error("无法获取 %s 价格数据，下单失败", security)
+            return None
+        if current_price <= 0:
+            log.error("无效价格: %s，下单失败", current_price)
+            return None
+        return float(current_price)
+
+    def execute_pending(self):
         """
-        执行订单（内部方法）
-        :param order: 订单对象
+        撮合本根K线提交的全部订单：市价单以当日收盘价成交；限价/止损单以收盘价检查，未成交的保持挂单
+        由回测引擎在收盘时调用
         """
-        account = self.context['account']
+        if not self._pending:
+            return
+        orders, self._pending = list(self._pending.values()), {}
+        self._pending_amounts.clear()
         date = self.context['current_dt']
+        closes = self._lookup([order.security for order in orders], date)
 
-        # 获取当前价格
-        from Data_Handling import get_price
-        current_data = get_price(order.security, count=1, fields=['Clsprc'], end_date=date)
-        if len(current_data) == 0:
-            order.status = 'failed'
-            log.error(f"订单执行失败，无法获取 {order.security} 价格数据")
+        executable, prices = [], []
+        for order, close in zip(orders, closes):
+            if np.isnan(close):
+                order.status = 'failed'
+                log.error("订单执行失败，无法获取 %s 价格数据", order.security)
+                continue
+            if not order.is_market:
+                # 下单时当日只有收盘价可用，视作开高低收均为收盘价的K线
+                close = self._match_price(order, close, close, close)
+                if close is None:
+                    continue
+            executable.append(order)
+            prices.append(close)
+        self._execute_batch(executable, prices, date)
+
+    def match_orders(self, date):
+        """
+        用当日 OHLC 撮合挂单（未完成的限价/止损单），按下单顺序依次成交
+        由回测引擎在每个交易日调用策略钩子之前执行；停牌（当日无行情）的股票不撮合
+        """
+        resting = self.orders.resting_orders()
+        if not resting:
             return
+        securities = [order.security for order in resting]
+        bars = zip(self._lookup(securities, date, 'open'), self._lookup(securities, date, 'high'),
+                   self._lookup(securities, date, 'low'))
+        executable, prices = [], []
+        for order, bar in zip(resting, bars):
+            if np.isnan(bar[0]):
+                continue
+            price = self._match_price(order, *bar)
+            if price is not None:
+                executable.append(order)
+                prices.append(price)
+        self._execute_batch(executable, prices, date)
+
+    @staticmethod
+    def _match_price(order, open_price, high, low):
+        """
+        根据K线判断挂单能否成交，返回成交价（不能成交时为 None）
+        跳空越过委托价时以开盘价成交，否则以委托价成交
+        """
+        style = order.style
+        buy = order.amount > 0
+        if isinstance(style, StopOrderStyle) and not order.triggered:
+            stop = style.stop_price
+            if buy and high >= stop:
+                trigger_price = max(open_price, stop)
+            elif not buy and low <= stop:
+                trigger_price = min(open_price, stop)
+            else:
+                return None
+            order.triggered = True
+            if style.limit_price is None:
+                return trigger_price
+            # 止损限价单：触发价满足限价时立即成交，否则之后按限价单撮合
+            if (buy and trigger_price <= style.limit_price) or (not buy and trigger_price >= style.limit_price):
+                return trigger_price
+            return None
 
-        current_price = current_data['Clsprc'].iloc[-1]
-
-        # 处理买入订单
-        if order.amount > 0:
-            # 计算可买入数量（考虑手续费）
-            max_possible = self._calculate_max_buy_amount(account.cash, current_price)
-            if max_possible <= 0:
+        limit = style.limit_price
+        if limit is None:
+            # 已触发的止损市价单（资金不足部分成交后继续挂单）：剩余数量按市价单以开盘价成交
+            return open_price
+        if buy:
+            if open_price <= limit:
+                return open_price
+            return limit if low <= limit else None
+        if open_price >= limit:
+            return open_price
+        return limit if high >= limit else None
+
+    def _execute_batch(self, orders, prices, date):
+        """按顺序批量成交订单的剩余数量，并更新订单状态与成交记录"""
+        if not orders:
+            return
+        amounts = [order.remaining if order.amount > 0 else -order.remaining for order in orders]
+        fills, fill_prices = self.context['account'].execute_orders(date, [order.security for order in orders],
+                                                                    amounts, np.asarray(prices, dtype=float))
+        for order, price, fill_amount in zip(orders, fill_prices.tolist(), fills.tolist()):
+            if fill_amount <= 0:
                 order.status = 'failed'
-                log.error("买入失败，现金不足或计算出错")
-                return
-
-            # 实际成交数量（不超过委托数量）
-            fill_amount = min(order.amount, max_possible)
-
-            # 执行买入
-            success = account.buy(date, order.security, current_price, fill_amount)
-            if success:
-                self._record_trade(order, fill_amount, current_price, date)
-                order.filled_amount = fill_amount
-                order.filled_price = current_price
-                order.fill_time = date
-                order.status = 'filled' if fill_amount == order.amount else 'partial'
-
-        # 处理卖出订单
-        elif order.amount < 0:
-            # 需要卖出的数量（取绝对值）
-            sell_amount = abs(order.amount)
-            current_holdings = account.positions.get(order.security, 0)
-
-            if current_holdings < sell_amount:
-                fill_amount = current_holdings
-                if fill_amount <= 0:
-                    order.status = 'failed'
-                    log.error("卖出失败，无持仓")
-                    return
-            else:
-                fill_amount = sell_amount
-
-            # 执行卖出
-            success = account.sell(date, order.security, current_price, fill_amount)
-            if success:
-                self._record_trade(order, -fill_amount, current_price, date)  # 用负数表示卖出
-                order.filled_amount = fill_amount
-                order.filled_price = current_price
-                order.fill_time = date
-                order.status = 'filled' if fill_amount == sell_amount else 'partial'
-
-    def _calculate_max_buy_amount(self, cash, price):
-        """计算最大可买入数量（考虑手续费）"""
-        if price <= 0 or cash <= 0:
-            return 0
-
-        # 估算手续费（买入佣金万分之三，最低5元）
-        max_amount = int(cash / price)
-        if max_amount == 0:
-            return 0
-
-        # 计算总成本（含手续费）
-        cost = price * max_amount
-        commission = max(0.0003 * cost, 5)
-        total_cost = cost + commission
-
-        # 确保总成本不超过可用现金
-        while total_cost > cash and max_amount > 0:
-            max_amount -= 1
-            cost = price * max_amount
-            commission = max(0.0003 * cost, 5)
-            total_cost = cost + commission
-
-        return max_amount
+                log.error("买入失败，现金不足或计算出错" if order.amount > 0 else "卖出失败，无持仓")
+                continue
+            self._record_trade(order, fill_amount if order.amount > 0 else -fill_amount, price, date)
+
+            # 累计成交数量与成交均价
+            filled = order.filled_amount + fill_amount
+            order.filled_price = (order.filled_price * order.filled_amount + price * fill_amount) / filled
+            order.filled_amount = filled
+            order.fill_time = date
+            order.status = 'filled' if filled == abs(order.amount) else 'partial'
 
     def _record_trade(self, order, fill_amount, fill_price, date):
         """记录成交信息"""
@@ -299,4 +464,4 @@ class TradingFunctions:
             'side': 'buy' if fill_amount > 0 else 'sell'
         }
         self.trades.append(trade)
-        log.info(f"成交记录: {trade}")
\ No newline at end of file
+        log.info("成交记录: %s", trade)
\ No newline at end of file